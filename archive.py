@@ -0,0 +1,352 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from fileio import atomic_write_bytes, dump_json_bytes, fsync_dir
+
+# ----------------------------
+# Format
+# ----------------------------
+# One append-only pack per year, <root>/<year>.pack, holding raw upstream
+# finalsummary.json bodies. Each record is a fixed header followed by the
+# zlib-compressed body:
+#
+#   magic b"BFA1" | date b"YYYY-MM-DD" | flags u8 | length u32 (LE)
+#
+# A later record for the same date supersedes earlier ones. <year>.idx is a
+# JSON cache {"size": <pack bytes covered>, "dates": {date: [offset,
+# length, flags]}}; if it is missing or behind the pack, the uncovered tail
+# of the pack is scanned and the index rebuilt. Reads go through mmap.
+
+MAGIC = b"BFA1"
+HEADER = struct.Struct("<4s10sBI")
+FLAG_SETTLED = 1
+COMPRESS_LEVEL = 6
+
+UPSTREAM_FILE_RES = (
+    re.compile(r"(?P<year>\d{4})[/\\](?P<md>\d{2}-\d{2})_finalsummary\.json$"),
+    re.compile(r"(?P<code>\d{8})[/\\]finalsummary\.json$"),
+)
+
+
+class YearArchive:
+    def __init__(self, root: str, year: int) -> None:
+        self.year = year
+        self.pack_path = os.path.join(root, f"{year}.pack")
+        self.idx_path = os.path.join(root, f"{year}.idx")
+        self.index: Dict[str, List[int]] = {}
+        self.size = 0
+        self._mm: Optional[mmap.mmap] = None
+        self._fh = None
+        self._writer = None
+        self._dirty = False
+        self._load_index()
+
+    # -- index --------------------------------------------------------
+    def _load_index(self) -> None:
+        pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+
+        try:
+            with open(self.idx_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.index = {d: list(v) for d, v in (data.get("dates") or {}).items()}
+            self.size = int(data.get("size", 0))
+        except (OSError, ValueError):
+            self.index, self.size = {}, 0
+
+        if self.size > pack_size:
+            self.index, self.size = {}, 0
+
+        if self.size < pack_size:
+            for date_str, offset, length, flags in self._scan(self.size):
+                self.index[date_str] = [offset, length, flags]
+                self.size = offset + length
+            self._dirty = True
+
+    def _scan(self, start: int) -> Iterator[Tuple[str, int, int, int]]:
+        with open(self.pack_path, "rb") as f:
+            f.seek(start)
+            pos = start
+            while True:
+                head = f.read(HEADER.size)
+                if len(head) < HEADER.size:
+                    return
+                magic, date_b, flags, length = HEADER.unpack(head)
+                if magic != MAGIC:
+                    return
+                data_at = pos + HEADER.size
+                f.seek(length, os.SEEK_CUR)
+                if f.tell() > os.fstat(f.fileno()).st_size:
+                    return
+                yield date_b.decode("ascii"), data_at, length, flags
+                pos = data_at + length
+
+    # -- reads --------------------------------------------------------
+    def _view(self, end: int) -> Optional[mmap.mmap]:
+        if self._mm is not None and end <= len(self._mm):
+            return self._mm
+        if self._mm is not None:
+            self._mm.close()
+            self._fh.close()
+            self._mm = None
+        if self._writer is not None:
+            self._writer.flush()
+        if not os.path.exists(self.pack_path) or os.path.getsize(self.pack_path) < end:
+            return None
+        self._fh = open(self.pack_path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def get(self, date_str: str) -> Optional[bytes]:
+        entry = self.index.get(date_str)
+        if not entry:
+            return None
+        offset, length, _ = entry
+        mm = self._view(offset + length)
+        if mm is None:
+            return None
+        return zlib.decompress(mm[offset:offset + length])
+
+    def is_settled(self, date_str: str) -> bool:
+        entry = self.index.get(date_str)
+        return bool(entry and entry[2] & FLAG_SETTLED)
+
+    # -- writes -------------------------------------------------------
+    def put(self, date_str: str, body: bytes, settled: bool) -> None:
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.pack_path) or ".", exist_ok=True)
+            self._writer = open(self.pack_path, "ab")
+            # Drop a torn record left by an interrupted append.
+            if self._writer.tell() != self.size:
+                self._writer.truncate(self.size)
+                self._writer.seek(self.size)
+
+        blob = zlib.compress(body, COMPRESS_LEVEL)
+        flags = FLAG_SETTLED if settled else 0
+        self._writer.write(HEADER.pack(MAGIC, date_str.encode("ascii"), flags, len(blob)))
+        self._writer.write(blob)
+
+        self.index[date_str] = [self.size + HEADER.size, len(blob), flags]
+        self.size += HEADER.size + len(blob)
+        self._dirty = True
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            self._writer.close()
+            self._writer = None
+            fsync_dir(os.path.dirname(self.pack_path) or ".")
+
+        if self._dirty:
+            atomic_write_bytes(
+                self.idx_path,
+                dump_json_bytes({"size": self.size, "dates": dict(sorted(self.index.items()))}),
+            )
+            self._dirty = False
+
+        if self._mm is not None:
+            self._mm.close()
+            self._fh.close()
+            self._mm = None
+
+
+class Archive:
+    """
+    Offline copy of upstream daily payloads, one YearArchive per year.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._years: Dict[int, YearArchive] = {}
+
+    def year(self, year: int) -> YearArchive:
+        if year not in self._years:
+            self._years[year] = YearArchive(self.root, year)
+        return self._years[year]
+
+    def years(self) -> List[int]:
+        found = set(self._years)
+        if os.path.isdir(self.root):
+            for fn in os.listdir(self.root):
+                if fn.endswith(".pack") and fn[:-5].isdigit():
+                    found.add(int(fn[:-5]))
+        return sorted(found)
+
+    def get_text(self, date_str: str, settled_only: bool = False) -> Optional[str]:
+        ya = self.year(int(date_str[:4]))
+        if settled_only and not ya.is_settled(date_str):
+            return None
+        body = ya.get(date_str)
+        return body.decode("utf-8") if body is not None else None
+
+    def wants(self, date_str: str, settled: bool) -> bool:
+        # Until a date is settled any newer copy replaces it, settled or not;
+        # the superseded records stay in the pack until `compact`.
+        ya = self.year(int(date_str[:4]))
+        if date_str not in ya.index:
+            return True
+        return not ya.is_settled(date_str)
+
+    def put_text(self, date_str: str, text: str, settled: bool) -> None:
+        if self.wants(date_str, settled):
+            self.year(int(date_str[:4])).put(date_str, text.encode("utf-8"), settled)
+
+    def close(self) -> None:
+        for ya in self._years.values():
+            ya.close()
+
+
+# ----------------------------
+# Commands
+# ----------------------------
+def export_year(archive: Archive, year: int, out_dir: str) -> int:
+    """
+    Write the latest payload of every archived date as
+    <out>/<year>/<MM-DD>_finalsummary.json, the upstream yearly layout.
+    """
+    ya = archive.year(year)
+    count = 0
+    for date_str in sorted(ya.index):
+        body = ya.get(date_str)
+        if body is None:
+            continue
+        path = os.path.join(out_dir, str(year), f"{date_str[5:]}_finalsummary.json")
+        atomic_write_bytes(path, body)
+        count += 1
+    return count
+
+
+def iter_upstream_files(src: str) -> Iterator[Tuple[str, str]]:
+    for dirpath, _, files in os.walk(src):
+        for fn in files:
+            path = os.path.join(dirpath, fn)
+            for rx in UPSTREAM_FILE_RES:
+                m = rx.search(path)
+                if not m:
+                    continue
+                if "code" in m.groupdict() and m.group("code"):
+                    code = m.group("code")
+                    yield f"{code[:4]}-{code[4:6]}-{code[6:]}", path
+                else:
+                    yield f"{m.group('year')}-{m.group('md')}", path
+                break
+
+
+def import_source(archive: Archive, src: str, settled: bool) -> int:
+    """
+    Add payloads to the archive from another archive's .pack file or from a
+    directory of upstream-layout finalsummary.json files.
+    """
+    count = 0
+
+    if src.endswith(".pack"):
+        # Same naming rule as Archive.years(): only <year>.pack is a pack.
+        name = os.path.basename(src)[:-5]
+        if not name.isdigit():
+            return 0
+        other = YearArchive(os.path.dirname(src) or ".", int(name))
+        for date_str in sorted(other.index):
+            body = other.get(date_str)
+            if body is not None and archive.wants(date_str, other.is_settled(date_str)):
+                archive.year(other.year).put(date_str, body, other.is_settled(date_str))
+                count += 1
+        other.close()
+        return count
+
+    for date_str, path in sorted(iter_upstream_files(src)):
+        with open(path, "rb") as f:
+            body = f.read()
+        try:
+            json.loads(body)
+        except ValueError:
+            continue
+        if archive.wants(date_str, settled):
+            archive.year(int(date_str[:4])).put(date_str, body, settled)
+            count += 1
+
+    return count
+
+
+def compact_year(archive: Archive, year: int) -> Tuple[int, int]:
+    """
+    Rewrite a pack keeping only the latest record per date.
+    """
+    ya = archive.year(year)
+    before = ya.size
+    if not ya.index:
+        return before, before
+
+    records = [(d, ya.get(d), ya.is_settled(d)) for d in sorted(ya.index)]
+    ya.close()
+
+    tmp_root = os.path.join(archive.root, f".compact-{year}")
+    try:
+        fresh = YearArchive(tmp_root, year)
+        for date_str, body, settled in records:
+            if body is not None:
+                fresh.put(date_str, body, settled)
+        fresh.close()
+
+        os.replace(fresh.pack_path, ya.pack_path)
+        os.replace(fresh.idx_path, ya.idx_path)
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+    archive._years.pop(year, None)
+    return before, archive.year(year).size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the packed offline archive of upstream daily payloads.")
+    parser.add_argument("--archive-dir", type=str, default="archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Unpack archived payloads into upstream-layout JSON files.")
+    p_export.add_argument("--year", type=int, action="append", help="Year to export (repeatable; default all).")
+    p_export.add_argument("--out", type=str, required=True)
+
+    p_import = sub.add_parser("import", help="Add payloads from a .pack file or a directory of finalsummary.json files.")
+    p_import.add_argument("src", nargs="+")
+    p_import.add_argument(
+        "--unsettled",
+        action="store_true",
+        help="Mark imported JSON files as not final, so a later live fetch replaces them.",
+    )
+
+    p_compact = sub.add_parser("compact", help="Drop superseded records from packs.")
+    p_compact.add_argument("--year", type=int, action="append")
+
+    sub.add_parser("list", help="Show archived day counts per year.")
+
+    args = parser.parse_args()
+    archive = Archive(args.archive_dir)
+
+    try:
+        if args.command == "export":
+            for year in args.year or archive.years():
+                print(f"{year}: exported {export_year(archive, year, args.out)} days")
+        elif args.command == "import":
+            for src in args.src:
+                print(f"{src}: imported {import_source(archive, src, settled=not args.unsettled)} days")
+        elif args.command == "compact":
+            for year in args.year or archive.years():
+                before, after = compact_year(archive, year)
+                print(f"{year}: {before} -> {after} bytes")
+        else:
+            for year in archive.years():
+                ya = archive.year(year)
+                settled = sum(1 for d in ya.index if ya.is_settled(d))
+                print(f"{year}: {len(ya.index)} days ({settled} settled), {ya.size} bytes")
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
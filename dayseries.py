@@ -0,0 +1,147 @@
+import datetime as dt
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# ----------------------------
+# Day numbers
+# ----------------------------
+# Daily series are indexed by epoch day (days since 1970-01-01), so date
+# arithmetic is integer arithmetic and series from different years line up.
+# "YYYYMMDD" strings, the on-disk key format, are produced only when a
+# series is serialized.
+
+EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+
+def epoch_day(date_str: str) -> int:
+    """
+    Epoch day of a "YYYY-MM-DD" or "YYYYMMDD" string.
+    """
+    if len(date_str) == 8:
+        y, m, d = int(date_str[:4]), int(date_str[4:6]), int(date_str[6:8])
+    else:
+        y, m, d = int(date_str[:4]), int(date_str[5:7]), int(date_str[8:10])
+    return dt.date(y, m, d).toordinal() - EPOCH_ORDINAL
+
+
+def day_date(day: int) -> dt.date:
+    return dt.date.fromordinal(day + EPOCH_ORDINAL)
+
+
+@lru_cache(maxsize=None)
+def day_key(day: int) -> str:
+    d = day_date(day)
+    return f"{d.year:04d}{d.month:02d}{d.day:02d}"
+
+
+def day_code(day: int) -> int:
+    return int(day_key(day))
+
+
+# ----------------------------
+# Dense series
+# ----------------------------
+class DaySeries:
+    """
+    Per-day values stored in a list covering the first to the last day
+    that has a value; days in between without one hold None. Iteration
+    is always in date order, so nothing needs sorting. Serializes (via
+    to_json, see fileio.dump_json_bytes) to the {"YYYYMMDD": value} dict
+    used in the output files.
+    """
+
+    __slots__ = ("start", "cells")
+
+    def __init__(self) -> None:
+        self.start = 0
+        self.cells: List[Any] = []
+
+    def _index(self, day: int) -> int:
+        cells = self.cells
+        if not cells:
+            self.start = day
+            cells.append(None)
+            return 0
+
+        i = day - self.start
+        if i < 0:
+            cells[:0] = [None] * -i
+            self.start = day
+            return 0
+        if i >= len(cells):
+            cells.extend([None] * (i + 1 - len(cells)))
+        return i
+
+    def get(self, day: int, default: Any = None) -> Any:
+        i = day - self.start
+        if 0 <= i < len(self.cells):
+            v = self.cells[i]
+            if v is not None:
+                return v
+        return default
+
+    def set(self, day: int, value: Any) -> None:
+        self.cells[self._index(day)] = value
+
+    def slot(self, day: int, factory: Callable[[], Any]) -> Any:
+        """
+        The value for `day`, created with `factory()` if it has none yet.
+        """
+        i = self._index(day)
+        v = self.cells[i]
+        if v is None:
+            v = self.cells[i] = factory()
+        return v
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        start = self.start
+        for i, v in enumerate(self.cells):
+            if v is not None:
+                yield start + i, v
+
+    def days(self) -> List[int]:
+        return [day for day, _ in self.items()]
+
+    def values(self) -> Iterator[Any]:
+        return (v for v in self.cells if v is not None)
+
+    def first(self) -> Optional[int]:
+        # The end cells always hold values: cells are only added by set().
+        return self.start if self.cells else None
+
+    def last(self) -> Optional[int]:
+        return self.start + len(self.cells) - 1 if self.cells else None
+
+    def __len__(self) -> int:
+        return len(self.cells) - self.cells.count(None)
+
+    def __bool__(self) -> bool:
+        return bool(self.cells)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {day_key(day): v for day, v in self.items()}
+
+    @classmethod
+    def from_dict(
+        cls,
+        data: Any,
+        convert: Optional[Callable[[Any], Any]] = None,
+    ) -> "DaySeries":
+        """
+        Build a series from a {"YYYYMMDD": value} dict (the file format).
+        Keys that are not dates are dropped.
+        """
+        if isinstance(data, DaySeries):
+            return data
+
+        series = cls()
+        if not isinstance(data, dict):
+            return series
+
+        for key, value in data.items():
+            try:
+                day = epoch_day(str(key))
+            except ValueError:
+                continue
+            series.set(day, convert(value) if convert else value)
+        return series
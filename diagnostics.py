@@ -0,0 +1,341 @@
+import asyncio
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import signal
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fileio import atomic_write_bytes, set_inline_workers
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ----------------------------
+# Tunables
+# ----------------------------
+# Tracing cost grows quickly with depth (16 frames is ~10x slower than 4 on
+# a full-year run); 4 is enough to reach the repo frame above json/aiohttp.
+DEFAULT_TRACE_FRAMES = 4
+DEFAULT_TOP_SITES = 10
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_SLOW_CALLBACK = 0.1
+DEFAULT_PROFILE_TOP = 15
+
+MB = 1024 * 1024
+
+# Frames inside this directory count as "our" call sites; allocations made
+# deep inside json/aiohttp are charged to the repo line that called them.
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    pass
+
+
+# ----------------------------
+# Stages
+# ----------------------------
+class StageMonitor:
+    """
+    Named run stages (fetch, aggregate, finalize, save, ...). Hooks get
+    enter(name)/exit(name) around every `with monitor.stage(name):`
+    block; a stage entered several times (once per year or per chunk)
+    accumulates into one entry. With no hooks a stage costs nothing.
+    """
+
+    def __init__(self) -> None:
+        self.hooks: List[Any] = []
+
+    def add(self, hook: Any) -> None:
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not self.hooks:
+            yield
+            return
+
+        for hook in self.hooks:
+            hook.enter(name)
+        try:
+            yield
+        finally:
+            for hook in reversed(self.hooks):
+                hook.exit(name)
+
+
+# ----------------------------
+# Memory accounting
+# ----------------------------
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _site(tb: tracemalloc.Traceback) -> str:
+    # Traceback frames run oldest to most recent.
+    for frame in reversed(tb):
+        if frame.filename.startswith(PROJECT_DIR):
+            return f"{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno}"
+    return f"{tb[0].filename}:{tb[0].lineno}"
+
+
+def top_sites(snapshot: tracemalloc.Snapshot, limit: int) -> List[Tuple[str, int, int]]:
+    """
+    Live allocations grouped by the innermost frame in this repo:
+    [(file:line, bytes, blocks)], largest first.
+    """
+    sites: Dict[str, List[int]] = {}
+    for stat in snapshot.statistics("traceback"):
+        acc = sites.setdefault(_site(stat.traceback), [0, 0])
+        acc[0] += stat.size
+        acc[1] += stat.count
+
+    ranked = sorted(sites.items(), key=lambda kv: kv[1][0], reverse=True)
+    return [(site, size, count) for site, (size, count) in ranked[:limit]]
+
+
+class MemoryReport:
+    """
+    Stage hook recording, per stage: the tracemalloc peak while the stage
+    ran, live traced memory and RSS at its end, and the call sites holding
+    the most memory at the boundary where it was highest. With a budget,
+    the run fails at the first stage boundary whose peak exceeds it.
+
+    trace=False records RSS only, so a budget can be enforced without
+    tracemalloc's overhead.
+    """
+
+    def __init__(
+        self,
+        budget_mb: Optional[float] = None,
+        trace: bool = True,
+        frames: int = DEFAULT_TRACE_FRAMES,
+        top: int = DEFAULT_TOP_SITES,
+    ) -> None:
+        self.budget = int(budget_mb * MB) if budget_mb else None
+        self.trace = trace
+        self.frames = frames
+        self.top = top
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.order: List[str] = []
+
+    def start(self) -> None:
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def enter(self, name: str) -> None:
+        self.start()
+        if self.trace:
+            tracemalloc.reset_peak()
+        if name not in self.stages:
+            self.order.append(name)
+            self.stages[name] = {
+                "runs": 0,
+                "seconds": 0.0,
+                "traced_peak": 0,
+                "traced_end": 0,
+                "rss_end": None,
+                "rss_peak": None,
+                "sites": [],
+            }
+        self.stages[name]["_t0"] = time.perf_counter()
+
+    def exit(self, name: str) -> None:
+        current, peak = tracemalloc.get_traced_memory() if self.trace else (0, 0)
+        st = self.stages[name]
+        st["runs"] += 1
+        st["seconds"] += time.perf_counter() - st.pop("_t0")
+        st["traced_peak"] = max(st["traced_peak"], peak)
+        st["rss_end"] = rss_bytes()
+        st["rss_peak"] = peak_rss_bytes()
+
+        if self.trace and current >= st["traced_end"]:
+            st["traced_end"] = current
+            st["sites"] = top_sites(tracemalloc.take_snapshot(), self.top)
+
+        if self.budget is not None:
+            used = st["rss_peak"] if st["rss_peak"] is not None else peak
+            if used > self.budget:
+                raise MemoryBudgetExceeded(
+                    f"memory budget exceeded in stage {name}: "
+                    f"{used / MB:.1f} MB > {self.budget / MB:.1f} MB"
+                )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "stages": {
+                name: {k: v for k, v in self.stages[name].items() if not k.startswith("_")}
+                for name in self.order
+            },
+        }
+
+    def format(self) -> str:
+        def mb(v: Optional[int]) -> str:
+            return "-" if v is None else f"{v / MB:.1f}"
+
+        lines = [f"{'stage':<12}{'runs':>6}{'secs':>9}{'py peak MB':>12}{'py end MB':>11}{'rss MB':>9}{'rss peak MB':>13}"]
+        for name in self.order:
+            st = self.stages[name]
+            lines.append(
+                f"{name:<12}{st['runs']:>6}{st['seconds']:>9.1f}{mb(st['traced_peak']):>12}"
+                f"{mb(st['traced_end']):>11}{mb(st['rss_end']):>9}{mb(st['rss_peak']):>13}"
+            )
+        for name in self.order:
+            lines.append("")
+            lines.append(f"{name}: top call sites at its largest boundary")
+            for site, size, count in self.stages[name]["sites"]:
+                lines.append(f"  {size / MB:9.1f} MB {count:>10} blocks  {site}")
+        return "\n".join(lines)
+
+    def emit(self, path: Optional[str]) -> None:
+        """
+        Print the report; `path` other than None/"-" also gets the JSON.
+        """
+        print(self.format())
+        if path and path != "-":
+            self.write(path)
+
+    def write(self, path: str) -> None:
+        atomic_write_bytes(path, json.dumps(self.as_dict(), indent=2).encode("utf-8"))
+
+
+# ----------------------------
+# Profiling
+# ----------------------------
+def _frame_name(frame: Any) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class _SlowCallbackHandler(logging.Handler):
+    # asyncio debug mode logs "Executing <Handle ...> took 0.123 seconds".
+    def __init__(self, profiler: "StageProfiler") -> None:
+        super().__init__(logging.WARNING)
+        self.profiler = profiler
+
+    def emit(self, record: logging.LogRecord) -> None:
+        msg = record.getMessage()
+        if msg.startswith("Executing "):
+            self.profiler.slow.append((self.profiler.current or "-", msg))
+
+
+class StageProfiler:
+    """
+    Stage hook writing, per stage, to `out_dir`:
+
+      <stage>.pstats     cProfile data (load with pstats / snakeviz)
+      <stage>.collapsed  sampled stacks, one "a;b;c count" line each, for
+                         flamegraph.pl / speedscope
+
+    plus slow-callbacks.log: event loop callbacks that held the loop for
+    longer than `slow_callback` seconds, tagged with the running stage.
+    Both profilers watch the main thread only; watch_workers() moves the
+    thread-pool work of fileio onto it.
+    The sampler uses SIGPROF, so it counts CPU time, not time spent
+    waiting on the network; it is skipped where setitimer is missing.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        interval: float = DEFAULT_SAMPLE_INTERVAL,
+        slow_callback: float = DEFAULT_SLOW_CALLBACK,
+    ) -> None:
+        self.out_dir = out_dir
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.samples: Dict[str, Counter] = {}
+        self.slow: List[Tuple[str, str]] = []
+        self.current: Optional[str] = None
+        self._handler: Optional[_SlowCallbackHandler] = None
+        self._sampling = hasattr(signal, "setitimer") and hasattr(signal, "SIGPROF")
+
+    def watch_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        loop.set_debug(True)
+        loop.slow_callback_duration = self.slow_callback
+        if self._handler is None:
+            self._handler = _SlowCallbackHandler(self)
+            logging.getLogger("asyncio").addHandler(self._handler)
+
+    def watch_workers(self) -> None:
+        # Pool work runs on the main thread from here on (see
+        # fileio.set_inline_workers), where both profilers can see it.
+        set_inline_workers(True)
+
+    def _sample(self, signum: int, frame: Any) -> None:
+        if self.current is None:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        self.samples[self.current][";".join(reversed(stack))] += 1
+
+    def enter(self, name: str) -> None:
+        self.current = name
+        self.samples.setdefault(name, Counter())
+        if self._sampling:
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.profiles.setdefault(name, cProfile.Profile()).enable()
+
+    def exit(self, name: str) -> None:
+        self.profiles[name].disable()
+        if self._sampling:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        self.current = None
+
+    def finish(self, top: int = DEFAULT_PROFILE_TOP) -> None:
+        """
+        Write every stage's files and print its top functions by own time.
+        """
+        if self._handler is not None:
+            logging.getLogger("asyncio").removeHandler(self._handler)
+            self._handler = None
+
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        for name, prof in self.profiles.items():
+            prof.dump_stats(os.path.join(self.out_dir, f"{name}.pstats"))
+
+            if self.samples.get(name):
+                atomic_write_bytes(
+                    os.path.join(self.out_dir, f"{name}.collapsed"),
+                    "".join(f"{stack} {n}\n" for stack, n in sorted(self.samples[name].items())).encode("utf-8"),
+                )
+
+            out = io.StringIO()
+            pstats.Stats(prof, stream=out).sort_stats("tottime").print_stats(top)
+            print(f"--- profile: {name} ---")
+            print(out.getvalue().split("\n\n", 1)[-1].strip())
+
+        atomic_write_bytes(
+            os.path.join(self.out_dir, "slow-callbacks.log"),
+            "".join(f"{stage}\t{msg}\n" for stage, msg in self.slow).encode("utf-8"),
+        )
+        print(f"profile: {len(self.slow)} slow event loop callbacks; output in {self.out_dir}/")
@@ -0,0 +1,408 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# ----------------------------
+# Tunables
+# ----------------------------
+DEFAULT_WRITE_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+# Set by --profile (see set_inline_workers).
+INLINE_WORKERS = False
+
+
+# ----------------------------
+# Serialization
+# ----------------------------
+def _json_default(obj: Any) -> Any:
+    # Internal containers (e.g. dayseries.DaySeries) provide their own
+    # file representation.
+    to_json = getattr(obj, "to_json", None)
+    if to_json is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return to_json()
+
+
+def dump_json_bytes(payload: Any) -> bytes:
+    return json.dumps(
+        payload,
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=_json_default,
+    ).encode("utf-8")
+
+
+def ensure_json_bytes(payload: Any) -> bytes:
+    return payload if isinstance(payload, bytes) else dump_json_bytes(payload)
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except OSError:
+        return None
+
+
+# ----------------------------
+# Line-oriented layout
+# ----------------------------
+# A .ndjson output holds the same document as its .json form, one record
+# per line: the first line is the document without its record maps, each
+# following line is [map name, record key, record], ordered by map and then
+# by key. A run that changes a few records rewrites only their lines, so
+# the git delta of a committed output stays proportional to what changed.
+
+NDJSON_EXT = ".ndjson"
+
+
+def dump_ndjson_bytes(doc: Dict[str, Any], collections: Sequence[str]) -> bytes:
+    header = {k: v for k, v in doc.items() if k not in collections}
+    lines = [dump_json_bytes(header)]
+    for name in collections:
+        records = doc.get(name) or {}
+        for key in sorted(records):
+            lines.append(dump_json_bytes([name, key, records[key]]))
+    return b"\n".join(lines) + b"\n"
+
+
+def parse_ndjson(text: str, collections: Sequence[str] = ()) -> Dict[str, Any]:
+    lines = text.splitlines()
+    doc = json.loads(lines[0]) if lines else {}
+    for name in collections:
+        doc[name] = {}
+    for line in lines[1:]:
+        if line.strip():
+            name, key, record = json.loads(line)
+            doc.setdefault(name, {})[key] = record
+    return doc
+
+
+def dump_document_bytes(doc: Dict[str, Any], path: str, collections: Sequence[str]) -> bytes:
+    """
+    `doc` serialized for `path`: line-oriented for .ndjson, else one JSON value.
+    """
+    if path.endswith(NDJSON_EXT):
+        return dump_ndjson_bytes(doc, collections)
+    return dump_json_bytes(doc)
+
+
+def ensure_document_bytes(payload: Any, path: str, collections: Sequence[str]) -> bytes:
+    return payload if isinstance(payload, bytes) else dump_document_bytes(payload, path, collections)
+
+
+def load_document(path: str, collections: Sequence[str] = ()) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith(NDJSON_EXT):
+        return parse_ndjson(text, collections)
+    return json.loads(text)
+
+
+def swap_layout(path: str) -> str:
+    # a.json <-> a.ndjson
+    if path.endswith(NDJSON_EXT):
+        return path[:-len(NDJSON_EXT)] + ".json"
+    return path[:-len(".json")] + NDJSON_EXT
+
+
+def stored_path(path: str) -> str:
+    """
+    `path`, or its other-layout twin if only that one exists (an output
+    written before the layout was switched).
+    """
+    if os.path.exists(path):
+        return path
+    other = swap_layout(path)
+    return other if os.path.exists(other) else path
+
+
+# ----------------------------
+# Precompressed variants
+# ----------------------------
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output byte-identical for identical input.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+def _zstd(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=19).compress(data)
+
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {"gz": _gzip}
+if brotli is not None:
+    COMPRESSORS["br"] = _brotli
+if zstandard is not None:
+    COMPRESSORS["zst"] = _zstd
+
+COMPRESSED_SUFFIXES = ("gz", "br", "zst")
+
+
+def parse_compress_formats(spec: str) -> Tuple[str, ...]:
+    formats: List[str] = []
+    for fmt in (spec or "").split(","):
+        fmt = fmt.strip().lower().lstrip(".")
+        if not fmt or fmt in formats:
+            continue
+        if fmt not in COMPRESSED_SUFFIXES:
+            raise ValueError(f"unknown compression format: {fmt}")
+        if fmt not in COMPRESSORS:
+            raise ValueError(f"compression format {fmt} needs an optional package that is not installed")
+        formats.append(fmt)
+    return tuple(formats)
+
+
+def is_output_file(fn: str, ext: str = ".json") -> bool:
+    if fn.endswith(".tmp"):
+        fn = fn[:-4]
+    if fn.endswith(ext):
+        return True
+    return any(fn.endswith(f"{ext}.{fmt}") for fmt in COMPRESSED_SUFFIXES)
+
+
+def plan_variants(path: str, data: bytes, compress: Sequence[str]) -> List[Tuple[str, Optional[str]]]:
+    """
+    Return the (target, format) pairs that need writing for `data` at
+    `path`. When the file on disk already has the same content hash,
+    the file itself and any existing compressed siblings are skipped,
+    and siblings in formats not in `compress` are removed right away
+    (a rewritten file drops them in commit_staged).
+    """
+    unchanged = file_digest(path) == content_digest(data)
+
+    plan: List[Tuple[str, Optional[str]]] = []
+    if unchanged:
+        remove_stale_variants(path, compress)
+    else:
+        plan.append((path, None))
+
+    for fmt in compress:
+        target = f"{path}.{fmt}"
+        if unchanged and os.path.exists(target):
+            continue
+        plan.append((target, fmt))
+
+    return plan
+
+
+# ----------------------------
+# File names
+# ----------------------------
+def slugify_filename(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    text = text.encode("ascii", "ignore").decode("ascii")
+    text = text.lower()
+    text = re.sub(r"[^a-z0-9]+", "-", text)
+    text = re.sub(r"-{2,}", "-", text).strip("-")
+    return text or "unknown"
+
+
+# ----------------------------
+# Worker threads
+# ----------------------------
+class InlineExecutor(Executor):
+    """
+    Runs each submitted call on the calling thread, at submit time.
+    """
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> "Future[Any]":
+        future: "Future[Any]" = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def set_inline_workers(inline: bool) -> None:
+    """
+    cProfile and the SIGPROF sampler only see the main thread, so while
+    profiling, serialization, compression and fsyncs run there instead of
+    in worker threads and are charged to the stage that did them.
+    """
+    global INLINE_WORKERS
+    INLINE_WORKERS = inline
+
+
+def worker_pool(workers: int) -> Executor:
+    return InlineExecutor() if INLINE_WORKERS else ThreadPoolExecutor(max_workers=workers)
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    asyncio.to_thread(), or a plain call under set_inline_workers(True).
+    """
+    if INLINE_WORKERS:
+        return fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+# ----------------------------
+# Low-level writes
+# ----------------------------
+def fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_tmp(path: str, data: bytes, fsync: bool = True) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return tmp
+
+
+def stage_variant(path: str, data: bytes, fmt: Optional[str], fsync: bool) -> Tuple[str, str, Optional[str]]:
+    blob = COMPRESSORS[fmt](data) if fmt else data
+    return write_tmp(path, blob, fsync=fsync), path, fmt
+
+
+def remove_stale_variants(path: str, compress: Sequence[str]) -> None:
+    # An output must not keep siblings from an older run that asked for
+    # formats this run does not produce.
+    for other in COMPRESSED_SUFFIXES:
+        if other in compress:
+            continue
+        try:
+            os.remove(f"{path}.{other}")
+        except OSError:
+            pass
+
+
+def commit_staged(staged: Sequence[Tuple[str, str, Optional[str]]], compress: Sequence[str]) -> List[str]:
+    paths = []
+    for tmp, path, fmt in staged:
+        os.replace(tmp, path)
+        paths.append(path)
+
+        if fmt is None:
+            remove_stale_variants(path, compress)
+
+    return paths
+
+
+def atomic_write_bytes(path: str, data: bytes, compress: Sequence[str] = ()) -> None:
+    plan = plan_variants(path, data, compress)
+    if not plan:
+        return
+
+    if len(plan) == 1:
+        staged = [stage_variant(plan[0][0], data, plan[0][1], True)]
+    else:
+        with worker_pool(len(plan)) as pool:
+            staged = list(pool.map(lambda tf: stage_variant(tf[0], data, tf[1], True), plan))
+
+    commit_staged(staged, compress)
+
+
+def remove_output(path: str) -> None:
+    """
+    Delete an output file and any compressed siblings it has.
+    """
+    for target in [path] + [f"{path}.{fmt}" for fmt in COMPRESSED_SUFFIXES]:
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+
+
+def convert_layout(src: str, dst: str, collections: Sequence[str], compress: Sequence[str] = ()) -> None:
+    """
+    Rewrite the output at `src` in the layout of `dst`, then remove `src`.
+    """
+    doc = load_document(src, collections)
+    atomic_write_bytes(dst, dump_document_bytes(doc, dst, collections), compress=compress)
+    remove_output(src)
+
+
+# ----------------------------
+# Batched writes
+# ----------------------------
+async def write_json_batch(
+    items: Sequence[Tuple[str, Any]],
+    compress: Sequence[str] = (),
+    workers: Optional[int] = None,
+    collections: Sequence[str] = (),
+) -> List[str]:
+    """
+    Serialize all (path, payload) pairs (payloads that are already bytes
+    are written as-is; .ndjson paths get the line layout with
+    `collections` as record maps) and stage them, plus any requested
+    compressed siblings, concurrently in a worker pool. Files whose
+    content hash is unchanged are skipped. Each temp file is fsynced by
+    the worker that wrote it, so the fsyncs run in parallel; only once all
+    of them are on disk is anything renamed into place, and each touched
+    directory is then fsynced once. Returns the paths that were written.
+
+    The barrier is that ordering, not one sync call: sync()/syncfs() would
+    also flush whatever else is dirty on the filesystem, and concurrent
+    fsyncs already share journal commits on ext4 and xfs.
+    """
+    if not items:
+        return []
+
+    loop = asyncio.get_running_loop()
+
+    with worker_pool(workers or DEFAULT_WRITE_WORKERS) as pool:
+        datas = await asyncio.gather(
+            *(
+                loop.run_in_executor(pool, ensure_document_bytes, payload, path, collections)
+                for path, payload in items
+            )
+        )
+        plans = await asyncio.gather(
+            *(
+                loop.run_in_executor(pool, plan_variants, path, data, compress)
+                for (path, _), data in zip(items, datas)
+            )
+        )
+        staged = await asyncio.gather(
+            *(
+                loop.run_in_executor(pool, stage_variant, target, data, fmt, True)
+                for plan, data in zip(plans, datas)
+                for target, fmt in plan
+            )
+        )
+
+    paths = commit_staged(staged, compress)
+
+    for d in dict.fromkeys(os.path.dirname(path) or "." for path in paths):
+        fsync_dir(d)
+
+    return paths
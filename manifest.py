@@ -0,0 +1,92 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+from fileio import atomic_write_bytes, content_digest, dump_json_bytes, file_digest
+
+# ----------------------------
+# Format
+# ----------------------------
+# <output>/manifest.json, one per dataset (moviedata/, statedata/):
+#
+#   {"years": {"2024": {"lpd": "2024-12-31", "status": "closed",
+#                       "h": <sha256 of the year file>, "size": <bytes>}}}
+#
+# "closed" means the year file covers Dec 31 and will not change again.
+# It is rewritten (atomically) right after the year's outputs, so a run
+# can settle closed years from this one small file. An entry is trusted
+# only while the year file still has the recorded size; otherwise callers
+# fall back to reading the file itself.
+
+MANIFEST_NAME = "manifest.json"
+STATUS_OPEN = "open"
+STATUS_CLOSED = "closed"
+
+
+class YearManifest:
+    def __init__(self, root: str) -> None:
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.years: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.years = {str(y): dict(v) for y, v in (data.get("years") or {}).items()}
+        except (OSError, ValueError, AttributeError):
+            self.years = {}
+
+    def get(self, year: int) -> Optional[Dict[str, Any]]:
+        return self.years.get(str(year))
+
+    def is_closed(self, year: int, year_file: str) -> bool:
+        """
+        True if the manifest says `year` is complete and `year_file` is
+        still the file it describes (compared by size, a stat call).
+        """
+        entry = self.get(year)
+        if not entry or entry.get("status") != STATUS_CLOSED:
+            return False
+        if not (entry.get("lpd") or "") >= f"{year}-12-31":
+            return False
+        try:
+            return os.path.getsize(year_file) == entry.get("size")
+        except OSError:
+            return False
+
+    def record(self, year: int, lpd: Optional[str], data: bytes) -> None:
+        """
+        Note the year file just written with content `data`.
+        """
+        self._set(year, lpd, content_digest(data), len(data))
+
+    def record_file(self, year: int, lpd: Optional[str], year_file: str) -> None:
+        """
+        Note an existing year file (one hash pass over it), e.g. a year
+        settled from its header by a run that predates the manifest.
+        """
+        digest = file_digest(year_file)
+        if digest is not None:
+            self._set(year, lpd, digest, os.path.getsize(year_file))
+
+    def _set(self, year: int, lpd: Optional[str], digest: str, size: int) -> None:
+        entry = {
+            "lpd": lpd,
+            "status": STATUS_CLOSED if lpd and lpd >= f"{year}-12-31" else STATUS_OPEN,
+            "h": digest,
+            "size": size,
+        }
+        if self.years.get(str(year)) != entry:
+            self.years[str(year)] = entry
+            self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        atomic_write_bytes(
+            self.path,
+            dump_json_bytes({"years": dict(sorted(self.years.items()))}),
+        )
+        self._dirty = False
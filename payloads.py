@@ -0,0 +1,184 @@
+import json
+import re
+from collections import defaultdict
+from typing import Any, Callable, Dict, Tuple
+
+# ----------------------------
+# Daily payload parsing
+# ----------------------------
+# finalsummary.json is {"last_updated": ..., "movies": {title: {gross, sold,
+# shows, occupancy, details: [...], Chain_details: [...]}}}. Nearly all of
+# its bytes are the two row lists, and most of those belong to movies that
+# fall under the per-day gross threshold. parse_daily_payload() walks the
+# document, records where each row list starts (skipping over it without
+# decoding anything), decides which base titles pass the threshold from the
+# movie-level gross, and only then decodes the row lists that are needed.
+
+LAZY_KEYS = ("details", "Chain_details")
+
+# A title's bracketed suffixes ("[Telugu]", "[2003] [2D | Telugu]") name a
+# variant; what is left is the base title that movieSummary and the search
+# index are keyed by (updater.py's rule; statedata.py keeps its own, which
+# its existing state files are keyed by).
+_VARIANT_SUFFIX = re.compile(r"\s*\[.*?\]\s*$")
+
+
+def normalize_movie_name(name: str) -> str:
+    return _VARIANT_SUFFIX.sub("", name or "").strip()
+
+
+_decoder = json.JSONDecoder()
+_scanstring = json.decoder.scanstring
+_ws = re.compile(r"[ \t\n\r]*").match
+
+# An array without nested arrays: object rows of scalars, which is what
+# details/Chain_details contain. Anything else falls back to raw_decode.
+_flat_array = re.compile(r'\[(?:[^"\[\]]++|"(?:[^"\\]++|\\.)*+")*+\]').match
+
+
+def _skip_flat_array(text: str, idx: int) -> int:
+    """
+    Return the index just past the flat array starting at `idx`, or -1.
+    The common case (no '[' and no escaped backslash inside) is found
+    with str.find/str.count, which run at memchr speed; everything else
+    goes through the regex above.
+    """
+    end = idx
+    while True:
+        end = text.find("]", end + 1)
+        if end < 0:
+            return -1
+        if text.find("[", idx + 1, end) >= 0 or text.find("\\\\", idx, end) >= 0:
+            m = _flat_array(text, idx)
+            return m.end() if m else -1
+        quotes = text.count('"', idx, end) - text.count('\\"', idx, end)
+        if quotes % 2 == 0:
+            return end + 1
+
+
+def _skip_ws(text: str, idx: int) -> int:
+    return _ws(text, idx).end()
+
+
+def _key(text: str, idx: int) -> Tuple[str, int]:
+    if text[idx] != '"':
+        raise ValueError(f"expected key at {idx}")
+    key, idx = _scanstring(text, idx + 1)
+    idx = _skip_ws(text, idx)
+    if text[idx] != ":":
+        raise ValueError(f"expected ':' at {idx}")
+    return key, _skip_ws(text, idx + 1)
+
+
+def _next(text: str, idx: int) -> Tuple[int, bool]:
+    idx = _skip_ws(text, idx)
+    c = text[idx]
+    if c == ",":
+        return _skip_ws(text, idx + 1), False
+    if c == "}":
+        return idx + 1, True
+    raise ValueError(f"expected ',' or '}}' at {idx}")
+
+
+def _open(text: str, idx: int) -> Tuple[int, bool]:
+    if text[idx] != "{":
+        raise ValueError(f"expected object at {idx}")
+    idx = _skip_ws(text, idx + 1)
+    if text[idx] == "}":
+        return idx + 1, True
+    return idx, False
+
+
+def _scan_movie(text: str, idx: int, lazy: Dict[str, int]) -> Tuple[Dict[str, Any], int]:
+    movie: Dict[str, Any] = {}
+    idx, done = _open(text, idx)
+    while not done:
+        key, idx = _key(text, idx)
+        end = _skip_flat_array(text, idx) if key in LAZY_KEYS and text[idx] == "[" else -1
+        if end >= 0:
+            lazy[key] = idx
+            movie[key] = None
+            idx = end
+        else:
+            movie[key], idx = _decoder.raw_decode(text, idx)
+        idx, done = _next(text, idx)
+    return movie, idx
+
+
+def _scan_movies(
+    text: str,
+    idx: int,
+    lazy: Dict[str, Dict[str, int]],
+) -> Tuple[Dict[str, Any], int]:
+    movies: Dict[str, Any] = {}
+    idx, done = _open(text, idx)
+    while not done:
+        name, idx = _key(text, idx)
+        if text[idx] == "{":
+            spans: Dict[str, int] = {}
+            movies[name], idx = _scan_movie(text, idx, spans)
+            lazy[name] = spans
+        else:
+            movies[name], idx = _decoder.raw_decode(text, idx)
+            lazy.pop(name, None)
+        idx, done = _next(text, idx)
+    return movies, idx
+
+
+def scan_payload(text: str) -> Tuple[Dict[str, Any], Dict[str, Dict[str, int]]]:
+    """
+    Decode everything except the details/Chain_details lists, which are
+    left as None. Returns the payload and, per movie, the offsets at
+    which each skipped list starts.
+    """
+    payload: Dict[str, Any] = {}
+    lazy: Dict[str, Dict[str, int]] = {}
+
+    idx, done = _open(text, _skip_ws(text, 0))
+    while not done:
+        key, idx = _key(text, idx)
+        if key == "movies" and text[idx] == "{":
+            payload[key], idx = _scan_movies(text, idx, lazy)
+        else:
+            payload[key], idx = _decoder.raw_decode(text, idx)
+        idx, done = _next(text, idx)
+
+    if text[_skip_ws(text, idx):]:
+        raise ValueError("extra data after payload")
+
+    return payload, lazy
+
+
+def parse_daily_payload(
+    text: str,
+    min_movie_day_gross: int,
+    base_name: Callable[[str], str],
+) -> Dict[str, Any]:
+    """
+    Parse a finalsummary.json body. Movies whose base title grossed less
+    than `min_movie_day_gross` that day keep their movie-level fields
+    but get empty details/Chain_details; nobody downstream reads them.
+    Malformed or unexpected documents fall back to json.loads().
+    """
+    try:
+        payload, lazy = scan_payload(text)
+    except (ValueError, IndexError):
+        return json.loads(text)
+
+    movies = payload.get("movies")
+    if not isinstance(movies, dict):
+        return payload
+
+    base_gross: Dict[str, float] = defaultdict(float)
+    for name, movie in movies.items():
+        gross = movie.get("gross") if isinstance(movie, dict) else None
+        if isinstance(gross, (int, float)):
+            base_gross[base_name(name)] += gross
+
+    for name, spans in lazy.items():
+        movie = movies[name]
+        keep = base_gross[base_name(name)] >= min_movie_day_gross
+        for key, start in spans.items():
+            movie[key] = _decoder.raw_decode(text, start)[0] if keep else []
+
+    return payload
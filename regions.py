@@ -0,0 +1,75 @@
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+# ----------------------------
+# Format
+# ----------------------------
+# regions.json describes the geography above the state level:
+#
+#   {"nation": "India",
+#    "default": "North",                 region of states not listed
+#    "regions": [{"name": "South", "rest": "RS", "states": [...]}, ...]}
+#
+# Cities map to states in the upstream rows themselves, so the hierarchy
+# is city -> state (upstream) -> region -> nation (this file). Regions are
+# kept in file order, which is also the order of the "rest of region"
+# rows ("rest") that updater.build_top_states folds small states into.
+
+DEFAULT_REGIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regions.json")
+
+V = TypeVar("V")
+A = TypeVar("A")
+
+
+class RegionMap:
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.nation = str(data.get("nation") or "India")
+        self.names: List[str] = []
+        self.rest: Dict[str, str] = {}
+        self.state_region: Dict[str, str] = {}
+
+        for region in data.get("regions") or []:
+            name = str(region["name"])
+            self.names.append(name)
+            self.rest[name] = str(region.get("rest") or f"R{name[:1].upper()}")
+            for state in region.get("states") or []:
+                self.state_region[state] = name
+
+        if not self.names:
+            self.names.append(self.nation)
+            self.rest[self.nation] = "R"
+
+        self.default = str(data.get("default") or self.names[-1])
+        if self.default not in self.rest:
+            raise ValueError(f"default region {self.default!r} is not one of {self.names}")
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "RegionMap":
+        """
+        Read `path`, or regions.json next to this module. Without either,
+        the whole nation is one region.
+        """
+        if path is None and not os.path.exists(DEFAULT_REGIONS):
+            return cls({})
+        with open(path or DEFAULT_REGIONS, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def region(self, state: str) -> str:
+        return self.state_region.get(state, self.default)
+
+    def rollup(
+        self,
+        values: Dict[str, V],
+        merge: Callable[[Dict[str, A], str, V], None],
+    ) -> Dict[str, A]:
+        """
+        Fold per-state values into per-region ones: merge(container,
+        region, value) is called for each state, as with updater's
+        merge_stat. Regions come back in file order; those with no states
+        in `values` are left out.
+        """
+        acc: Dict[str, A] = {}
+        for state, value in values.items():
+            merge(acc, self.region(state), value)
+        return {name: acc[name] for name in self.names if name in acc}
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fileio import atomic_write_bytes, dump_json_bytes
+
+# ----------------------------
+# Tunables
+# ----------------------------
+DEFAULT_HEDGE_DELAY = 3.0
+DEFAULT_HEDGE_MIN_DELAY = 0.25
+DEFAULT_HEDGE_QUANTILE = 0.95
+DEFAULT_LATENCY_WINDOW = 256
+DEFAULT_LATENCY_MIN_SAMPLES = 16
+DEFAULT_CACHE_DIR = ".cache"
+DEFAULT_DNS_CACHE_TTL = 300
+HEALTH_DECAY = 0.9
+HEALTH_RUN_DECAY = 0.5
+UNHEALTHY_ERROR_RATE = 0.5
+UNHEALTHY_MIN_WEIGHT = 2.0
+NEGATIVE_TTL_RECENT = 3 * 3600
+NEGATIVE_TTL_OLD = 30 * 86400
+NEGATIVE_TTL_INVALID = 3600
+
+# Statuses that mean "this file does not exist", as opposed to a transient
+# failure worth retrying.
+MISSING_STATUSES = (404, 410)
+
+# A 200 whose body is not JSON is recorded as 0. The file exists but was
+# truncated or caught mid-publish, so it is only skipped for a short while.
+INVALID_STATUS = 0
+
+
+# ----------------------------
+# Latency tracking
+# ----------------------------
+class LatencyTracker:
+    """
+    Sliding window of observed request latencies. threshold() is the
+    configured quantile (p95 by default) once enough samples exist, and
+    a fixed default before that.
+    """
+
+    def __init__(
+        self,
+        default: float = DEFAULT_HEDGE_DELAY,
+        quantile: float = DEFAULT_HEDGE_QUANTILE,
+        window: int = DEFAULT_LATENCY_WINDOW,
+        min_samples: int = DEFAULT_LATENCY_MIN_SAMPLES,
+    ) -> None:
+        self.default = default
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def threshold(self) -> float:
+        if len(self.samples) < self.min_samples:
+            return self.default
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * self.quantile))
+        return max(DEFAULT_HEDGE_MIN_DELAY, ordered[idx])
+
+
+# ----------------------------
+# Hedged requests
+# ----------------------------
+async def _timed(
+    call: Callable[[], Awaitable[Any]],
+    tracker: LatencyTracker,
+    is_valid: Callable[[Any], bool],
+) -> Any:
+    # Only successful completions are observed: fast failures (404s,
+    # refused connections) would drag the quantile down, and a primary
+    # cancelled at the threshold says nothing about how slow it was.
+    started = time.perf_counter()
+    result = await call()
+    if is_valid(result):
+        tracker.observe(time.perf_counter() - started)
+    return result
+
+
+def _result_or_none(task: "asyncio.Future[Any]") -> Any:
+    try:
+        return task.result()
+    except Exception:
+        return None
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[Any]],
+    fallback: Callable[[], Awaitable[Any]],
+    tracker: LatencyTracker,
+    is_valid: Callable[[Any], bool] = bool,
+) -> Optional[Any]:
+    """
+    Run `primary`; if it has not produced a valid result within the
+    tracker's threshold (or fails before that), also start `fallback`.
+    The first valid result wins and the other request is cancelled.
+    """
+    tasks = {asyncio.ensure_future(_timed(primary, tracker, is_valid))}
+
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=tracker.threshold())
+        for task in done:
+            result = _result_or_none(task)
+            if is_valid(result):
+                return result
+            tasks.discard(task)
+
+        tasks.add(asyncio.ensure_future(fallback()))
+
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = _result_or_none(task)
+                if is_valid(result):
+                    return result
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# ----------------------------
+# HTTP session
+# ----------------------------
+class LazyClientSession:
+    """
+    Stands in for an aiohttp.ClientSession. aiohttp is imported and the
+    real session opened on the first request, so runs served entirely
+    from the archive (or with nothing to fetch) never load the HTTP stack.
+    """
+
+    def __init__(self, timeout: float, limit: int) -> None:
+        self.timeout = timeout
+        self.limit = limit
+        self._session: Any = None
+
+    def _open(self) -> Any:
+        if self._session is None:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    ttl_dns_cache=DEFAULT_DNS_CACHE_TTL,
+                    enable_cleanup_closed=True,
+                ),
+            )
+        return self._session
+
+    def get(self, url: str, **kwargs: Any) -> Any:
+        return self._open().get(url, **kwargs)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self) -> "LazyClientSession":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+
+# ----------------------------
+# Persisted routing table
+# ----------------------------
+def url_host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+class RoutingTable:
+    """
+    Remembers which host served each recent date and keeps decayed
+    success/error counts and a latency EWMA per host. Persisted as JSON
+    between runs so later runs go straight to the host that works.
+
+    Health counts are halved on every load so a host that was marked
+    unhealthy gets probed again after a few runs.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.dates: Dict[str, str] = {}
+        self.hosts: Dict[str, Dict[str, float]] = {}
+        if path:
+            self.load(path)
+
+    def load(self, path: str) -> None:
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        self.dates = dict(data.get("dates") or {})
+        self.hosts = {}
+        for host, h in (data.get("hosts") or {}).items():
+            self.hosts[host] = {
+                "ok": float(h.get("ok", 0)) * HEALTH_RUN_DECAY,
+                "err": float(h.get("err", 0)) * HEALTH_RUN_DECAY,
+                "lat": float(h.get("lat", 0)),
+            }
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        atomic_write_bytes(
+            self.path,
+            dump_json_bytes({
+                "dates": dict(sorted(self.dates.items())),
+                "hosts": {
+                    host: {k: round(v, 4) for k, v in h.items()}
+                    for host, h in sorted(self.hosts.items())
+                },
+            }),
+        )
+
+    def record(self, url: str, ok: bool, seconds: float) -> None:
+        h = self.hosts.setdefault(url_host(url), {"ok": 0.0, "err": 0.0, "lat": 0.0})
+        h["ok"] = h["ok"] * HEALTH_DECAY + (1.0 if ok else 0.0)
+        h["err"] = h["err"] * HEALTH_DECAY + (0.0 if ok else 1.0)
+        if ok:
+            h["lat"] = seconds if not h["lat"] else h["lat"] * 0.8 + seconds * 0.2
+
+    def remember(self, date_str: str, url: str) -> None:
+        self.dates[date_str] = url_host(url)
+
+    def is_unhealthy(self, url: str) -> bool:
+        h = self.hosts.get(url_host(url))
+        if not h:
+            return False
+        weight = h["ok"] + h["err"]
+        return weight >= UNHEALTHY_MIN_WEIGHT and h["err"] / weight > UNHEALTHY_ERROR_RATE
+
+    def order(self, date_str: str, url: str, fallback: str) -> Tuple[str, str]:
+        """
+        Return (first, second) for a date: the host that served this date
+        before goes first, and a primary that is currently failing is
+        tried only after its fallback.
+        """
+        if url == fallback:
+            return url, fallback
+
+        winner = self.dates.get(date_str)
+        if winner == url_host(fallback):
+            return fallback, url
+        if winner == url_host(url):
+            return url, fallback
+
+        if self.is_unhealthy(url) and not self.is_unhealthy(fallback):
+            return fallback, url
+
+        return url, fallback
+
+    def prune(self, keep_after: str) -> None:
+        self.dates = {d: host for d, host in self.dates.items() if d >= keep_after}
+
+
+def routing_table_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, "routing.json")
+
+
+# ----------------------------
+# Negative cache
+# ----------------------------
+class NegativeCache:
+    """
+    Dates for which every source answered "not found", with an expiry
+    time each. Persisted as JSON between runs so known-missing days cost
+    no requests until their TTL runs out.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.expires: Dict[str, float] = {}
+        if path:
+            self.load(path)
+
+    def load(self, path: str) -> None:
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.expires = {d: float(t) for d, t in (data.get("dates") or {}).items()}
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        now = time.time()
+        atomic_write_bytes(
+            self.path,
+            dump_json_bytes({
+                "dates": {d: int(t) for d, t in sorted(self.expires.items()) if t > now},
+            }),
+        )
+
+    def is_missing(self, date_str: str) -> bool:
+        t = self.expires.get(date_str)
+        return t is not None and t > time.time()
+
+    def add(self, date_str: str, ttl: float) -> None:
+        self.expires[date_str] = time.time() + ttl
+
+    def discard(self, date_str: str) -> None:
+        self.expires.pop(date_str, None)
+
+
+def negative_ttl(date_str: str, statuses: Iterable[int], today: str, recent_cutoff: str) -> float:
+    """
+    TTL for a date no source served, given each source's last status. Only
+    "not found" and unparseable answers are cached, and never for today (its
+    file may still be published); unparseable ones briefly, missing ones
+    short for the last month and long for anything older.
+    """
+    statuses = list(statuses)
+    if not statuses or date_str >= today:
+        return 0.0
+    if not all(code in MISSING_STATUSES or code == INVALID_STATUS for code in statuses):
+        return 0.0
+    if INVALID_STATUS in statuses:
+        return NEGATIVE_TTL_INVALID
+    if date_str >= recent_cutoff:
+        return NEGATIVE_TTL_RECENT
+    return NEGATIVE_TTL_OLD
+
+
+def negative_cache_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, "negative.json")
@@ -0,0 +1,159 @@
+import argparse
+import json
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+
+from payloads import normalize_movie_name
+
+# ----------------------------
+# Format
+# ----------------------------
+# moviedata/search.json is written by updater.save_database next to
+# database.json:
+#
+#   {"u": <as database.json>,
+#    "t": [[name, start, end], ...]   database.json's "m", same order
+#    "k": [key, ...]                  folded title per entry of "t"
+#    "g": {trigram: [id, ...]}        ids (positions in "t") whose key
+#                                     contains the trigram, ascending
+#    "w": [[word, id], ...]}          every word of every key, sorted
+#
+# A key is the base title (payloads.normalize_movie_name) lowercased, with
+# accents stripped and punctuation collapsed to single spaces. Queries of
+# three or more characters are substring matches found by intersecting
+# trigram postings; shorter ones match word prefixes by bisecting "w".
+
+DEFAULT_INDEX = "moviedata/search.json"
+DEFAULT_LIMIT = 10
+
+
+def fold_title(name: str) -> str:
+    text = unicodedata.normalize("NFKD", normalize_movie_name(name))
+    text = text.encode("ascii", "ignore").decode("ascii").lower()
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def trigrams(key: str) -> List[str]:
+    return sorted({key[i:i + 3] for i in range(len(key) - 2)})
+
+
+def build_search_index(movies: List[List[Any]], u: Any) -> Dict[str, Any]:
+    keys = [fold_title(row[0]) for row in movies]
+
+    grams: Dict[str, List[int]] = {}
+    words = []
+
+    for i, key in enumerate(keys):
+        for gram in trigrams(key):
+            grams.setdefault(gram, []).append(i)
+        for word in set(key.split()):
+            words.append([word, i])
+
+    words.sort()
+
+    return {
+        "u": u,
+        "t": movies,
+        "k": keys,
+        "g": dict(sorted(grams.items())),
+        "w": words,
+    }
+
+
+# ----------------------------
+# Lookup
+# ----------------------------
+class SearchIndex:
+    """
+    In-memory form of search.json. search() ranks exact title matches,
+    then titles starting with the query, then word-prefix matches, then
+    other substring matches; ties keep database.json order (latest run
+    first).
+    """
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.u = data.get("u")
+        self.titles: List[List[Any]] = data.get("t") or []
+        self.keys: List[str] = data.get("k") or []
+        self.grams: Dict[str, List[int]] = data.get("g") or {}
+        words = data.get("w") or []
+        self.words = [w for w, _ in words]
+        self.word_ids = [i for _, i in words]
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX) -> "SearchIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _word_prefix(self, q: str) -> List[int]:
+        out = set()
+        i = bisect_left(self.words, q)
+        while i < len(self.words) and self.words[i].startswith(q):
+            out.add(self.word_ids[i])
+            i += 1
+        return sorted(out)
+
+    def _substring(self, q: str) -> List[int]:
+        postings = []
+        for gram in trigrams(q):
+            ids = self.grams.get(gram)
+            if not ids:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+
+        found = set(postings[0])
+        for ids in postings[1:]:
+            found.intersection_update(ids)
+            if not found:
+                return []
+
+        # Trigrams can all occur without the query occurring as a whole.
+        return sorted(i for i in found if q in self.keys[i])
+
+    def search(self, query: str, limit: Optional[int] = DEFAULT_LIMIT) -> List[List[Any]]:
+        q = fold_title(query)
+        if not q:
+            return []
+
+        ids = self._substring(q) if len(q) >= 3 else self._word_prefix(q)
+
+        def rank(i: int) -> tuple:
+            key = self.keys[i]
+            if key == q:
+                return (0, i)
+            if key.startswith(q):
+                return (1, i)
+            if f" {q}" in f" {key}":
+                return (2, i)
+            return (3, i)
+
+        ids.sort(key=rank)
+        if limit is not None:
+            ids = ids[:limit]
+        return [self.titles[i] for i in ids]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Look up movie titles in moviedata/search.json.")
+    parser.add_argument("query", nargs="+")
+    parser.add_argument("--index", type=str, default=DEFAULT_INDEX)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    args = parser.parse_args()
+
+    index = SearchIndex.load(args.index)
+
+    started = time.perf_counter()
+    hits = index.search(" ".join(args.query), args.limit)
+    took = time.perf_counter() - started
+
+    for name, start, end in hits:
+        print(f"{name}\t{start}\t{end}")
+    print(f"{len(hits)} results in {took * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
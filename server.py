@@ -0,0 +1,532 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from fileio import NDJSON_EXT, dump_json_bytes, load_document, run_blocking
+from payloads import normalize_movie_name
+
+# ----------------------------
+# Tunables
+# ----------------------------
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_CACHE_SIZE = 2048
+DEFAULT_RELOAD_INTERVAL = 5.0
+DEFAULT_TOP_N = 10
+MAX_TOP_N = 200
+
+# Either layout (see fileio.dump_ndjson_bytes).
+YEAR_FILE_RE = re.compile(r"^(\d{4})\.(?:nd)?json$")
+OUTPUT_EXTS = (".json", NDJSON_EXT)
+
+# Record maps of the line layout, by file: year files of moviedata/ hold
+# two, state and yearly summary files one.
+MOVIE_COLLECTIONS = ("movieSummary", "movies")
+STATE_COLLECTIONS = ("movies",)
+DATE_RE = re.compile(r"^(\d{4})-?(\d{2})-?(\d{2})$")
+
+
+def parse_date(value: Optional[str]) -> Optional[str]:
+    """
+    "YYYY-MM-DD" or "YYYYMMDD" -> "YYYYMMDD" (the key format of the data
+    files), None if absent; raises HTTPBadRequest if malformed.
+    """
+    if not value:
+        return None
+    m = DATE_RE.match(value)
+    if not m:
+        raise web.HTTPBadRequest(text=f"bad date: {value}")
+    return "".join(m.groups())
+
+
+def date_range(request: web.Request) -> Tuple[Optional[str], Optional[str]]:
+    q = request.query
+    if "date" in q:
+        d = parse_date(q["date"])
+        return d, d
+    return parse_date(q.get("from")), parse_date(q.get("to"))
+
+
+def top_n(request: web.Request) -> int:
+    try:
+        n = int(request.query.get("n", DEFAULT_TOP_N))
+    except ValueError:
+        raise web.HTTPBadRequest(text="n must be an integer")
+    return max(1, min(n, MAX_TOP_N))
+
+
+# ----------------------------
+# Indexes
+# ----------------------------
+class DailyIndex:
+    """
+    A {"YYYYMMDD": value} map with its keys sorted once, so a date range
+    is two bisects and a slice.
+    """
+
+    __slots__ = ("keys", "data")
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.data = data
+        self.keys = sorted(data)
+
+    def span(self, first: Optional[str], last: Optional[str]) -> List[str]:
+        lo = bisect_left(self.keys, first) if first else 0
+        hi = bisect_right(self.keys, last) if last else len(self.keys)
+        return self.keys[lo:hi]
+
+    def slice(self, first: Optional[str], last: Optional[str]) -> Dict[str, Any]:
+        return {k: self.data[k] for k in self.span(first, last)}
+
+
+class Snapshot:
+    """
+    Everything the server answers from, built from one consistent set of
+    parsed files. A reload builds a new Snapshot and swaps it in whole.
+    """
+
+    def __init__(self, files: Dict[str, Dict[str, Any]], moviedata: str, statedata: str) -> None:
+        self.files = files
+        self.u: Dict[str, str] = {}
+
+        self.database: List[Any] = []
+        self.movie_years: Dict[int, Dict[str, Any]] = {}
+        self.movie_daily: Dict[Tuple[int, str], DailyIndex] = {}
+        self.movie_variants: Dict[str, List[Tuple[int, str]]] = {}
+        self.states: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self.state_daily: Dict[Tuple[int, str, str], DailyIndex] = {}
+        self.state_years: Dict[int, Dict[str, Any]] = {}
+        self.paths: Dict[Any, str] = {}
+
+        for path, data in files.items():
+            self.u[path] = str(data.get("u", data.get("last_updated", "")))
+            rel = os.path.relpath(path, moviedata) if path.startswith(moviedata + os.sep) else None
+            if rel is not None:
+                self._add_movie_file(path, rel, data)
+                continue
+            rel = os.path.relpath(path, statedata) if path.startswith(statedata + os.sep) else None
+            if rel is not None:
+                self._add_state_file(path, rel, data)
+
+        for variants in self.movie_variants.values():
+            variants.sort()
+
+    def _add_movie_file(self, path: str, rel: str, data: Dict[str, Any]) -> None:
+        if rel == "database.json":
+            self.database = data.get("m") or []
+            self.paths["database"] = path
+            return
+
+        m = YEAR_FILE_RE.match(rel)
+        if not m:
+            return
+        year = int(m.group(1))
+        self.movie_years[year] = data
+        self.paths[("movies", year)] = path
+        for name, movie in (data.get("movies") or {}).items():
+            self.movie_daily[(year, name)] = DailyIndex(movie.get("daily") or {})
+            self.movie_variants.setdefault(normalize_movie_name(name).lower(), []).append((year, name))
+
+    def _add_state_file(self, path: str, rel: str, data: Dict[str, Any]) -> None:
+        parts = rel.split(os.sep)
+        if len(parts) != 2:
+            return
+        folder, fn = parts
+
+        if folder == "year":
+            m = YEAR_FILE_RE.match(fn)
+            if m:
+                self.state_years[int(m.group(1))] = data
+                self.paths[("year", int(m.group(1)))] = path
+            return
+
+        key, ext = os.path.splitext(fn)
+        if not folder.isdigit() or ext not in OUTPUT_EXTS:
+            return
+        year = int(folder)
+        self.states.setdefault(year, {})[key] = data
+        self.paths[("state", year, key)] = path
+        for name, movie in (data.get("movies") or {}).items():
+            self.state_daily[(year, key, name)] = DailyIndex(movie.get("d") or {})
+
+    def years_between(self, first: Optional[str], last: Optional[str], years: List[int]) -> List[int]:
+        lo = int(first[:4]) if first else None
+        hi = int(last[:4]) if last else None
+        return [y for y in sorted(years) if (lo is None or y >= lo) and (hi is None or y <= hi)]
+
+
+# ----------------------------
+# Loading
+# ----------------------------
+def file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    # os.replace() gives the new file a new inode, so a replaced file is
+    # noticed even if size and mtime happen to match.
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def list_data_files(moviedata: str, statedata: str) -> List[str]:
+    found: List[str] = []
+
+    if os.path.isdir(moviedata):
+        for fn in os.listdir(moviedata):
+            if fn == "database.json" or YEAR_FILE_RE.match(fn):
+                found.append(os.path.join(moviedata, fn))
+
+    if os.path.isdir(statedata):
+        for folder in os.listdir(statedata):
+            d = os.path.join(statedata, folder)
+            if not os.path.isdir(d) or not (folder == "year" or folder.isdigit()):
+                continue
+            for fn in os.listdir(d):
+                if os.path.splitext(fn)[1] in OUTPUT_EXTS:
+                    found.append(os.path.join(d, fn))
+
+    return sorted(found)
+
+
+def load_json(path: str, moviedata: str) -> Optional[Dict[str, Any]]:
+    collections = MOVIE_COLLECTIONS if os.path.dirname(path) == moviedata else STATE_COLLECTIONS
+    try:
+        data = load_document(path, collections)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class DataStore:
+    """
+    Holds the current Snapshot. refresh() re-stats the data files,
+    parses only those that were added or replaced, and swaps in a new
+    Snapshot (and an empty response cache) in one assignment, so a
+    request sees either the old data or the new, never a mix.
+    """
+
+    def __init__(self, moviedata: str, statedata: str, cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.moviedata = os.path.abspath(moviedata)
+        self.statedata = os.path.abspath(statedata)
+        self.cache_size = cache_size
+        self.signatures: Dict[str, Tuple[int, int, int]] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.snapshot = Snapshot({}, self.moviedata, self.statedata)
+        self.cache: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+
+    def _reload(self) -> bool:
+        signatures = {}
+        for path in list_data_files(self.moviedata, self.statedata):
+            sig = file_signature(path)
+            if sig is not None:
+                signatures[path] = sig
+
+        if signatures == self.signatures:
+            return False
+
+        files = {}
+        for path, sig in signatures.items():
+            if self.signatures.get(path) == sig and path in self.files:
+                files[path] = self.files[path]
+                continue
+            data = load_json(path, self.moviedata)
+            if data is not None:
+                files[path] = data
+
+        snapshot = Snapshot(files, self.moviedata, self.statedata)
+
+        self.signatures = signatures
+        self.files = files
+        self.snapshot, self.cache = snapshot, OrderedDict()
+        return True
+
+    async def refresh(self) -> bool:
+        return await run_blocking(self._reload)
+
+    # -- response cache -----------------------------------------------
+    def cached(self, key: str) -> Optional[Tuple[str, bytes]]:
+        hit = self.cache.get(key)
+        if hit is not None:
+            self.cache.move_to_end(key)
+        return hit
+
+    def remember(self, key: str, etag: str, body: bytes) -> None:
+        self.cache[key] = (etag, body)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+
+# ----------------------------
+# Queries
+# ----------------------------
+# Each query returns (payload, source paths); the ETag is derived from the
+# sources' last_updated/u values, so it changes exactly when they do.
+def q_movies(snap: Snapshot, request: web.Request) -> Tuple[Any, List[str]]:
+    q = (request.query.get("q") or "").strip().lower()
+    rows = [row for row in snap.database if not q or q in str(row[0]).lower()]
+    return {"movies": rows}, [snap.paths.get("database", "")]
+
+
+def q_movie(snap: Snapshot, request: web.Request) -> Tuple[Any, List[str]]:
+    base = normalize_movie_name(request.match_info["name"]).lower()
+    variants = snap.movie_variants.get(base)
+    if not variants:
+        raise web.HTTPNotFound(text="unknown movie")
+
+    first, last = date_range(request)
+    only_year = request.query.get("year")
+
+    years: Dict[str, Any] = {}
+    sources = []
+    for year in snap.years_between(first, last, sorted({y for y, _ in variants})):
+        if only_year and str(year) != only_year:
+            continue
+        db = snap.movie_years[year]
+        out = {"summary": None, "variants": {}}
+        for y, name in variants:
+            if y != year:
+                continue
+            movie = db["movies"][name]
+            out["summary"] = (db.get("movieSummary") or {}).get(normalize_movie_name(name))
+            out["variants"][name] = {
+                "totals": movie.get("totals", {}),
+                "topCities": movie.get("topCities", []),
+                "topStates": movie.get("topStates", []),
+                "topRegions": movie.get("topRegions", []),
+                "topChains": movie.get("topChains", []),
+                "daily": snap.movie_daily[(year, name)].slice(first, last),
+            }
+        years[str(year)] = out
+        sources.append(snap.paths[("movies", year)])
+
+    return {"name": normalize_movie_name(variants[0][1]), "years": years}, sources
+
+
+def q_states(snap: Snapshot, request: web.Request) -> Tuple[Any, List[str]]:
+    year = int(request.match_info["year"])
+    states = snap.states.get(year)
+    if states is None:
+        raise web.HTTPNotFound(text="unknown year")
+    return {
+        "year": year,
+        "states": [{"k": k, "s": db.get("s", ""), "u": db.get("u", "")} for k, db in sorted(states.items())],
+    }, [snap.paths[("state", year, k)] for k in sorted(states)]
+
+
+def q_state(snap: Snapshot, request: web.Request) -> Tuple[Any, List[str]]:
+    year = int(request.match_info["year"])
+    key = request.match_info["state"]
+    db = snap.states.get(year, {}).get(key)
+    if db is None:
+        raise web.HTTPNotFound(text="unknown state")
+
+    first, last = date_range(request)
+    movie_q = normalize_movie_name(request.query.get("movie") or "").lower()
+
+    movies = {}
+    for name, movie in (db.get("movies") or {}).items():
+        if movie_q and normalize_movie_name(name).lower() != movie_q:
+            continue
+        movies[name] = {
+            "t": movie.get("t", {}),
+            "d": snap.state_daily[(year, key, name)].slice(first, last),
+        }
+
+    if "n" in request.query:
+        # .json files are ordered by total gross, .ndjson ones by name.
+        ranked = sorted(movies.items(), key=lambda kv: kv[1]["t"].get("g", 0), reverse=True)
+        movies = dict(ranked[:top_n(request)])
+
+    return {"y": year, "k": key, "s": db.get("s", ""), "u": db.get("u", ""), "movies": movies}, [
+        snap.paths[("state", year, key)]
+    ]
+
+
+def q_regions(snap: Snapshot, request: web.Request) -> Tuple[Any, List[str]]:
+    """
+    The yearly summary's region rollups: nation and region totals, each
+    region's states and its top movies, as written by statedata.py.
+    """
+    year = int(request.match_info["year"])
+    db = snap.state_years.get(year)
+    if db is None or "geo" not in db:
+        raise web.HTTPNotFound(text="no region rollups for this year")
+    return {"y": year, "u": db.get("u", ""), **db["geo"]}, [snap.paths[("year", year)]]
+
+
+def _rank(acc: Dict[str, List[float]], n: int) -> List[List[Any]]:
+    out = []
+    for name, (g, s, sh, occ, days) in acc.items():
+        out.append([name, int(g), int(s), int(sh), round(occ / days, 2) if days else 0])
+    out.sort(key=lambda r: r[1], reverse=True)
+    return out[:n]
+
+
+def q_top(snap: Snapshot, request: web.Request) -> Tuple[Any, List[str]]:
+    """
+    Top-N base titles by gross over ?date= or ?from=&to=, nationally or
+    for one ?state=<key>: [name, gross, sold, shows, avg occupancy].
+    """
+    first, last = date_range(request)
+    if not first and not last:
+        raise web.HTTPBadRequest(text="date or from/to required")
+    n = top_n(request)
+    state = request.query.get("state")
+
+    acc: Dict[str, List[float]] = {}
+    sources = []
+
+    if state:
+        for year in snap.years_between(first, last, list(snap.states)):
+            db = snap.states[year].get(state)
+            if db is None:
+                continue
+            sources.append(snap.paths[("state", year, state)])
+            for name in db.get("movies") or {}:
+                idx = snap.state_daily[(year, state, name)]
+                for k in idx.span(first, last):
+                    d = idx.data[k]
+                    a = acc.setdefault(name, [0, 0, 0, 0.0, 0])
+                    a[0] += d.get("g", 0)
+                    a[1] += d.get("s", 0)
+                    a[2] += d.get("sh", 0)
+                    a[3] += d.get("o", 0)
+                    a[4] += 1
+    else:
+        for year in snap.years_between(first, last, list(snap.movie_years)):
+            sources.append(snap.paths[("movies", year)])
+            for name in snap.movie_years[year].get("movies") or {}:
+                idx = snap.movie_daily[(year, name)]
+                base = normalize_movie_name(name)
+                for k in idx.span(first, last):
+                    g, s, sh, o = idx.data[k][:4]
+                    a = acc.setdefault(base, [0, 0, 0, 0.0, 0])
+                    a[0] += g
+                    a[1] += s
+                    a[2] += sh
+                    a[3] += o
+                    a[4] += 1
+
+    return {"from": first, "to": last, "state": state, "top": _rank(acc, n)}, sources
+
+
+# ----------------------------
+# HTTP
+# ----------------------------
+STORE_KEY = web.AppKey("store", DataStore)
+RELOAD_INTERVAL_KEY = web.AppKey("reload_interval", float)
+RELOADER_KEY = web.AppKey("reloader", "asyncio.Task[None]")
+
+
+def make_etag(snap: Snapshot, key: str, sources: List[str]) -> str:
+    h = hashlib.sha1(key.encode("utf-8"))
+    for path in sources:
+        h.update(f"\0{path}\0{snap.u.get(path, '')}".encode("utf-8"))
+    return f'"{h.hexdigest()[:20]}"'
+
+
+def answer(query, snap: Snapshot, request: web.Request, key: str) -> Tuple[str, bytes]:
+    payload, sources = query(snap, request)
+    return make_etag(snap, key, sources), dump_json_bytes(payload)
+
+
+def endpoint(query):
+    async def handler(request: web.Request) -> web.StreamResponse:
+        store = request.app[STORE_KEY]
+        key = request.path_qs
+
+        hit = store.cached(key)
+        if hit is None:
+            # A miss scans a snapshot and serializes the result, which for
+            # wide ranges takes long enough to stall other requests, so it
+            # runs in a thread. Snapshots are never modified once built.
+            etag, body = await run_blocking(answer, query, store.snapshot, request, key)
+            store.remember(key, etag, body)
+        else:
+            etag, body = hit
+
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    return handler
+
+
+async def health(request: web.Request) -> web.Response:
+    snap = request.app[STORE_KEY].snapshot
+    return web.json_response({
+        "files": len(snap.files),
+        "movieYears": sorted(snap.movie_years),
+        "stateYears": sorted(snap.states),
+    })
+
+
+async def reload_loop(app: web.Application) -> None:
+    store = app[STORE_KEY]
+    while True:
+        await asyncio.sleep(app[RELOAD_INTERVAL_KEY])
+        try:
+            if await store.refresh():
+                print(f"reloaded: {len(store.files)} files")
+        except Exception as e:
+            print(f"reload failed: {e}")
+
+
+async def on_startup(app: web.Application) -> None:
+    await app[STORE_KEY].refresh()
+    if app[RELOAD_INTERVAL_KEY] > 0:
+        app[RELOADER_KEY] = asyncio.create_task(reload_loop(app))
+
+
+async def on_cleanup(app: web.Application) -> None:
+    task = app.get(RELOADER_KEY)
+    if task is not None:
+        task.cancel()
+
+
+def make_app(store: DataStore, reload_interval: float = DEFAULT_RELOAD_INTERVAL) -> web.Application:
+    app = web.Application()
+    app[STORE_KEY] = store
+    app[RELOAD_INTERVAL_KEY] = reload_interval
+    app.router.add_get("/health", health)
+    app.router.add_get("/movies", endpoint(q_movies))
+    app.router.add_get("/movies/{name}", endpoint(q_movie))
+    app.router.add_get(r"/states/{year:\d{4}}", endpoint(q_states))
+    app.router.add_get(r"/states/{year:\d{4}}/{state}", endpoint(q_state))
+    app.router.add_get(r"/regions/{year:\d{4}}", endpoint(q_regions))
+    app.router.add_get("/top", endpoint(q_top))
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve moviedata/ and statedata/ through a cached read API.")
+    parser.add_argument("--moviedata", type=str, default="moviedata")
+    parser.add_argument("--statedata", type=str, default="statedata")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="Responses kept in the LRU cache.")
+    parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=DEFAULT_RELOAD_INTERVAL,
+        help="Seconds between checks for replaced data files (0 disables reloading).",
+    )
+    args = parser.parse_args()
+
+    store = DataStore(args.moviedata, args.statedata, cache_size=args.cache_size)
+    web.run_app(make_app(store, args.reload_interval), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+import os
+import sqlite3
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# ----------------------------
+# Schema
+# ----------------------------
+# One SQLite file holds both datasets:
+#
+#   movies      updater.py  moviedata/<year>.json
+#   states      statedata.py  statedata/<year>/*.json, statedata/year/<year>.json
+#
+# Rows are stored at daily grain (movie_daily, state_daily) plus the
+# per-movie city/state/chain rollups of updater.py. `ingested` records
+# which days each dataset has absorbed, so re-running a day is a no-op;
+# `rebuilds` marks a year whose rebuild started on run_date and has not
+# finished yet.
+# Tables keep their rowid: exports iterate in rowid order, which is the
+# order rows were first seen, so JSON built from the store matches JSON
+# built in memory.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    dataset TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    lpd TEXT,
+    u TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (dataset, year)
+);
+
+CREATE TABLE IF NOT EXISTS rebuilds (
+    dataset TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    run_date TEXT NOT NULL,
+    PRIMARY KEY (dataset, year)
+);
+
+CREATE TABLE IF NOT EXISTS ingested (
+    dataset TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    PRIMARY KEY (dataset, day)
+);
+
+CREATE TABLE IF NOT EXISTS movies (
+    year INTEGER NOT NULL,
+    movie TEXT NOT NULL,
+    UNIQUE (year, movie)
+);
+
+CREATE TABLE IF NOT EXISTS movie_daily (
+    year INTEGER NOT NULL,
+    movie TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    gross INTEGER NOT NULL,
+    sold INTEGER NOT NULL,
+    shows INTEGER NOT NULL,
+    occ REAL NOT NULL,
+    UNIQUE (year, movie, day)
+);
+CREATE INDEX IF NOT EXISTS movie_daily_day ON movie_daily (day);
+
+CREATE TABLE IF NOT EXISTS movie_rollup (
+    year INTEGER NOT NULL,
+    movie TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    gross INTEGER NOT NULL,
+    sold INTEGER NOT NULL,
+    shows INTEGER NOT NULL,
+    occ_sum REAL NOT NULL,
+    days INTEGER NOT NULL,
+    UNIQUE (year, movie, kind, key)
+);
+CREATE INDEX IF NOT EXISTS movie_rollup_key ON movie_rollup (kind, key, year);
+
+CREATE TABLE IF NOT EXISTS state_meta (
+    year INTEGER NOT NULL,
+    state_key TEXT NOT NULL,
+    state_name TEXT NOT NULL,
+    u TEXT NOT NULL DEFAULT '',
+    UNIQUE (year, state_key)
+);
+
+CREATE TABLE IF NOT EXISTS state_daily (
+    year INTEGER NOT NULL,
+    state_key TEXT NOT NULL,
+    movie TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    g INTEGER NOT NULL,
+    s INTEGER NOT NULL,
+    sh INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    ff INTEGER NOT NULL,
+    hf INTEGER NOT NULL,
+    occ_weight REAL NOT NULL,
+    occ_count INTEGER NOT NULL,
+    UNIQUE (year, state_key, movie, day)
+);
+CREATE INDEX IF NOT EXISTS state_daily_movie ON state_daily (movie, day);
+CREATE INDEX IF NOT EXISTS state_daily_day ON state_daily (day);
+"""
+
+ROLLUP_KINDS = ("cities", "states", "chains")
+
+
+class SqlStore:
+    """
+    SQLite copy of both datasets at daily grain. Ingestion adds one day
+    at a time inside a transaction; the JSON outputs are exported from
+    the rows of a year.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    # -- bookkeeping --------------------------------------------------
+    def last_processed(self, dataset: str, year: int) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT lpd FROM meta WHERE dataset = ? AND year = ?",
+            (dataset, year),
+        ).fetchone()
+        return row[0] if row else None
+
+    def last_updated(self, dataset: str, year: int) -> str:
+        row = self.conn.execute(
+            "SELECT u FROM meta WHERE dataset = ? AND year = ?",
+            (dataset, year),
+        ).fetchone()
+        return row[0] if row else ""
+
+    def set_last_processed(self, dataset: str, year: int, lpd: str) -> None:
+        self.conn.execute(
+            "INSERT INTO meta (dataset, year, lpd) VALUES (?, ?, ?) "
+            "ON CONFLICT (dataset, year) DO UPDATE SET lpd = excluded.lpd",
+            (dataset, year, lpd),
+        )
+
+    def _touch_updated(self, dataset: str, year: int, u: str) -> None:
+        if not u:
+            return
+        self.conn.execute(
+            "INSERT INTO meta (dataset, year, u) VALUES (?, ?, ?) "
+            "ON CONFLICT (dataset, year) DO UPDATE SET u = excluded.u",
+            (dataset, year, u),
+        )
+
+    def is_ingested(self, dataset: str, day: int) -> bool:
+        return self.conn.execute(
+            "SELECT 1 FROM ingested WHERE dataset = ? AND day = ?",
+            (dataset, day),
+        ).fetchone() is not None
+
+    def ingested_days(self, dataset: str, first: int, last: int) -> set:
+        return {
+            row[0]
+            for row in self.conn.execute(
+                "SELECT day FROM ingested WHERE dataset = ? AND day BETWEEN ? AND ?",
+                (dataset, first, last),
+            )
+        }
+
+    def rebuild_started(self, dataset: str, year: int) -> Optional[str]:
+        """
+        Run date of an unfinished rebuild of `year`, if there is one.
+        """
+        row = self.conn.execute(
+            "SELECT run_date FROM rebuilds WHERE dataset = ? AND year = ?",
+            (dataset, year),
+        ).fetchone()
+        return row[0] if row else None
+
+    def begin_rebuild(self, dataset: str, year: int, run_date: str) -> None:
+        self.conn.execute(
+            "INSERT INTO rebuilds (dataset, year, run_date) VALUES (?, ?, ?) "
+            "ON CONFLICT (dataset, year) DO UPDATE SET run_date = excluded.run_date",
+            (dataset, year, run_date),
+        )
+        self.conn.commit()
+
+    def finish_rebuild(self, dataset: str, year: int) -> None:
+        self.conn.execute("DELETE FROM rebuilds WHERE dataset = ? AND year = ?", (dataset, year))
+        self.conn.commit()
+
+    def reset_year(self, dataset: str, year: int, first: int, last: int) -> None:
+        """
+        Forget everything a dataset holds for one year (current-year
+        rebuilds).
+        """
+        c = self.conn
+        if dataset == "movies":
+            for table in ("movies", "movie_daily", "movie_rollup"):
+                c.execute(f"DELETE FROM {table} WHERE year = ?", (year,))
+        else:
+            for table in ("state_meta", "state_daily"):
+                c.execute(f"DELETE FROM {table} WHERE year = ?", (year,))
+        c.execute("DELETE FROM meta WHERE dataset = ? AND year = ?", (dataset, year))
+        c.execute(
+            "DELETE FROM ingested WHERE dataset = ? AND day BETWEEN ? AND ?",
+            (dataset, first, last),
+        )
+        c.commit()
+
+    # -- movies (updater.py) ------------------------------------------
+    def ingest_movie_day(self, year: int, day: int, day_db: Dict[str, Any]) -> bool:
+        """
+        Add one day processed into an otherwise empty updater DB. The
+        day's city/state/chain stats are added onto the year rollups.
+        Returns False if the day was already ingested.
+        """
+        if self.is_ingested("movies", day):
+            return False
+
+        c = self.conn
+        for movie_name, movie in day_db["movies"].items():
+            c.execute("INSERT OR IGNORE INTO movies (year, movie) VALUES (?, ?)", (year, movie_name))
+
+            value = movie["daily"].get(day)
+            if value is not None:
+                c.execute(
+                    "INSERT OR REPLACE INTO movie_daily (year, movie, day, gross, sold, shows, occ) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (year, movie_name, day, *value),
+                )
+
+            for kind in ROLLUP_KINDS:
+                c.executemany(
+                    "INSERT INTO movie_rollup (year, movie, kind, key, gross, sold, shows, occ_sum, days) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (year, movie, kind, key) DO UPDATE SET "
+                    "gross = gross + excluded.gross, "
+                    "sold = sold + excluded.sold, "
+                    "shows = shows + excluded.shows, "
+                    "occ_sum = round(occ_sum + excluded.occ_sum, 2), "
+                    "days = days + excluded.days",
+                    [
+                        (year, movie_name, kind, key, st["gross"], st["sold"], st["shows"], st["occSum"], st["days"])
+                        for key, st in movie.get(kind, {}).items()
+                    ],
+                )
+
+        self._touch_updated("movies", year, day_db.get("last_updated", ""))
+        c.execute("INSERT INTO ingested (dataset, day) VALUES ('movies', ?)", (day,))
+        return True
+
+    def movie_names(self, year: int) -> Iterator[str]:
+        for row in self.conn.execute("SELECT movie FROM movies WHERE year = ? ORDER BY rowid", (year,)):
+            yield row[0]
+
+    def movie_daily(self, year: int) -> Iterator[Tuple[str, int, list]]:
+        for movie, day, g, s, sh, o in self.conn.execute(
+            "SELECT movie, day, gross, sold, shows, occ FROM movie_daily WHERE year = ? ORDER BY day, rowid",
+            (year,),
+        ):
+            yield movie, day, [g, s, sh, o]
+
+    def movie_rollups(self, year: int) -> Iterator[Tuple[str, str, str, Dict[str, Any]]]:
+        for movie, kind, key, gross, sold, shows, occ_sum, days in self.conn.execute(
+            "SELECT movie, kind, key, gross, sold, shows, occ_sum, days FROM movie_rollup "
+            "WHERE year = ? ORDER BY rowid",
+            (year,),
+        ):
+            yield movie, kind, key, {
+                "gross": gross,
+                "sold": sold,
+                "shows": shows,
+                "occSum": occ_sum,
+                "days": days,
+            }
+
+    # -- states (statedata.py) ----------------------------------------
+    def ingest_state_day(
+        self,
+        year: int,
+        day: int,
+        state_dbs: Dict[str, Dict[str, Any]],
+    ) -> bool:
+        """
+        Add one day processed into otherwise empty state DBs (internal
+        rollup form). Returns False if the day was already ingested.
+        """
+        if self.is_ingested("states", day):
+            return False
+
+        c = self.conn
+        for state_key, state_db in state_dbs.items():
+            c.execute(
+                "INSERT INTO state_meta (year, state_key, state_name, u) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (year, state_key) DO UPDATE SET "
+                "state_name = excluded.state_name, "
+                "u = CASE WHEN excluded.u != '' THEN excluded.u ELSE u END",
+                (year, state_key, state_db.get("s", ""), state_db.get("u", "")),
+            )
+            self._touch_updated("states", year, state_db.get("u", ""))
+
+            rows = []
+            for movie_name, movie in state_db["movies"].items():
+                r = movie["d"].get(day)
+                if r is None:
+                    continue
+                rows.append((
+                    year, state_key, movie_name, day,
+                    r["g"], r["s"], r["sh"], r["ts"], r["ff"], r["hf"],
+                    r["_occ_weight"], r["_occ_count"],
+                ))
+
+            c.executemany(
+                "INSERT OR REPLACE INTO state_daily "
+                "(year, state_key, movie, day, g, s, sh, ts, ff, hf, occ_weight, occ_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+        c.execute("INSERT INTO ingested (dataset, day) VALUES ('states', ?)", (day,))
+        return True
+
+    def states(self, year: int) -> Iterator[Tuple[str, str, str]]:
+        for row in self.conn.execute(
+            "SELECT state_key, state_name, u FROM state_meta WHERE year = ? ORDER BY state_key",
+            (year,),
+        ):
+            yield row
+
+    def state_daily(self, year: int) -> Iterator[Tuple[str, str, int, Dict[str, Any]]]:
+        for (state_key, movie, day, g, s, sh, ts, ff, hf, occ_weight, occ_count) in self.conn.execute(
+            "SELECT state_key, movie, day, g, s, sh, ts, ff, hf, occ_weight, occ_count "
+            "FROM state_daily WHERE year = ? ORDER BY day, rowid",
+            (year,),
+        ):
+            yield state_key, movie, day, {
+                "g": g,
+                "s": s,
+                "sh": sh,
+                "ts": ts,
+                "ff": ff,
+                "hf": hf,
+                "_occ_weight": occ_weight,
+                "_occ_count": occ_count,
+            }
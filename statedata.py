@@ -3,15 +3,55 @@ import asyncio
 import datetime as dt
 import json
 import os
+import pickle
 import re
-import unicodedata
+import time
+import zlib
 from collections import defaultdict
-from typing import Any, Dict, List, Optional, Tuple
-
-import aiohttp
-import pytz
-
-IST = pytz.timezone("Asia/Kolkata")
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from archive import Archive
+from dayseries import DaySeries, day_date, day_key, epoch_day
+from diagnostics import MemoryBudgetExceeded, MemoryReport, StageMonitor, StageProfiler
+from fileio import (
+    NDJSON_EXT,
+    atomic_write_bytes,
+    convert_layout,
+    dump_document_bytes,
+    dump_json_bytes,
+    is_output_file,
+    load_document,
+    parse_compress_formats,
+    remove_output,
+    slugify_filename,
+    stored_path,
+    swap_layout,
+    write_json_batch,
+)
+from manifest import YearManifest
+from payloads import parse_daily_payload
+from regions import RegionMap
+from routing import (
+    DEFAULT_CACHE_DIR,
+    MISSING_STATUSES,
+    LatencyTracker,
+    LazyClientSession,
+    NegativeCache,
+    RoutingTable,
+    hedged,
+    negative_cache_path,
+    negative_ttl,
+    routing_table_path,
+)
+from sqlstore import SqlStore
+from synthetic import SyntheticConfig, scratch_output_dir, synthetic_text
+
+try:
+    IST = ZoneInfo("Asia/Kolkata")
+except ZoneInfoNotFoundError:
+    # No tz database on this machine; India has had no DST since 1945.
+    IST = dt.timezone(dt.timedelta(hours=5, minutes=30), "IST")
 
 # ----------------------------
 # Tunables
@@ -23,6 +63,49 @@ DEFAULT_RETRIES = 3
 DEFAULT_RETRY_BACKOFF = 0.75
 DEFAULT_MIN_MOVIE_DAY_GROSS = 100000
 REBUILD_CURRENT_YEAR_BY_DEFAULT = True
+HEDGE_BY_DEFAULT = True
+DEFAULT_CHECKPOINT_EVERY = 60
+REGION_TOP_MOVIES = 10
+
+# Observed latency of the first-choice host; its p95 is the hedge delay.
+PRIMARY_LATENCY = LatencyTracker()
+
+# Per-date winning host and per-host health, persisted under --cache-dir.
+ROUTES = RoutingTable()
+
+# Dates every source reported as missing, persisted under --cache-dir.
+NEGATIVE = NegativeCache()
+
+# Optional packed copy of raw upstream payloads (--archive-dir). Settled
+# days are read from it instead of HTTP and fetched days are appended;
+# with --offline it is the only source.
+ARCHIVE: Optional[Archive] = None
+OFFLINE = False
+
+# --synthetic: generated payloads (see synthetic.py) replace every fetch.
+SYNTHETIC: Optional[SyntheticConfig] = None
+
+# Output extension: ".json", or ".ndjson" (--ndjson) for one movie per line
+# under a header line; see fileio.dump_ndjson_bytes.
+OUTPUT_EXT = ".json"
+STATE_COLLECTIONS = ("movies",)
+
+# State -> region -> nation hierarchy (regions.json, or --regions) behind
+# the yearly summary's "regions" and "geo" rollups.
+REGIONS = RegionMap.load()
+
+# Optional SQLite copy of the data at daily grain (--sqlite). When set,
+# days are ingested into it and the JSON outputs are exported from it.
+STORE: Optional[SqlStore] = None
+
+# <output-dir>/manifest.json: per-year last processed date, hash of the
+# yearly summary and status, so closed years are settled without opening
+# any of their files.
+MANIFEST: Optional[YearManifest] = None
+
+# Stage boundaries (fetch, aggregate, checkpoint, export, finalize, save) for
+# --memory-report and --profile.
+STAGES = StageMonitor()
 
 
 # ----------------------------
@@ -49,6 +132,9 @@ def normalize_spaces(text: str) -> str:
 
 
 def normalize_movie_name(name: str) -> str:
+    # Only the last bracketed suffix is dropped, and runs of whitespace are
+    # collapsed; the state files are keyed by this, so it is not
+    # payloads.normalize_movie_name.
     return normalize_spaces(re.sub(r"\s*\[[^\]]*\]\s*$", "", name or ""))
 
 
@@ -56,44 +142,68 @@ def normalize_state_name(name: str) -> str:
     return normalize_spaces(name or "")
 
 
-def slugify_filename(text: str) -> str:
-    text = unicodedata.normalize("NFKD", text or "")
-    text = text.encode("ascii", "ignore").decode("ascii")
-    text = text.lower()
-    text = re.sub(r"[^a-z0-9]+", "-", text)
-    text = re.sub(r"-{2,}", "-", text).strip("-")
-    return text or "unknown"
-
-
 # ----------------------------
 # File helpers
 # ----------------------------
-def atomic_write_json(path: str, payload: Dict[str, Any]) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    tmp = path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
-        f.flush()
-        os.fsync(f.fileno())
-    os.replace(tmp, path)
+def atomic_write_json(path: str, payload: Dict[str, Any], compress: Sequence[str] = ()) -> None:
+    atomic_write_bytes(path, dump_json_bytes(payload), compress=compress)
 
 
-def clear_dir_json(year_dir: str) -> None:
+def prune_year_dir(year_dir: str, keep: Sequence[str]) -> None:
+    # Remove outputs (and their compressed siblings) of states that are no
+    # longer produced; called after a rebuild has written its new files.
     if not os.path.isdir(year_dir):
         return
+    keep = set(keep)
     for fn in os.listdir(year_dir):
-        if fn.endswith(".json") or fn.endswith(".json.tmp"):
-            try:
-                os.remove(os.path.join(year_dir, fn))
-            except OSError:
-                pass
+        ext = NDJSON_EXT if is_output_file(fn, NDJSON_EXT) else ".json"
+        if not is_output_file(fn, ext):
+            continue
+        base = fn[:fn.index(ext) + len(ext)]
+        if base in keep and not fn.endswith(".tmp"):
+            continue
+        try:
+            os.remove(os.path.join(year_dir, fn))
+        except OSError:
+            pass
 
 
-def clear_summary_file(output_root: str, year: int) -> None:
-    path = os.path.join(output_root, "year", f"{year}.json")
+# ----------------------------
+# Checkpoints
+# ----------------------------
+def checkpoint_path(cache_dir: str, year: int) -> str:
+    return os.path.join(cache_dir, "checkpoints", f"statedata-{year}.ckpt")
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]) -> None:
+    atomic_write_bytes(path, zlib.compress(pickle.dumps(checkpoint, pickle.HIGHEST_PROTOCOL), 6))
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
     try:
-        if os.path.exists(path):
-            os.remove(path)
+        with open(path, "rb") as f:
+            return pickle.loads(zlib.decompress(f.read()))
+    except Exception:
+        return None
+
+
+def checkpoint_is_current(ckpt: Dict[str, Any], run_date: str) -> bool:
+    """
+    A checkpoint from today's run is always usable. One from an earlier
+    day is only if it is not a rebuild and every day it holds is settled;
+    recent days may have changed upstream since, and they are already
+    folded into its totals, so they cannot be dropped one by one.
+    """
+    if ckpt.get("run_date") == run_date:
+        return True
+    if ckpt.get("rebuild"):
+        return False
+    return all(is_more_than_one_month_old(ds) for ds in ckpt.get("done") or ())
+
+
+def drop_checkpoint(path: str) -> None:
+    try:
+        os.remove(path)
     except OSError:
         pass
 
@@ -101,9 +211,13 @@ def clear_summary_file(output_root: str, year: int) -> None:
 # ----------------------------
 # URL routing
 # ----------------------------
+def one_month_cutoff() -> str:
+    return (today_ist() - dt.timedelta(days=31)).isoformat()
+
+
 def is_more_than_one_month_old(date_str: str) -> bool:
-    d = dt.datetime.strptime(date_str, "%Y-%m-%d").date()
-    return (today_ist() - d).days > 31
+    # ISO dates order lexicographically, so no strptime per call.
+    return date_str < one_month_cutoff()
 
 
 def get_urls(date_str: str):
@@ -171,8 +285,11 @@ def empty_rollup() -> Dict[str, Any]:
 
 
 def add_rollup(bucket: Dict[str, Any], row: Dict[str, Any]) -> None:
-    row = normalize_source_row(row)
+    add_short_row(bucket, normalize_source_row(row))
+
 
+def add_short_row(bucket: Dict[str, Any], row: Dict[str, Any]) -> None:
+    # `row` must already be in normalize_source_row() form.
     g = row["g"]
     s = row["s"]
     sh = row["sh"]
@@ -195,6 +312,32 @@ def add_rollup(bucket: Dict[str, Any], row: Dict[str, Any]) -> None:
     bucket["_occ_count"] += 1
 
 
+def merge_rollup(bucket: Dict[str, Any], other: Dict[str, Any]) -> None:
+    bucket["g"] += other["g"]
+    bucket["s"] += other["s"]
+    bucket["sh"] += other["sh"]
+    bucket["ts"] += other["ts"]
+    bucket["ff"] += other["ff"]
+    bucket["hf"] += other["hf"]
+    bucket["_occ_weight"] += other["_occ_weight"]
+    bucket["_occ_count"] += other["_occ_count"]
+
+
+def merge_region_rollup(container: Dict[str, Any], region: str, bucket: Dict[str, Any]) -> None:
+    merge_rollup(container.setdefault(region, empty_rollup()), bucket)
+
+
+def rank_rollups(buckets: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        k: finalize_rollup(v)
+        for k, v in sorted(buckets.items(), key=lambda kv: kv[1]["g"], reverse=True)
+    }
+
+
+def is_rollup(value: Any) -> bool:
+    return isinstance(value, dict) and "_occ_weight" in value
+
+
 def finalize_rollup(bucket: Dict[str, Any]) -> Dict[str, Any]:
     ts = int(bucket["ts"])
     if ts > 0:
@@ -216,6 +359,9 @@ def finalize_rollup(bucket: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def normalize_day_entry(day: Any) -> Dict[str, Any]:
+    if is_rollup(day):
+        return day
+
     if isinstance(day, list):
         g = safe_int(day[0]) if len(day) > 0 else 0
         s = safe_int(day[1]) if len(day) > 1 else 0
@@ -256,6 +402,9 @@ def normalize_day_entry(day: Any) -> Dict[str, Any]:
 
 
 def normalize_totals_entry(src: Any) -> Dict[str, Any]:
+    if is_rollup(src):
+        return src
+
     if not isinstance(src, dict):
         return empty_rollup()
 
@@ -282,10 +431,14 @@ def normalize_totals_entry(src: Any) -> Dict[str, Any]:
 # ----------------------------
 # State DB structure
 # ----------------------------
+# Movie buckets are normalized exactly once, when a file is loaded (or the
+# bucket is created). The "_n" marker says a bucket is already in internal
+# form, so hot paths can use it directly instead of rebuilding every day.
 def empty_movie_bucket() -> Dict[str, Any]:
     return {
-        "d": {},
+        "d": DaySeries(),
         "_t": empty_rollup(),
+        "_n": True,
     }
 
 
@@ -293,19 +446,16 @@ def normalize_movie_entry(movie: Any) -> Dict[str, Any]:
     if not isinstance(movie, dict):
         return empty_movie_bucket()
 
+    if movie.get("_n"):
+        return movie
+
     if "d" in movie and "_t" in movie:
-        movie["d"] = {
-            dk: normalize_day_entry(dv)
-            for dk, dv in (movie.get("d") or {}).items()
-        }
+        movie["d"] = DaySeries.from_dict(movie.get("d"), normalize_day_entry)
         movie["_t"] = normalize_totals_entry(movie.get("_t"))
+        movie["_n"] = True
         return movie
 
-    dsrc = movie.get("daily") or movie.get("d") or {}
-    daily: Dict[str, Any] = {}
-    if isinstance(dsrc, dict):
-        for dk, dv in dsrc.items():
-            daily[dk] = normalize_day_entry(dv)
+    daily = DaySeries.from_dict(movie.get("daily") or movie.get("d"), normalize_day_entry)
 
     totals_src = movie.get("totals") or movie.get("_t") or {}
     totals = normalize_totals_entry(totals_src)
@@ -313,11 +463,12 @@ def normalize_movie_entry(movie: Any) -> Dict[str, Any]:
     if daily:
         totals = empty_rollup()
         for dv in daily.values():
-            add_rollup(totals, dv)
+            merge_rollup(totals, dv)
 
     return {
         "d": daily,
         "_t": totals,
+        "_n": True,
     }
 
 
@@ -334,48 +485,124 @@ def empty_state_db(year: int, state_name: str, state_key: str) -> Dict[str, Any]
     }
 
 
-def load_existing_state_dbs(output_root: str, year: int) -> Dict[str, Dict[str, Any]]:
-    year_dir = os.path.join(output_root, str(year))
-    if not os.path.isdir(year_dir):
-        return {}
+def load_state_db_file(path: str) -> Optional[Dict[str, Any]]:
+    fn = os.path.splitext(os.path.basename(path))[0]
+    try:
+        db = load_document(path, STATE_COLLECTIONS)
 
-    out: Dict[str, Dict[str, Any]] = {}
+        db.setdefault("_m", {"lpd": None})
+        db.setdefault("u", "")
+        db.setdefault("s", db.get("s", ""))
+        db.setdefault("k", db.get("k", slugify_filename(db.get("s", fn))))
+        db.setdefault("movies", {})
 
-    for fn in os.listdir(year_dir):
-        if not fn.endswith(".json"):
-            continue
+        normalized_movies = {}
+        for movie_name, movie in db["movies"].items():
+            normalized_movies[movie_name] = normalize_movie_entry(movie)
 
-        path = os.path.join(year_dir, fn)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                db = json.load(f)
+        db["movies"] = normalized_movies
+        return db
 
-            db.setdefault("_m", {"lpd": None})
-            db.setdefault("u", "")
-            db.setdefault("s", db.get("s", ""))
-            db.setdefault("k", db.get("k", slugify_filename(db.get("s", fn[:-5]))))
-            db.setdefault("movies", {})
+    except Exception:
+        return None
 
-            normalized_movies = {}
-            for movie_name, movie in db["movies"].items():
-                normalized_movies[movie_name] = normalize_movie_entry(movie)
 
-            db["movies"] = normalized_movies
-            out[db["k"]] = db
+LPD_HEADER_RE = re.compile(r'"_m"\s*:\s*\{\s*"lpd"\s*:\s*(?:null|"(\d{4}-\d{2}-\d{2})")')
 
-        except Exception:
-            continue
 
-    return out
+def peek_state_lpd(path: str) -> Tuple[bool, Optional[str]]:
+    # State and year files are written header-first ({"y",["s","k",]"u",
+    # "_m",...}), so the last processed date sits in the first few hundred
+    # bytes.
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            head = f.read(4096)
+    except OSError:
+        return False, None
+
+    m = LPD_HEADER_RE.search(head)
+    if not m:
+        return False, None
+    return True, m.group(1)
+
+
+class LazyStateDbs:
+    """
+    State DBs of one year keyed by state key. Existing files are only
+    listed up front; a file is parsed and normalized the first time its
+    state is requested, so states that receive no new rows are never
+    loaded (and never rewritten).
+    """
+
+    def __init__(self, year_dir: Optional[str]) -> None:
+        self._paths: Dict[str, str] = {}
+        self._dbs: Dict[str, Dict[str, Any]] = {}
+
+        if year_dir and os.path.isdir(year_dir):
+            for fn in sorted(os.listdir(year_dir)):
+                state_key, ext = os.path.splitext(fn)
+                if ext not in (".json", NDJSON_EXT):
+                    continue
+                # Both layouts present (a switch mid-way): the current one wins.
+                if state_key in self._paths and ext != OUTPUT_EXT:
+                    continue
+                self._paths[state_key] = os.path.join(year_dir, fn)
+
+    def __contains__(self, state_key: str) -> bool:
+        return state_key in self._dbs or state_key in self._paths
+
+    def __len__(self) -> int:
+        return len(self._dbs) + len(self._paths)
+
+    def get(self, state_key: str) -> Optional[Dict[str, Any]]:
+        if state_key in self._dbs:
+            return self._dbs[state_key]
+
+        path = self._paths.pop(state_key, None)
+        if path is None:
+            return None
+
+        db = load_state_db_file(path)
+        if db is None:
+            return None
+
+        self._dbs[state_key] = db
+        return db
+
+    def __setitem__(self, state_key: str, db: Dict[str, Any]) -> None:
+        self._paths.pop(state_key, None)
+        self._dbs[state_key] = db
+
+    def loaded(self) -> Dict[str, Dict[str, Any]]:
+        return self._dbs
+
+    def last_processed_dates(self) -> List[str]:
+        out = []
+        for db in self._dbs.values():
+            lpd = db.get("_m", {}).get("lpd")
+            if lpd:
+                out.append(lpd)
+
+        for state_key in list(self._paths):
+            found, lpd = peek_state_lpd(self._paths[state_key])
+            if not found:
+                db = self.get(state_key)
+                lpd = db.get("_m", {}).get("lpd") if db else None
+            if lpd:
+                out.append(lpd)
+
+        return out
+
+
+def load_existing_state_dbs(output_root: str, year: int) -> LazyStateDbs:
+    return LazyStateDbs(os.path.join(output_root, str(year)))
 
 
 def ensure_state_movie(state_db: Dict[str, Any], movie_name: str) -> Dict[str, Any]:
-    movies = state_db["movies"]
-    if movie_name not in movies:
-        movies[movie_name] = empty_movie_bucket()
-    else:
-        movies[movie_name] = normalize_movie_entry(movies[movie_name])
-    return movies[movie_name]
+    movie = state_db["movies"].get(movie_name)
+    if movie is None:
+        movie = state_db["movies"][movie_name] = empty_movie_bucket()
+    return movie
 
 
 # ----------------------------
@@ -385,6 +612,7 @@ def empty_year_movie_bucket() -> Dict[str, Any]:
     return {
         "t": empty_rollup(),
         "_states": {},
+        "_n": True,
     }
 
 
@@ -392,12 +620,16 @@ def normalize_year_movie_entry(movie: Any) -> Dict[str, Any]:
     if not isinstance(movie, dict):
         return empty_year_movie_bucket()
 
+    if movie.get("_n"):
+        return movie
+
     if "t" in movie and "_states" in movie:
         movie["t"] = normalize_totals_entry(movie.get("t"))
         movie["_states"] = {
             state_name: normalize_totals_entry(stats)
             for state_name, stats in (movie.get("_states") or {}).items()
         }
+        movie["_n"] = True
         return movie
 
     totals = normalize_totals_entry(movie.get("t") or movie.get("totals") or movie.get("_t"))
@@ -410,6 +642,7 @@ def normalize_year_movie_entry(movie: Any) -> Dict[str, Any]:
     return {
         "t": totals,
         "_states": states,
+        "_n": True,
     }
 
 
@@ -425,13 +658,12 @@ def empty_year_db(year: int) -> Dict[str, Any]:
 
 
 def load_existing_year_db(output_root: str, year: int) -> Dict[str, Any]:
-    path = os.path.join(output_root, "year", f"{year}.json")
+    path = stored_path(year_db_path(output_root, year))
     if not os.path.exists(path):
         return empty_year_db(year)
 
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            db = json.load(f)
+        db = load_document(path, STATE_COLLECTIONS)
     except Exception:
         return empty_year_db(year)
 
@@ -448,12 +680,10 @@ def load_existing_year_db(output_root: str, year: int) -> Dict[str, Any]:
 
 
 def ensure_year_movie(year_db: Dict[str, Any], movie_name: str) -> Dict[str, Any]:
-    movies = year_db["movies"]
-    if movie_name not in movies:
-        movies[movie_name] = empty_year_movie_bucket()
-    else:
-        movies[movie_name] = normalize_year_movie_entry(movies[movie_name])
-    return movies[movie_name]
+    movie = year_db["movies"].get(movie_name)
+    if movie is None:
+        movie = year_db["movies"][movie_name] = empty_year_movie_bucket()
+    return movie
 
 
 # ----------------------------
@@ -467,17 +697,32 @@ def fetch_headers() -> Dict[str, str]:
 
 
 async def fetch_json(
-    session: aiohttp.ClientSession,
+    session: LazyClientSession,
     url: str,
     retries: int = DEFAULT_RETRIES,
+    statuses: Optional[Dict[str, int]] = None,
+    loads: Callable[[str], Any] = json.loads,
 ) -> Optional[Dict[str, Any]]:
+    # `statuses` receives the outcome of the last attempt per URL: the HTTP
+    # status, 0 for a body that is not JSON, -1 for a transport error.
     for attempt in range(retries):
+        if statuses is not None:
+            statuses[url] = -1
         try:
             async with session.get(url, headers=fetch_headers()) as resp:
+                if statuses is not None:
+                    statuses[url] = resp.status
+                if resp.status in MISSING_STATUSES:
+                    return None
                 if resp.status != 200:
                     raise RuntimeError(f"HTTP {resp.status}")
                 text = await resp.text()
-                return json.loads(text)
+                try:
+                    return loads(text)
+                except ValueError:
+                    if statuses is not None:
+                        statuses[url] = 0
+                    raise
         except Exception:
             if attempt + 1 >= retries:
                 return None
@@ -485,19 +730,72 @@ async def fetch_json(
     return None
 
 
-async def fetch_day(session: aiohttp.ClientSession, date_str: str) -> Tuple[str, Optional[Dict[str, Any]]]:
-    url, fallback = get_urls(date_str)
-
-    payload = await fetch_json(session, url)
-    if payload:
-        return date_str, payload
+async def fetch_day(
+    session: LazyClientSession,
+    date_str: str,
+    hedge: bool = HEDGE_BY_DEFAULT,
+    min_movie_day_gross: int = DEFAULT_MIN_MOVIE_DAY_GROSS,
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    # Detail rows of movies under the threshold are never decoded.
+    def loads(text: str) -> Dict[str, Any]:
+        return parse_daily_payload(text, min_movie_day_gross, normalize_movie_name)
+
+    if SYNTHETIC is not None:
+        return date_str, loads(synthetic_text(date_str, SYNTHETIC))
+
+    settled = is_more_than_one_month_old(date_str)
+
+    if ARCHIVE is not None:
+        text = ARCHIVE.get_text(date_str, settled_only=not OFFLINE)
+        if text is not None:
+            return date_str, loads(text)
+
+    if OFFLINE or NEGATIVE.is_missing(date_str):
+        return date_str, None
+
+    url, fallback = ROUTES.order(date_str, *get_urls(date_str))
+    statuses: Dict[str, int] = {}
+
+    async def fetch_from(source: str) -> Optional[Dict[str, Any]]:
+        raw: List[str] = []
+
+        def keep_raw(text: str) -> Dict[str, Any]:
+            raw.append(text)
+            return loads(text)
+
+        started = time.perf_counter()
+        payload = await fetch_json(session, source, statuses=statuses, loads=keep_raw)
+        ROUTES.record(source, bool(payload), time.perf_counter() - started)
+        if payload and fallback != url:
+            ROUTES.remember(date_str, source)
+        if payload and ARCHIVE is not None:
+            ARCHIVE.put_text(date_str, raw[-1], settled)
+        return payload
+
+    if hedge and fallback != url:
+        payload = await hedged(
+            lambda: fetch_from(url),
+            lambda: fetch_from(fallback),
+            PRIMARY_LATENCY,
+        )
+    else:
+        payload = await fetch_from(url)
+        if not payload and fallback != url:
+            payload = await fetch_from(fallback)
 
-    if fallback != url:
-        payload = await fetch_json(session, fallback)
+    if not payload:
+        note_missing(date_str, statuses)
 
     return date_str, payload
 
 
+def note_missing(date_str: str, statuses: Dict[str, int]) -> None:
+    # Timeouts and 5xx get a TTL of 0 and are retried on the next run.
+    ttl = negative_ttl(date_str, statuses.values(), today_ist().isoformat(), one_month_cutoff())
+    if ttl:
+        NEGATIVE.add(date_str, ttl)
+
+
 # ----------------------------
 # Core processing
 # ----------------------------
@@ -512,20 +810,20 @@ def build_base_gross_map(payload: Dict[str, Any]) -> Dict[str, int]:
 def add_state_day(
     state_db: Dict[str, Any],
     movie_name: str,
-    date_key: str,
+    day_num: int,
     rows: List[Dict[str, Any]],
     payload_last_updated: str,
 ) -> None:
     movie = ensure_state_movie(state_db, movie_name)
-    day = movie["d"].setdefault(date_key, empty_rollup())
+    day = movie["d"].slot(day_num, empty_rollup)
 
     if payload_last_updated:
         state_db["u"] = payload_last_updated
 
     for row in rows:
         row = normalize_source_row(row)
-        add_rollup(day, row)
-        add_rollup(movie["_t"], row)
+        add_short_row(day, row)
+        add_short_row(movie["_t"], row)
 
 
 def add_year_state_day(
@@ -543,22 +841,22 @@ def add_year_state_day(
         state_bucket = movie["_states"].setdefault(state_name, empty_rollup())
         for row in rows:
             row = normalize_source_row(row)
-            add_rollup(state_bucket, row)
-            add_rollup(movie["t"], row)
+            add_short_row(state_bucket, row)
+            add_short_row(movie["t"], row)
 
 
 def process_day_into_states_and_year(
     year: int,
     date_str: str,
     payload: Dict[str, Any],
-    state_dbs: Dict[str, Dict[str, Any]],
+    state_dbs: LazyStateDbs,
     year_db: Dict[str, Any],
     min_movie_day_gross: int,
 ) -> None:
     if not payload or "movies" not in payload:
         return
 
-    date_key = date_str.replace("-", "")
+    day_num = epoch_day(date_str)
     payload_last_updated = payload.get("last_updated", "")
 
     base_gross = build_base_gross_map(payload)
@@ -583,13 +881,15 @@ def process_day_into_states_and_year(
         # State-wise files: daywise only, no city breakdown stored.
         for state_name, rows in state_rows.items():
             state_key = slugify_filename(state_name)
-            if state_key not in state_dbs:
-                state_dbs[state_key] = empty_state_db(year, state_name, state_key)
+            state_db = state_dbs.get(state_key)
+            if state_db is None:
+                state_db = empty_state_db(year, state_name, state_key)
+                state_dbs[state_key] = state_db
 
             add_state_day(
-                state_db=state_dbs[state_key],
+                state_db=state_db,
                 movie_name=base_name,
-                date_key=date_key,
+                day_num=day_num,
                 rows=rows,
                 payload_last_updated=payload_last_updated,
             )
@@ -609,12 +909,11 @@ def finalize_state_db(state_db: Dict[str, Any]) -> None:
     for movie_name, movie in state_db["movies"].items():
         movie = normalize_movie_entry(movie)
 
-        daily = movie.get("d") or {}
         finalized_daily: Dict[str, Any] = {}
         total = normalize_totals_entry(movie.get("_t"))
 
-        for date_key in sorted(daily.keys()):
-            day = normalize_day_entry(daily[date_key])
+        # Series iterate in date order; string keys are made only here.
+        for day_num, day in movie["d"].items():
 
             ts = int(day["ts"])
             if ts > 0:
@@ -624,7 +923,7 @@ def finalize_state_db(state_db: Dict[str, Any]) -> None:
             else:
                 o = 0.0
 
-            finalized_daily[date_key] = {
+            finalized_daily[day_key(day_num)] = {
                 "g": int(day["g"]),
                 "s": int(day["s"]),
                 "sh": int(day["sh"]),
@@ -670,6 +969,13 @@ def finalize_state_db(state_db: Dict[str, Any]) -> None:
 def finalize_year_db(year_db: Dict[str, Any]) -> None:
     final_movies: Dict[str, Any] = {}
 
+    # Nation/region/state totals and per-region movie boards, gathered in
+    # the same pass over the movies.
+    nation = empty_rollup()
+    region_totals: Dict[str, Any] = {}
+    region_states: Dict[str, Dict[str, Any]] = {}
+    region_boards: Dict[str, List[List[Any]]] = {}
+
     for movie_name, movie in year_db["movies"].items():
         movie = normalize_year_movie_entry(movie)
 
@@ -705,6 +1011,17 @@ def finalize_year_db(year_db: Dict[str, Any]) -> None:
                 "o": s_o,
             }
 
+        regions = REGIONS.rollup(states, merge_region_rollup)
+
+        merge_rollup(nation, total)
+        for state_name, stats in states.items():
+            by_state = region_states.setdefault(REGIONS.region(state_name), {})
+            merge_rollup(by_state.setdefault(state_name, empty_rollup()), normalize_totals_entry(stats))
+        for region, bucket in regions.items():
+            merge_rollup(region_totals.setdefault(region, empty_rollup()), bucket)
+            final = finalize_rollup(bucket)
+            region_boards.setdefault(region, []).append([movie_name, final["g"], final["s"], final["sh"], final["o"]])
+
         final_movies[movie_name] = {
             "t": {
                 "g": int(total["g"]),
@@ -722,6 +1039,7 @@ def finalize_year_db(year_db: Dict[str, Any]) -> None:
                     reverse=True,
                 )
             ),
+            "regions": rank_rollups(regions),
         }
 
     year_db["movies"] = dict(
@@ -732,39 +1050,160 @@ def finalize_year_db(year_db: Dict[str, Any]) -> None:
         )
     )
 
+    geo_regions: Dict[str, Any] = {}
+    for region, bucket in sorted(region_totals.items(), key=lambda kv: kv[1]["g"], reverse=True):
+        board = sorted(region_boards.get(region, []), key=lambda r: r[1], reverse=True)
+        geo_regions[region] = {
+            "t": finalize_rollup(bucket),
+            "states": rank_rollups(region_states.get(region, {})),
+            "top": board[:REGION_TOP_MOVIES],
+        }
+
+    year_db["geo"] = {
+        "n": REGIONS.nation,
+        "t": finalize_rollup(nation),
+        "regions": geo_regions,
+    }
+
     if not year_db.get("u"):
         year_db["u"] = now_ist_str()
 
 
-def save_state_db(output_root: str, year: int, state_db: Dict[str, Any]) -> str:
-    year_dir = os.path.join(output_root, str(year))
-    os.makedirs(year_dir, exist_ok=True)
+# ----------------------------
+# SQLite store
+# ----------------------------
+def ingest_day(year: int, date_str: str, payload: Dict[str, Any], min_movie_day_gross: int) -> None:
+    # The day goes through the normal aggregation into empty DBs, and
+    # their rows are what the store takes in.
+    day_states = LazyStateDbs(None)
+    process_day_into_states_and_year(
+        year=year,
+        date_str=date_str,
+        payload=payload,
+        state_dbs=day_states,
+        year_db=empty_year_db(year),
+        min_movie_day_gross=min_movie_day_gross,
+    )
+    STORE.ingest_state_day(year, epoch_day(date_str), day_states.loaded())
 
-    path = os.path.join(year_dir, f"{state_db['k']}.json")
-    atomic_write_json(path, state_db)
-    return path
 
+def export_year_from_store(year: int) -> Tuple[LazyStateDbs, Dict[str, Any]]:
+    state_dbs = LazyStateDbs(None)
+    names: Dict[str, str] = {}
+    for state_key, state_name, u in STORE.states(year):
+        state_db = empty_state_db(year, state_name, state_key)
+        state_db["u"] = u
+        state_dbs[state_key] = state_db
+        names[state_key] = state_name
 
-def save_year_db(output_root: str, year: int, year_db: Dict[str, Any]) -> str:
-    year_dir = os.path.join(output_root, "year")
-    os.makedirs(year_dir, exist_ok=True)
+    year_db = empty_year_db(year)
+    year_db["u"] = STORE.last_updated("states", year)
 
-    path = os.path.join(year_dir, f"{year}.json")
-    atomic_write_json(path, year_db)
-    return path
+    for state_key, movie_name, day_num, rollup in STORE.state_daily(year):
+        movie = ensure_state_movie(state_dbs.get(state_key), movie_name)
+        movie["d"].set(day_num, rollup)
+        merge_rollup(movie["_t"], rollup)
 
+        year_movie = ensure_year_movie(year_db, movie_name)
+        merge_rollup(year_movie["_states"].setdefault(names[state_key], empty_rollup()), rollup)
+        merge_rollup(year_movie["t"], rollup)
 
-def get_year_start_for_update(
+    return state_dbs, year_db
+
+
+def state_db_path(output_root: str, year: int, state_db: Dict[str, Any]) -> str:
+    return os.path.join(output_root, str(year), f"{state_db['k']}{OUTPUT_EXT}")
+
+
+def year_db_path(output_root: str, year: int) -> str:
+    return os.path.join(output_root, "year", f"{year}{OUTPUT_EXT}")
+
+
+async def save_year_outputs(
+    output_root: str,
     year: int,
     state_dbs: Dict[str, Dict[str, Any]],
+    year_db: Dict[str, Any],
+    compress: Sequence[str] = (),
+    prune: bool = False,
+) -> int:
+    # Finalized DBs are serialized, written and fsynced concurrently, and
+    # renamed into place together once all of them are on disk.
+    items: List[Tuple[str, Dict[str, Any]]] = []
+    with STAGES.stage("finalize"):
+        for state_db in state_dbs.values():
+            if not state_db.get("movies"):
+                continue
+            finalize_state_db(state_db)
+            items.append((state_db_path(output_root, year, state_db), state_db))
+
+        saved = len(items)
+
+        finalize_year_db(year_db)
+        year_data = dump_document_bytes(year_db, year_db_path(output_root, year), STATE_COLLECTIONS)
+        items.append((year_db_path(output_root, year), year_data))
+
+        if MANIFEST is not None:
+            MANIFEST.record(year, year_db.get("_m", {}).get("lpd"), year_data)
+
+    with STAGES.stage("save"):
+        await write_json_batch(items, compress=compress, collections=STATE_COLLECTIONS)
+
+        if MANIFEST is not None:
+            MANIFEST.save()
+
+        # The same files in the other layout, from runs before a switch.
+        for path, _ in items:
+            remove_output(swap_layout(path))
+
+        if prune:
+            prune_year_dir(
+                os.path.join(output_root, str(year)),
+                [os.path.basename(path) for path, _ in items[:saved]],
+            )
+
+    return saved
+
+
+def convert_year_outputs(output_root: str, year: int, compress: Sequence[str] = ()) -> None:
+    # Settled years are not rewritten by a run, so after a layout switch
+    # their files are converted here, as they are.
+    targets = [year_db_path(output_root, year)]
+    year_dir = os.path.join(output_root, str(year))
+    if os.path.isdir(year_dir):
+        for fn in sorted(os.listdir(year_dir)):
+            state_key, ext = os.path.splitext(fn)
+            if ext in (".json", NDJSON_EXT) and ext != OUTPUT_EXT:
+                targets.append(os.path.join(year_dir, state_key + OUTPUT_EXT))
+
+    converted = 0
+    for path in targets:
+        src = swap_layout(path)
+        if os.path.exists(src) and not os.path.exists(path):
+            convert_layout(src, path, STATE_COLLECTIONS, compress)
+            converted += 1
+
+    if converted:
+        print(f"{year}: converted {converted} files to {OUTPUT_EXT}")
+
+
+def get_year_start_for_update(
+    year: int,
+    state_dbs: LazyStateDbs,
     rebuild_current_year: bool,
+    year_lpd: Optional[str] = None,
 ) -> dt.date:
     if year == today_ist().year and rebuild_current_year:
         return dt.date(year, 1, 1)
 
+    # States that received no rows in a run keep their older lpd on disk,
+    # so the yearly summary (always rewritten) is consulted as well.
+    lpds = state_dbs.last_processed_dates()
+    if year_lpd:
+        lpds.append(year_lpd)
+
     last_dates = []
-    for db in state_dbs.values():
-        lpd = db.get("_m", {}).get("lpd")
+    for lpd in lpds:
         if lpd:
             try:
                 last_dates.append(dt.datetime.strptime(lpd, "%Y-%m-%d").date())
@@ -782,84 +1221,207 @@ def get_year_end_for_update(year: int) -> dt.date:
 
 
 async def update_year(
-    session: aiohttp.ClientSession,
+    session: LazyClientSession,
     year: int,
     output_root: str,
     min_movie_day_gross: int,
     concurrency: int,
     rebuild_current_year: bool,
+    compress: Sequence[str] = (),
+    hedge: bool = HEDGE_BY_DEFAULT,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+    resume: bool = False,
 ) -> None:
-    state_year_dir = os.path.join(output_root, str(year))
-
-    if year == today_ist().year and rebuild_current_year:
-        clear_dir_json(state_year_dir)
-        clear_summary_file(output_root, year)
-        state_dbs: Dict[str, Dict[str, Any]] = {}
+    rebuild = year == today_ist().year and rebuild_current_year
+    run_date = today_ist().isoformat()
+
+    # A rebuild starts from empty DBs but leaves the published files in
+    # place until the new ones are written, so an interrupted run loses
+    # nothing on disk.
+    if STORE is not None:
+        # Rows accumulate in the store and the JSON is exported from it;
+        # days the store already ingested are not fetched again, so the
+        # store doubles as the checkpoint. A rebuild resets the year unless
+        # --resume picks up one that started today and did not finish.
+        first, last = epoch_day(f"{year}-01-01"), epoch_day(f"{year}-12-31")
+        if rebuild and not (resume and STORE.rebuild_started("states", year) == run_date):
+            STORE.reset_year("states", year, first, last)
+            STORE.begin_rebuild("states", year, run_date)
+        state_dbs = LazyStateDbs(None)
+        year_db = empty_year_db(year)
+        lpd = None if rebuild else STORE.last_processed("states", year)
+        start = dt.date.fromisoformat(lpd) + dt.timedelta(days=1) if lpd else dt.date(year, 1, 1)
+    elif rebuild:
+        state_dbs = LazyStateDbs(None)
         year_db = empty_year_db(year)
         start = dt.date(year, 1, 1)
+    elif MANIFEST is not None and MANIFEST.is_closed(year, year_db_path(output_root, year)):
+        print(f"{year}: already up to date")
+        return
     else:
+        # Only file headers are read here; a year with nothing to fetch
+        # returns before any DB is parsed.
         state_dbs = load_existing_state_dbs(output_root, year)
-        year_db = load_existing_year_db(output_root, year)
-        start = get_year_start_for_update(year, state_dbs, rebuild_current_year=False)
+        year_db = None
+        start = get_year_start_for_update(
+            year,
+            state_dbs,
+            rebuild_current_year=False,
+            year_lpd=peek_state_lpd(stored_path(year_db_path(output_root, year)))[1],
+        )
+
+    ckpt_path = checkpoint_path(cache_dir, year)
+    done: set = set()
+
+    if STORE is not None:
+        done = {day_date(d).isoformat() for d in STORE.ingested_days("states", first, last)}
+    elif resume:
+        ckpt = load_checkpoint(ckpt_path)
+        if (
+            ckpt
+            and ckpt.get("output_root") == output_root
+            and ckpt.get("rebuild") == rebuild
+            and ckpt.get("min_gross") == min_movie_day_gross
+            and checkpoint_is_current(ckpt, run_date)
+        ):
+            start = ckpt["start"]
+            done = set(ckpt["done"])
+            year_db = ckpt["year_db"]
+            for state_key, db in ckpt["state_dbs"].items():
+                state_dbs[state_key] = db
+            print(f"{year}: resuming from checkpoint ({len(done)} days already processed)")
 
     end = get_year_end_for_update(year)
 
     if start > end:
+        if STORE is None and year != today_ist().year:
+            convert_year_outputs(output_root, year, compress)
+        if STORE is None and MANIFEST is not None and year != today_ist().year:
+            # Settled from the file headers; record it so the next run
+            # need not read them.
+            MANIFEST.record_file(year, (start - dt.timedelta(days=1)).isoformat(), year_db_path(output_root, year))
+            MANIFEST.save()
         print(f"{year}: already up to date")
         return
 
+    if year_db is None:
+        year_db = load_existing_year_db(output_root, year)
+
     dates: List[str] = []
     d = start
     while d <= end:
         dates.append(d.strftime("%Y-%m-%d"))
         d += dt.timedelta(days=1)
 
-    print(f"{year}: fetching {len(dates)} days")
+    pending = [ds for ds in dates if ds not in done]
 
-    sem = asyncio.Semaphore(concurrency)
-
-    async def worker(ds: str):
-        async with sem:
-            return await fetch_day(session, ds)
+    print(f"{year}: fetching {len(pending)} days")
 
-    results = await asyncio.gather(
-        *(worker(ds) for ds in dates),
-        return_exceptions=True,
-    )
+    sem = asyncio.Semaphore(concurrency)
+    # Results go through a queue rather than the tasks, so a payload is
+    # released once it has been aggregated.
+    fetched: "asyncio.Queue[Tuple[str, Optional[Dict[str, Any]]]]" = asyncio.Queue()
 
-    for result in results:
-        if isinstance(result, Exception):
-            continue
+    async def worker(ds: str) -> None:
+        try:
+            async with sem:
+                result = await fetch_day(session, ds, hedge=hedge, min_movie_day_gross=min_movie_day_gross)
+        except Exception:
+            result = (ds, None)
+        fetched.put_nowait(result)
+
+    # One stream of fetches, bounded only by the semaphore. Days are
+    # aggregated in date order (so the output does not depend on which
+    # fetch finished first), in groups of `checkpoint_every` with a
+    # checkpoint after each, while later fetches stay in flight. Only days
+    # that were aggregated count as done, so failed or empty ones are
+    # fetched again on --resume.
+    group = checkpoint_every if checkpoint_every > 0 else len(pending) or 1
+    tasks = [asyncio.ensure_future(worker(ds)) for ds in pending]
+    ready: Dict[str, Optional[Dict[str, Any]]] = {}
+    next_day = 0
 
-        date_str, payload = result
-        if payload:
-            process_day_into_states_and_year(
-                year=year,
-                date_str=date_str,
-                payload=payload,
-                state_dbs=state_dbs,
-                year_db=year_db,
-                min_movie_day_gross=min_movie_day_gross,
-            )
+    try:
+        while next_day < len(pending):
+            results = []
+
+            # Workers only run while this loop awaits the queue, so the
+            # "fetch" stage is charged with their payload parsing as well as
+            # the network wait; "aggregate" and "checkpoint" never yield and
+            # cover only their own work.
+            with STAGES.stage("fetch"):
+                while next_day < len(pending) and len(results) < group:
+                    ds = pending[next_day]
+                    while ds not in ready:
+                        date_str, payload = await fetched.get()
+                        ready[date_str] = payload
+                    results.append((ds, ready.pop(ds)))
+                    next_day += 1
+
+            with STAGES.stage("aggregate"):
+                for date_str, payload in results:
+                    if not payload:
+                        continue
+                    if STORE is not None:
+                        ingest_day(year, date_str, payload, min_movie_day_gross)
+                    else:
+                        process_day_into_states_and_year(
+                            year=year,
+                            date_str=date_str,
+                            payload=payload,
+                            state_dbs=state_dbs,
+                            year_db=year_db,
+                            min_movie_day_gross=min_movie_day_gross,
+                        )
+                    done.add(date_str)
+
+                del results
+
+                if STORE is not None:
+                    STORE.commit()
+
+            if checkpoint_every > 0 and next_day < len(pending) and STORE is None:
+                with STAGES.stage("checkpoint"):
+                    save_checkpoint(ckpt_path, {
+                        "output_root": output_root,
+                        "rebuild": rebuild,
+                        "min_gross": min_movie_day_gross,
+                        "run_date": run_date,
+                        "start": start,
+                        "done": sorted(done),
+                        "state_dbs": state_dbs.loaded(),
+                        "year_db": year_db,
+                    })
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if STORE is not None and dates:
+        STORE.set_last_processed("states", year, dates[-1])
+        STORE.commit()
+        with STAGES.stage("export"):
+            state_dbs, year_db = export_year_from_store(year)
 
     if dates:
         last_date = dates[-1]
-        for db in state_dbs.values():
+        for db in state_dbs.loaded().values():
             db.setdefault("_m", {})
             db["_m"]["lpd"] = last_date
         year_db.setdefault("_m", {})
         year_db["_m"]["lpd"] = last_date
 
-    saved = 0
-    for _, state_db in state_dbs.items():
-        if not state_db.get("movies"):
-            continue
-        finalize_state_db(state_db)
-        save_state_db(output_root, year, state_db)
-        saved += 1
-
-    finalize_year_db(year_db)
-    save_year_db(output_root, year, year_db)
+    saved = await save_year_outputs(
+        output_root,
+        year,
+        state_dbs.loaded(),
+        year_db,
+        compress=compress,
+        prune=rebuild or STORE is not None,
+    )
+    drop_checkpoint(ckpt_path)
+    if STORE is not None and rebuild:
+        STORE.finish_rebuild("states", year)
 
     print(f"{year}: saved {saved} state files + 1 yearly summary")
 
@@ -868,7 +1430,12 @@ async def main() -> None:
     parser = argparse.ArgumentParser(description="Build state-wise and yearly movie JSON files from daily summaries.")
     parser.add_argument("--start-year", type=int, default=DEFAULT_START_YEAR)
     parser.add_argument("--end-year", type=int, default=today_ist().year)
-    parser.add_argument("--output-dir", type=str, default="statedata")
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Where to write the outputs (default: statedata/, or a new temp directory under --synthetic).",
+    )
     parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
     parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
     parser.add_argument("--min-movie-day-gross", type=int, default=DEFAULT_MIN_MOVIE_DAY_GROSS)
@@ -883,31 +1450,170 @@ async def main() -> None:
         action="store_false",
         dest="rebuild_current_year",
     )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        default=HEDGE_BY_DEFAULT,
+        help="For recent days, race the fallback host once the primary exceeds its observed p95 latency.",
+    )
+    parser.add_argument(
+        "--no-hedge",
+        action="store_false",
+        dest="hedge",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory for run-to-run caches (host routing table, negative cache of missing dates).",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        type=str,
+        default=None,
+        help="Packed archive of raw daily payloads: settled days are read from it and fetched days appended.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Read payloads only from --archive-dir; make no HTTP requests.",
+    )
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="Write state and yearly files as .ndjson: a header line, then one line per movie in name order.",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=SyntheticConfig.parse,
+        default=None,
+        metavar="SPEC",
+        help='Build from generated payloads instead of fetching, e.g. "movies=1650,cities=60" (see synthetic.py).',
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=DEFAULT_CHECKPOINT_EVERY,
+        help="Checkpoint in-progress aggregation to --cache-dir after every N fetched days (0 disables).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue each year from its last checkpoint, if one matches this run.",
+    )
+    parser.add_argument(
+        "--memory-report",
+        nargs="?",
+        const="-",
+        default=None,
+        metavar="PATH",
+        help="Trace allocations and print peak memory and top call sites per stage; also write them as JSON to PATH if given.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        metavar="MB",
+        help="Fail the run once peak RSS exceeds this many MB at a stage boundary.",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profile",
+        default=None,
+        metavar="DIR",
+        help="Profile each stage separately and write pstats, collapsed stacks and slow event loop callbacks to DIR (default: profile/).",
+    )
+    parser.add_argument(
+        "--sqlite",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Ingest days into this SQLite database and export the JSON files from it.",
+    )
+    parser.add_argument(
+        "--regions",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Region hierarchy for the yearly summary's region rollups (default: regions.json).",
+    )
+    parser.add_argument(
+        "--compress",
+        type=parse_compress_formats,
+        default=(),
+        help="Comma-separated precompressed siblings to write next to each JSON file (gz, br, zst).",
+    )
 
     args = parser.parse_args()
 
-    timeout = aiohttp.ClientTimeout(total=args.timeout)
-    connector = aiohttp.TCPConnector(
-        limit=args.concurrency,
-        ttl_dns_cache=300,
-        enable_cleanup_closed=True,
-    )
+    if args.offline and not args.archive_dir:
+        parser.error("--offline needs --archive-dir")
+
+    if args.output_dir is None:
+        args.output_dir = scratch_output_dir("statedata") if args.synthetic else "statedata"
 
     years = list(range(args.start_year, args.end_year + 1))
     if not years:
         print("No years to process.")
         return
 
-    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
-        for year in years:
-            await update_year(
-                session=session,
-                year=year,
-                output_root=args.output_dir,
-                min_movie_day_gross=args.min_movie_day_gross,
-                concurrency=args.concurrency,
-                rebuild_current_year=args.rebuild_current_year,
-            )
+    global ARCHIVE, OFFLINE, STORE, MANIFEST, SYNTHETIC, OUTPUT_EXT, REGIONS
+    ARCHIVE = Archive(args.archive_dir) if args.archive_dir else None
+    STORE = SqlStore(args.sqlite) if args.sqlite else None
+    MANIFEST = YearManifest(args.output_dir)
+    OFFLINE = args.offline
+    SYNTHETIC = args.synthetic
+    OUTPUT_EXT = NDJSON_EXT if args.ndjson else ".json"
+    if args.regions:
+        REGIONS = RegionMap.load(args.regions)
+
+    ROUTES.load(routing_table_path(args.cache_dir))
+    NEGATIVE.load(negative_cache_path(args.cache_dir))
+
+    report = None
+    if args.memory_report is not None or args.memory_budget:
+        report = MemoryReport(budget_mb=args.memory_budget, trace=args.memory_report is not None)
+        STAGES.add(report)
+
+    profiler = None
+    if args.profile:
+        profiler = StageProfiler(args.profile)
+        profiler.watch_loop(asyncio.get_running_loop())
+        profiler.watch_workers()
+        STAGES.add(profiler)
+
+    try:
+        async with LazyClientSession(timeout=args.timeout, limit=args.concurrency) as session:
+            for year in years:
+                await update_year(
+                    session=session,
+                    year=year,
+                    output_root=args.output_dir,
+                    min_movie_day_gross=args.min_movie_day_gross,
+                    concurrency=args.concurrency,
+                    rebuild_current_year=args.rebuild_current_year,
+                    compress=args.compress,
+                    hedge=args.hedge,
+                    cache_dir=args.cache_dir,
+                    checkpoint_every=args.checkpoint_every,
+                    resume=args.resume,
+                )
+
+        ROUTES.prune(one_month_cutoff())
+        ROUTES.save()
+        NEGATIVE.save()
+        if ARCHIVE is not None:
+            ARCHIVE.close()
+        if STORE is not None:
+            STORE.close()
+    except MemoryBudgetExceeded as e:
+        raise SystemExit(str(e))
+    finally:
+        if report is not None and args.memory_report is not None:
+            report.emit(args.memory_report)
+        if profiler is not None:
+            profiler.finish()
 
     print("Done.")
 
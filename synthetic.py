@@ -0,0 +1,339 @@
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+# ----------------------------
+# Generator
+# ----------------------------
+# Deterministic stand-ins for upstream finalsummary.json, for measuring how
+# the builders scale. The same (spec, date) always gives the same bytes.
+#
+# A spec is "key=value,..." over the SyntheticConfig fields, e.g.
+# "movies=1650,cities=60,chains=12". Titles run for RUN_DAYS days each, so
+# `movies` titles are on screen every day and roughly
+# movies * (1 + 365 / RUN_DAYS) distinct titles appear in a year.
+
+RUN_DAYS = 60
+PREFERRED_CHAINS = ("PVR", "INOX", "Cinepolis")
+VARIANT_SUFFIXES = ("[Hindi]", "[Tamil]", "[Telugu]", "[3D]", "[IMAX 2D]")
+
+DIMENSIONS = ("movies", "cities", "chains", "variants", "states")
+
+
+class SyntheticConfig:
+    """
+    movies    titles showing on any given day
+    cities    detail rows (cities) per title per day
+    chains    Chain_details rows per title per day
+    variants  bracketed variants per title (each one its own payload entry)
+    states    states the city pool is spread over
+    seed      changes every number while keeping the shape
+    """
+
+    FIELDS = ("movies", "cities", "chains", "variants", "states", "seed")
+
+    def __init__(
+        self,
+        movies: int = 165,
+        cities: int = 40,
+        chains: int = 6,
+        variants: int = 1,
+        states: int = 30,
+        seed: int = 0,
+    ) -> None:
+        self.movies = movies
+        self.cities = cities
+        self.chains = chains
+        self.variants = variants
+        self.states = states
+        self.seed = seed
+
+    @classmethod
+    def parse(cls, spec: str) -> "SyntheticConfig":
+        kwargs: Dict[str, int] = {}
+        for part in (spec or "").split(","):
+            part = part.strip()
+            if not part:
+                continue
+            key, _, value = part.partition("=")
+            key = key.strip()
+            if key not in cls.FIELDS:
+                raise ValueError(f"unknown synthetic setting: {key}")
+            kwargs[key] = int(value)
+        return cls(**kwargs)
+
+    def scaled(self, dimension: str, factor: float) -> "SyntheticConfig":
+        kwargs = {f: getattr(self, f) for f in self.FIELDS}
+        kwargs[dimension] = max(1, int(round(kwargs[dimension] * factor)))
+        return SyntheticConfig(**kwargs)
+
+    def spec(self) -> str:
+        return ",".join(f"{f}={getattr(self, f)}" for f in self.FIELDS)
+
+
+def _state_name(i: int) -> str:
+    return f"State {i:02d}"
+
+
+def _chain_name(i: int) -> str:
+    return PREFERRED_CHAINS[i] if i < len(PREFERRED_CHAINS) else f"Chain {i:02d}"
+
+
+def _row(r: random.Random, gross_scale: int) -> Dict[str, Any]:
+    gross = r.randint(gross_scale // 10, gross_scale)
+    shows = r.randint(1, 30)
+    seats = shows * r.randint(120, 300)
+    sold = min(seats, gross // r.randint(150, 400))
+    return {
+        "gross": gross,
+        "sold": sold,
+        "shows": shows,
+        "totalSeats": seats,
+        "fastfilling": r.randint(0, shows // 3),
+        "housefull": r.randint(0, shows // 10),
+        "occupancy": round(100.0 * sold / seats, 2) if seats else 0.0,
+    }
+
+
+def synthetic_payload(date_str: str, cfg: SyntheticConfig) -> Dict[str, Any]:
+    day = dt.date.fromisoformat(date_str).toordinal()
+    churn = max(1, cfg.movies // RUN_DAYS)
+    first = (day % 100000) * churn
+
+    # Cities are a fixed pool, so series line up across days; each city
+    # belongs to one state.
+    pool = max(cfg.cities * 3, cfg.states)
+
+    movies: Dict[str, Any] = {}
+
+    for title in range(first, first + cfg.movies):
+        r = random.Random(f"{cfg.seed}:{date_str}:{title}")
+        # Titles near the end of their run sell less; the oldest fall
+        # under the builders' per-day gross threshold.
+        age = (first + cfg.movies - title) / cfg.movies
+        gross_scale = max(500, int(400000 * max(0.01, 1.0 - age)))
+
+        names = [f"Movie {title}"]
+        for v in range(cfg.variants - 1):
+            names.append(f"Movie {title} {VARIANT_SUFFIXES[v % len(VARIANT_SUFFIXES)]}")
+
+        for name in names:
+            details = []
+            for c in r.sample(range(pool), min(cfg.cities, pool)):
+                row = _row(r, gross_scale)
+                row["city"] = f"City {c:04d}"
+                row["state"] = _state_name(c % cfg.states)
+                details.append(row)
+
+            chains = []
+            for ch in range(cfg.chains):
+                row = _row(r, gross_scale * 2)
+                row["chain"] = _chain_name(ch)
+                chains.append(row)
+
+            totals = {k: sum(row[k] for row in details) for k in ("gross", "sold", "shows")}
+            seats = sum(row["totalSeats"] for row in details)
+
+            movies[name] = {
+                "gross": totals["gross"],
+                "sold": totals["sold"],
+                "shows": totals["shows"],
+                "occupancy": round(100.0 * totals["sold"] / seats, 2) if seats else 0.0,
+                "details": details,
+                "Chain_details": chains,
+            }
+
+    return {"last_updated": f"{date_str} 23:59 IST", "movies": movies}
+
+
+def synthetic_text(date_str: str, cfg: SyntheticConfig) -> str:
+    return json.dumps(synthetic_payload(date_str, cfg))
+
+
+def scratch_output_dir(name: str) -> str:
+    """
+    A new temp directory for a --synthetic build that was not given an
+    output directory, so generated data never lands in the real outputs.
+    """
+    path = tempfile.mkdtemp(prefix=f"{name}-synthetic-")
+    print(f"--synthetic: writing outputs to {path}")
+    return path
+
+
+# ----------------------------
+# Benchmarks
+# ----------------------------
+def _dates(year: int, days: int) -> List[str]:
+    start = dt.date(year, 1, 1)
+    return [(start + dt.timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def _timed(fn, trace: bool) -> Dict[str, float]:
+    if trace:
+        tracemalloc.start(1)
+    started = time.perf_counter()
+    fn()
+    out = {"s": time.perf_counter() - started}
+    if trace:
+        out["mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return out
+
+
+def bench_once(cfg: SyntheticConfig, year: int, days: int, trace: bool) -> Dict[str, Dict[str, float]]:
+    """
+    Feed `days` synthetic days through both builders' aggregation, then
+    their finalize steps and save_database; outputs go to a temp dir.
+    Parsing is done up front and not timed.
+    """
+    import statedata
+    import updater
+
+    texts = [(d, synthetic_text(d, cfg)) for d in _dates(year, days)]
+    results: Dict[str, Dict[str, float]] = {}
+
+    output_dir = updater.OUTPUT_DIR
+
+    with tempfile.TemporaryDirectory() as tmp:
+        updater.OUTPUT_DIR = tmp
+        try:
+            payloads = [(d, updater.parse_payload(t)) for d, t in texts]
+            db = updater.empty_db(year)
+
+            def process():
+                for d, p in payloads:
+                    updater.process_day(db, d, p)
+
+            results["process_day"] = _timed(process, trace)
+            results["finalize"] = _timed(lambda: updater.finalize(db), trace)
+
+            db.pop("markets", None)
+            db.pop("citywise", None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results["save_database"] = _timed(lambda: updater.save_database([year], dbs={year: db}), trace)
+
+            payloads = [
+                (d, statedata.parse_daily_payload(t, statedata.DEFAULT_MIN_MOVIE_DAY_GROSS, statedata.normalize_movie_name))
+                for d, t in texts
+            ]
+            state_dbs = statedata.LazyStateDbs(None)
+            year_db = statedata.empty_year_db(year)
+
+            def process_states():
+                for d, p in payloads:
+                    statedata.process_day_into_states_and_year(
+                        year=year,
+                        date_str=d,
+                        payload=p,
+                        state_dbs=state_dbs,
+                        year_db=year_db,
+                        min_movie_day_gross=statedata.DEFAULT_MIN_MOVIE_DAY_GROSS,
+                    )
+
+            results["state_process"] = _timed(process_states, trace)
+
+            def finalize_states():
+                for state_db in state_dbs.loaded().values():
+                    statedata.finalize_state_db(state_db)
+
+            results["finalize_state_db"] = _timed(finalize_states, trace)
+        finally:
+            updater.OUTPUT_DIR = output_dir
+
+    return results
+
+
+def run_bench(
+    base: SyntheticConfig,
+    dimensions: List[str],
+    factors: List[float],
+    year: int,
+    days: int,
+    trace: bool,
+    out: Optional[str] = None,
+) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"base": base.spec(), "days": days, "runs": []}
+    steps = ("process_day", "finalize", "save_database", "state_process", "finalize_state_db")
+
+    for dimension in dimensions:
+        print(f"--- {dimension} ---")
+        header = f"{'x':>6}" + "".join(f"{s:>20}" for s in steps)
+        print(header)
+
+        first = None
+        for factor in factors:
+            cfg = base.scaled(dimension, factor)
+            res = bench_once(cfg, year, days, trace)
+            report["runs"].append({"dimension": dimension, "factor": factor, "spec": cfg.spec(), "steps": res})
+
+            if first is None:
+                first = res
+
+            cells = []
+            for s in steps:
+                grow = res[s]["s"] / first[s]["s"] if first[s]["s"] else 0
+                cell = f"{res[s]['s']:.2f}s x{grow:.1f}"
+                if trace:
+                    cell += f" {res[s]['mb']:.0f}MB"
+                cells.append(f"{cell:>20}")
+            print(f"{factor:>6g}" + "".join(cells))
+
+    if out:
+        from fileio import atomic_write_bytes
+        atomic_write_bytes(out, json.dumps(report, indent=2).encode("utf-8"))
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate synthetic daily payloads and benchmark the builders on them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_gen = sub.add_parser("generate", help="Write synthetic payloads in the upstream yearly layout.")
+    p_gen.add_argument("--spec", type=str, default="")
+    p_gen.add_argument("--year", type=int, default=2024)
+    p_gen.add_argument("--days", type=int, default=7)
+    p_gen.add_argument("--out", type=str, required=True)
+
+    p_bench = sub.add_parser("bench", help="Time (and optionally trace) each build step as one dimension grows.")
+    p_bench.add_argument("--spec", type=str, default="", help="Base configuration (see SyntheticConfig).")
+    p_bench.add_argument("--dimension", action="append", choices=DIMENSIONS, help="Dimension to scale (repeatable; default all).")
+    p_bench.add_argument("--factors", type=str, default="1,2,5,10")
+    p_bench.add_argument("--year", type=int, default=2024)
+    p_bench.add_argument("--days", type=int, default=14)
+    p_bench.add_argument("--memory", action="store_true", help="Also report each step's traced peak (slows every step).")
+    p_bench.add_argument("--json", type=str, default=None, metavar="PATH", help="Also write the results as JSON.")
+
+    args = parser.parse_args()
+    base = SyntheticConfig.parse(args.spec)
+
+    if args.command == "generate":
+        for d in _dates(args.year, args.days):
+            path = os.path.join(args.out, str(args.year), f"{d[5:]}_finalsummary.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(synthetic_text(d, base))
+        print(f"wrote {args.days} days to {args.out}/{args.year}/")
+        return
+
+    run_bench(
+        base,
+        args.dimension or list(DIMENSIONS),
+        [float(x) for x in args.factors.split(",") if x.strip()],
+        args.year,
+        args.days,
+        args.memory,
+        args.json,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import json
+import os
+
+from archive import Archive, compact_year, export_year, import_source
+
+
+def test_put_and_get(tmp_path):
+    archive = Archive(str(tmp_path))
+    archive.put_text("2024-03-01", '{"a":1}', settled=True)
+    archive.put_text("2024-03-02", '{"a":2}', settled=False)
+
+    assert archive.get_text("2024-03-01") == '{"a":1}'
+    assert archive.get_text("2024-03-02") == '{"a":2}'
+    assert archive.get_text("2024-03-02", settled_only=True) is None
+    assert archive.get_text("2024-03-03") is None
+    archive.close()
+
+    # Reopened from the index written by close().
+    archive = Archive(str(tmp_path))
+    assert archive.years() == [2024]
+    assert archive.get_text("2024-03-01", settled_only=True) == '{"a":1}'
+    archive.close()
+
+
+def test_index_is_rebuilt_from_pack(tmp_path):
+    archive = Archive(str(tmp_path))
+    archive.put_text("2024-03-01", "one", settled=True)
+    archive.close()
+    os.remove(tmp_path / "2024.idx")
+
+    assert Archive(str(tmp_path)).get_text("2024-03-01") == "one"
+
+
+def test_wants(tmp_path):
+    archive = Archive(str(tmp_path))
+    assert archive.wants("2024-03-01", settled=False)
+
+    archive.put_text("2024-03-01", "draft", settled=False)
+    # Any newer copy replaces an unsettled day.
+    assert archive.wants("2024-03-01", settled=False)
+    assert archive.wants("2024-03-01", settled=True)
+
+    archive.put_text("2024-03-01", "later draft", settled=False)
+    assert archive.get_text("2024-03-01") == "later draft"
+
+    archive.put_text("2024-03-01", "final", settled=True)
+    # A settled day is never replaced.
+    assert not archive.wants("2024-03-01", settled=False)
+    assert not archive.wants("2024-03-01", settled=True)
+
+    archive.put_text("2024-03-01", "ignored", settled=False)
+    assert archive.get_text("2024-03-01") == "final"
+    archive.close()
+
+
+def test_compact_keeps_latest_record_per_date(tmp_path):
+    archive = Archive(str(tmp_path))
+    for text in ("v1", "v2", "v3"):
+        archive.put_text("2024-03-01", text, settled=False)
+    archive.put_text("2024-03-02", "other", settled=True)
+    archive.close()
+
+    before, after = compact_year(Archive(str(tmp_path)), 2024)
+    assert after < before
+
+    archive = Archive(str(tmp_path))
+    ya = archive.year(2024)
+    assert sorted(ya.index) == ["2024-03-01", "2024-03-02"]
+    assert archive.get_text("2024-03-01") == "v3"
+    assert not ya.is_settled("2024-03-01")
+    assert ya.is_settled("2024-03-02")
+    assert ya.size == after == os.path.getsize(tmp_path / "2024.pack")
+    assert not [fn for fn in os.listdir(tmp_path) if fn.startswith(".compact")]
+    archive.close()
+
+
+def test_compact_empty_year(tmp_path):
+    assert compact_year(Archive(str(tmp_path)), 2024) == (0, 0)
+
+
+def test_export_and_import_round_trip(tmp_path):
+    src = Archive(str(tmp_path / "a"))
+    src.put_text("2024-03-01", json.dumps({"movies": {}}), settled=True)
+    src.close()
+
+    out = str(tmp_path / "out")
+    assert export_year(Archive(str(tmp_path / "a")), 2024, out) == 1
+    assert os.path.exists(os.path.join(out, "2024", "03-01_finalsummary.json"))
+
+    dst = Archive(str(tmp_path / "b"))
+    assert import_source(dst, out, settled=True) == 1
+    assert import_source(dst, str(tmp_path / "a" / "2024.pack"), settled=True) == 0
+    assert json.loads(dst.get_text("2024-03-01")) == {"movies": {}}
+    dst.close()
+
+
+def test_import_ignores_packs_not_named_by_year(tmp_path):
+    (tmp_path / "backup.pack").write_bytes(b"")
+    assert import_source(Archive(str(tmp_path / "b")), str(tmp_path / "backup.pack"), settled=True) == 0
@@ -0,0 +1,48 @@
+from dayseries import DaySeries, day_date, day_key, epoch_day
+from fileio import dump_json_bytes
+
+
+def test_epoch_day_formats():
+    assert epoch_day("1970-01-01") == 0
+    assert epoch_day("2024-03-01") == epoch_day("20240301")
+    assert epoch_day("2024-03-01") - epoch_day("2024-02-28") == 2
+    assert day_key(epoch_day("2024-12-31")) == "20241231"
+    assert day_date(epoch_day("2024-02-29")).isoformat() == "2024-02-29"
+
+
+def test_set_grows_both_ways():
+    s = DaySeries()
+    assert not s and len(s) == 0 and s.first() is None and s.last() is None
+
+    d = epoch_day("2024-03-10")
+    s.set(d, "b")
+    s.set(d - 5, "a")
+    s.set(d + 3, "c")
+
+    assert list(s.items()) == [(d - 5, "a"), (d, "b"), (d + 3, "c")]
+    assert s.days() == [d - 5, d, d + 3]
+    assert list(s.values()) == ["a", "b", "c"]
+    assert (s.first(), s.last(), len(s)) == (d - 5, d + 3, 3)
+    assert s.get(d - 1) is None
+    assert s.get(d - 1, 0) == 0
+    assert s.get(d + 100, 0) == 0
+
+
+def test_slot_creates_once():
+    s = DaySeries()
+    d = epoch_day("2024-01-01")
+    s.slot(d, list).append(1)
+    s.slot(d, list).append(2)
+    assert s.get(d) == [1, 2]
+
+
+def test_json_round_trip():
+    data = {"20240105": [1, 2], "20231231": [3, 4], "junk": [5]}
+    s = DaySeries.from_dict(data)
+
+    assert s.to_json() == {"20231231": [3, 4], "20240105": [1, 2]}
+    assert list(s.to_json()) == ["20231231", "20240105"]
+    assert dump_json_bytes({"d": s}) == b'{"d":{"20231231":[3,4],"20240105":[1,2]}}'
+    assert DaySeries.from_dict(s) is s
+    assert not DaySeries.from_dict(None)
+    assert DaySeries.from_dict({"20240101": "7"}, int).to_json() == {"20240101": 7}
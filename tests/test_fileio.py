@@ -0,0 +1,104 @@
+import asyncio
+import gzip
+import os
+
+from fileio import (
+    atomic_write_bytes,
+    dump_document_bytes,
+    dump_json_bytes,
+    load_document,
+    parse_ndjson,
+    plan_variants,
+    write_json_batch,
+)
+
+COLLECTIONS = ("movieSummary", "movies")
+
+DOC = {
+    "year": 2024,
+    "last_updated": "2024-12-31 23:59 IST",
+    "_meta": {"lastProcessedDate": "2024-12-31"},
+    "movieSummary": {"B": {"g": 2}, "A": {"g": 1}},
+    "movies": {"A [Hindi]": {"daily": {"20240101": [1, 2]}}, "A": {"daily": {}}},
+}
+
+
+def test_ndjson_round_trip():
+    data = dump_document_bytes(DOC, "2024.ndjson", COLLECTIONS)
+    lines = data.decode("utf-8").splitlines()
+
+    # Header first, then one line per record, by map and then by key.
+    assert '"movies"' not in lines[0]
+    assert [line.split(",")[1] for line in lines[1:]] == ['"A"', '"B"', '"A"', '"A [Hindi]"']
+
+    assert parse_ndjson(data.decode("utf-8"), COLLECTIONS) == DOC
+
+
+def test_ndjson_keeps_empty_collections():
+    doc = {"year": 2024, "movieSummary": {}, "movies": {}}
+    data = dump_document_bytes(doc, "2024.ndjson", COLLECTIONS)
+    assert parse_ndjson(data.decode("utf-8"), COLLECTIONS) == doc
+
+
+def test_load_document_by_extension(tmp_path):
+    for fn in ("2024.json", "2024.ndjson"):
+        path = str(tmp_path / fn)
+        atomic_write_bytes(path, dump_document_bytes(DOC, path, COLLECTIONS))
+        assert load_document(path, COLLECTIONS) == DOC
+
+
+def test_plan_variants_new_file(tmp_path):
+    path = str(tmp_path / "a.json")
+    assert plan_variants(path, b"{}", ("gz",)) == [(path, None), (path + ".gz", "gz")]
+
+
+def test_plan_variants_unchanged_file(tmp_path):
+    path = str(tmp_path / "a.json")
+    atomic_write_bytes(path, b"{}", compress=("gz",))
+
+    assert plan_variants(path, b"{}", ("gz",)) == []
+    # A format asked for now but missing on disk is still written.
+    os.remove(path + ".gz")
+    assert plan_variants(path, b"{}", ("gz",)) == [(path + ".gz", "gz")]
+
+
+def test_plan_variants_drops_stale_siblings_of_unchanged_file(tmp_path):
+    path = str(tmp_path / "a.json")
+    atomic_write_bytes(path, b"{}", compress=("gz",))
+
+    assert plan_variants(path, b"{}", ()) == []
+    assert not os.path.exists(path + ".gz")
+
+
+def test_rewrite_drops_stale_siblings(tmp_path):
+    path = str(tmp_path / "a.json")
+    atomic_write_bytes(path, b"{}", compress=("gz",))
+    atomic_write_bytes(path, b"[]")
+
+    assert sorted(os.listdir(tmp_path)) == ["a.json"]
+
+
+def test_write_json_batch(tmp_path):
+    items = [
+        (str(tmp_path / "x" / "a.json"), {"a": 1}),
+        (str(tmp_path / "x" / "b.ndjson"), DOC),
+        (str(tmp_path / "c.json"), b"[1]"),
+    ]
+
+    written = asyncio.run(write_json_batch(items, compress=("gz",), collections=COLLECTIONS))
+
+    assert sorted(written) == sorted(
+        [path for path, _ in items] + [path + ".gz" for path, _ in items]
+    )
+    assert load_document(items[0][0]) == {"a": 1}
+    assert load_document(items[1][0], COLLECTIONS) == DOC
+    with gzip.open(items[2][0] + ".gz", "rb") as f:
+        assert f.read() == b"[1]"
+    assert not [fn for _, _, fns in os.walk(tmp_path) for fn in fns if fn.endswith(".tmp")]
+
+    # Nothing changed, so nothing is written again.
+    assert asyncio.run(write_json_batch(items, compress=("gz",), collections=COLLECTIONS)) == []
+
+
+def test_dump_json_bytes_is_compact():
+    assert dump_json_bytes({"a": [1, "é"]}) == '{"a":[1,"é"]}'.encode("utf-8")
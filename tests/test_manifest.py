@@ -0,0 +1,58 @@
+from manifest import STATUS_CLOSED, STATUS_OPEN, YearManifest
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_closed_year(tmp_path):
+    year_file = write(tmp_path / "2024.json", b'{"year":2024}')
+    manifest = YearManifest(str(tmp_path))
+    manifest.record(2024, "2024-12-31", b'{"year":2024}')
+    manifest.save()
+
+    manifest = YearManifest(str(tmp_path))
+    assert manifest.get(2024)["status"] == STATUS_CLOSED
+    assert manifest.is_closed(2024, year_file)
+
+
+def test_open_year_is_not_closed(tmp_path):
+    year_file = write(tmp_path / "2024.json", b"{}")
+    manifest = YearManifest(str(tmp_path))
+    manifest.record(2024, "2024-12-30", b"{}")
+
+    assert manifest.get(2024)["status"] == STATUS_OPEN
+    assert not manifest.is_closed(2024, year_file)
+    assert not manifest.is_closed(2023, year_file)
+
+
+def test_changed_or_missing_file_is_not_closed(tmp_path):
+    year_file = write(tmp_path / "2024.json", b"{}")
+    manifest = YearManifest(str(tmp_path))
+    manifest.record_file(2024, "2024-12-31", year_file)
+    assert manifest.is_closed(2024, year_file)
+
+    write(tmp_path / "2024.json", b'{"x":1}')
+    assert not manifest.is_closed(2024, year_file)
+
+    assert not manifest.is_closed(2024, str(tmp_path / "missing.json"))
+
+
+def test_save_only_when_changed(tmp_path):
+    manifest = YearManifest(str(tmp_path))
+    manifest.save()
+    assert not (tmp_path / "manifest.json").exists()
+
+    manifest.record(2024, "2024-12-31", b"{}")
+    manifest.save()
+    before = (tmp_path / "manifest.json").stat().st_mtime_ns
+
+    manifest.record(2024, "2024-12-31", b"{}")
+    manifest.save()
+    assert (tmp_path / "manifest.json").stat().st_mtime_ns == before
+
+
+def test_unreadable_manifest_is_empty(tmp_path):
+    (tmp_path / "manifest.json").write_text("not json")
+    assert YearManifest(str(tmp_path)).years == {}
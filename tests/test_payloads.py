@@ -0,0 +1,62 @@
+import json
+
+from payloads import normalize_movie_name, parse_daily_payload
+
+
+def row(gross, **extra):
+    return dict({"gross": gross, "sold": 1, "shows": 1, "occupancy": 10.0}, **extra)
+
+
+PAYLOAD = {
+    "last_updated": "2024-01-02 23:59 IST",
+    "movies": {
+        "Big [Hindi]": dict(row(60000), details=[row(60000, city="Pune")], Chain_details=[row(1, chain="PVR")]),
+        "Big [Tamil]": dict(row(50000), details=[row(50000, city="Chennai")], Chain_details=[]),
+        "Small": dict(row(900), details=[row(900, city="Pune")], Chain_details=[row(900, chain="INOX")]),
+    },
+}
+
+
+def test_parse_matches_json_loads_above_threshold():
+    text = json.dumps(PAYLOAD)
+    assert parse_daily_payload(text, 0, normalize_movie_name) == json.loads(text)
+
+
+def test_threshold_applies_to_base_title():
+    parsed = parse_daily_payload(json.dumps(PAYLOAD), 100000, normalize_movie_name)
+    movies = parsed["movies"]
+
+    # The variants only pass together.
+    assert movies["Big [Hindi]"]["details"] == PAYLOAD["movies"]["Big [Hindi]"]["details"]
+    assert movies["Big [Tamil]"]["details"] == PAYLOAD["movies"]["Big [Tamil]"]["details"]
+
+    assert movies["Small"]["details"] == []
+    assert movies["Small"]["Chain_details"] == []
+    assert movies["Small"]["gross"] == 900
+    assert parsed["last_updated"] == PAYLOAD["last_updated"]
+
+
+def test_unexpected_documents_fall_back_to_json_loads():
+    for doc in ({"movies": []}, {"movies": {"A": {"details": [[1, 2]]}}}, [1, 2]):
+        text = json.dumps(doc)
+        assert parse_daily_payload(text, 100000, normalize_movie_name) == doc
+
+
+def test_normalize_movie_name():
+    assert normalize_movie_name("Pushpa 2 [Telugu]") == "Pushpa 2"
+    assert normalize_movie_name("Pushpa 2  [2D | Telugu]") == "Pushpa 2"
+    assert normalize_movie_name("Kalki [2003] [2D | Telugu] ") == "Kalki"
+    assert normalize_movie_name("Movie [a] x") == "Movie [a] x"
+    assert normalize_movie_name("  Spaced   Out  [3D]") == "Spaced   Out"
+    assert normalize_movie_name("") == ""
+    assert normalize_movie_name(None) == ""
+
+
+def test_statedata_keeps_its_own_rule():
+    # State files are keyed by statedata's rule: only the last bracketed
+    # suffix goes, and whitespace runs are collapsed.
+    import statedata
+
+    assert statedata.normalize_movie_name("Pushpa 2 [Telugu]") == "Pushpa 2"
+    assert statedata.normalize_movie_name("Kalki [2003] [2D | Telugu]") == "Kalki [2003]"
+    assert statedata.normalize_movie_name("  Spaced   Out  [3D]") == "Spaced Out"
@@ -0,0 +1,54 @@
+from search import SearchIndex, build_search_index, fold_title
+
+MOVIES = [
+    ["Stree 2 [Hindi]", 20240815, 20241010],
+    ["Pushpa 2: The Rule [Telugu]", 20241205, 20250120],
+    ["Stree", 20180831, 20181020],
+    ["Amélie", 20010425, 20010601],
+    ["Monstree", 20200101, 20200201],
+    ["The Stree Diaries", 20220101, 20220201],
+]
+
+
+def index():
+    return SearchIndex(build_search_index(MOVIES, 20250101))
+
+
+def names(hits):
+    return [row[0] for row in hits]
+
+
+def test_fold_title():
+    assert fold_title("Pushpa 2: The Rule [Telugu]") == "pushpa 2 the rule"
+    assert fold_title("Amélie") == "amelie"
+
+
+def test_ranking():
+    # Exact, then prefix, then word prefix, then other substrings; ties
+    # keep database order.
+    assert names(index().search("stree")) == [
+        "Stree",
+        "Stree 2 [Hindi]",
+        "The Stree Diaries",
+        "Monstree",
+    ]
+
+
+def test_short_queries_match_word_prefixes():
+    assert names(index().search("st")) == ["Stree 2 [Hindi]", "Stree", "The Stree Diaries"]
+    assert names(index().search("2")) == ["Stree 2 [Hindi]", "Pushpa 2: The Rule [Telugu]"]
+
+
+def test_accents_punctuation_and_limit():
+    assert names(index().search("AMELIE")) == ["Amélie"]
+    assert names(index().search("2 the")) == ["Pushpa 2: The Rule [Telugu]"]
+    assert len(index().search("stree", limit=2)) == 2
+    assert index().search("zzz") == []
+    assert index().search("  !! ") == []
+
+
+def test_trigrams_without_the_whole_query_do_not_match():
+    # "abc xbcd" holds both trigrams of "abcd" but not "abcd" itself.
+    idx = SearchIndex(build_search_index([["Abc Xbcd", 0, 0]], 0))
+    assert idx.search("abcd") == []
+    assert names(idx.search("xbcd")) == ["Abc Xbcd"]
@@ -0,0 +1,57 @@
+import random
+
+import synthetic
+import updater
+
+
+def build_year(days=12):
+    cfg = synthetic.SyntheticConfig(movies=20, cities=10, chains=6, variants=3)
+    r = random.Random(1)
+    db = updater.empty_db(2024)
+
+    for date_str in synthetic._dates(2024, days):
+        payload = synthetic.synthetic_payload(date_str, cfg)
+        # Occupancies with up to four decimals, as upstream sends them,
+        # so per-row rounding matters.
+        for movie in payload["movies"].values():
+            for row in movie["details"] + movie["Chain_details"]:
+                row["occupancy"] = round(r.uniform(0, 100), r.choice([1, 2, 3, 4]))
+        updater.process_day(db, date_str, payload)
+
+    return db
+
+
+def merged_summaries(db):
+    # How movieSummary was built before base titles were accumulated as
+    # rows arrived: each variant's maps merged in movie order.
+    merged = {}
+    for name, movie in db["movies"].items():
+        summary = merged.setdefault(
+            updater.normalize_movie_name(name),
+            {"cities": {}, "states": {}, "chains": {}},
+        )
+        for kind in summary:
+            for key, stats in movie[kind].items():
+                updater.merge_stat(summary[kind], key, stats)
+
+    return {
+        base: {
+            "topCities": updater.build_top(s["cities"], 10),
+            "topStates": updater.build_top_states(s["states"]),
+            "topChains": updater.build_top_chains(s["chains"], 10),
+        }
+        for base, s in merged.items()
+    }
+
+
+def test_movie_summary_matches_merged_variants():
+    db = build_year()
+    expected = merged_summaries(db)
+
+    updater.finalize(db)
+
+    assert set(db["movieSummary"]) == set(expected)
+    for base, tops in expected.items():
+        summary = db["movieSummary"][base]
+        for field, rows in tops.items():
+            assert summary[field] == rows, (base, field)
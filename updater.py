@@ -1,10 +1,63 @@
+import argparse
 import asyncio
-import aiohttp
 import json
 import datetime
+import hashlib
 import os
-import pytz
 import re
+import time
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from archive import Archive
+from dayseries import (
+    DaySeries,
+    day_code,
+    day_key,
+    epoch_day
+)
+from diagnostics import (
+    MemoryBudgetExceeded,
+    MemoryReport,
+    StageMonitor,
+    StageProfiler
+)
+from fileio import (
+    NDJSON_EXT,
+    atomic_write_bytes,
+    content_digest,
+    convert_layout,
+    dump_document_bytes,
+    dump_json_bytes,
+    load_document,
+    parse_compress_formats,
+    remove_output,
+    run_blocking,
+    slugify_filename,
+    stored_path,
+    swap_layout,
+    write_json_batch
+)
+from manifest import YearManifest
+from payloads import normalize_movie_name, parse_daily_payload
+from regions import RegionMap
+from routing import (
+    DEFAULT_CACHE_DIR,
+    LatencyTracker,
+    LazyClientSession,
+    NegativeCache,
+    RoutingTable,
+    hedged,
+    negative_cache_path,
+    negative_ttl,
+    routing_table_path
+)
+from search import build_search_index
+from sqlstore import SqlStore
+from synthetic import (
+    SyntheticConfig,
+    scratch_output_dir,
+    synthetic_text
+)
 
 PREFERRED_CHAINS = [
     "PVR",
@@ -12,83 +65,136 @@ PREFERRED_CHAINS = [
     "Cinepolis"
 ]
 OUTPUT_DIR = "moviedata"
-os.makedirs(
-    OUTPUT_DIR,
-    exist_ok=True
-)
 MIN_MOVIE_DAY_GROSS = 100000
 
+# Year file extension: ".json", or ".ndjson" (--ndjson) for one movie per
+# line under a header line; see fileio.dump_ndjson_bytes.
+YEAR_EXT = ".json"
+YEAR_COLLECTIONS = (
+    "movieSummary",
+    "movies"
+)
+
+# Movies kept in each per-day and per-week leaderboard.
+LEADERBOARD_SIZE = 10
+
 TIMEOUT = 25
 CONCURRENCY = 100
+HEDGE = True
+
+# Observed latency of the first-choice host; its p95 is the hedge delay.
+PRIMARY_LATENCY = LatencyTracker()
+
+# Per-date winning host and per-host health, persisted under --cache-dir.
+ROUTES = RoutingTable()
+
+# Dates every source reported as missing, persisted under --cache-dir.
+NEGATIVE = NegativeCache()
+
+# Optional packed copy of raw upstream payloads (--archive-dir). Settled
+# days are read from it instead of HTTP and fetched days are appended;
+# with --offline it is the only source.
+ARCHIVE = None
+OFFLINE = False
+
+# --synthetic: generated payloads (see synthetic.py) replace every fetch.
+SYNTHETIC = None
+
+# Optional SQLite copy of the data at daily grain (--sqlite). When set,
+# days are ingested into it and the year files are exported from it.
+STORE = None
+
+# moviedata/manifest.json: per-year last processed date, hash and status,
+# so closed years are settled without opening their files.
+MANIFEST = None
 
-IST = pytz.timezone("Asia/Kolkata")
+# --cities: also keep per-city daily series and write them, one shard per
+# state, under moviedata/cities/<year>/.
+CITIES = False
 
-NORTH = {
-    "Maharashtra","NCR","Delhi","Gujarat","Uttar Pradesh","West Bengal",
-    "Rajasthan","Punjab","Madhya Pradesh","Chhattisgarh","Odisha","Haryana",
-    "Bihar","Uttarakhand","Goa","Assam","Jharkhand","Jammu and Kashmir",
-    "Andaman And Nicobar Islands","Meghalaya","Himachal Pradesh","Chandigarh",
-    "Tripura","Arunachal Pradesh","Sikkim","Manipur","Mizoram","Nagaland"
-}
+# Stage boundaries (fetch, aggregate, finalize, save) for --memory-report
+# and --profile.
+STAGES = StageMonitor()
 
-SOUTH = {
-    "Tamil Nadu","Karnataka","Kerala",
-    "Telangana","Andhra Pradesh","Puducherry"
-}
+try:
+    IST = ZoneInfo("Asia/Kolkata")
+except ZoneInfoNotFoundError:
+    # No tz database on this machine; India has had no DST since 1945.
+    IST = datetime.timezone(
+        datetime.timedelta(hours=5, minutes=30),
+        "IST"
+    )
+
+# "_meta" follows the short "year"/"last_updated" fields at the top of each
+# year file, so the last processed date can be read without parsing it.
+LPD_HEADER_RE = re.compile(
+    r'"_meta"\s*:\s*\{\s*"lastProcessedDate"\s*:\s*(?:null|"(\d{4}-\d{2}-\d{2})")'
+)
+LAST_UPDATED_HEADER_RE = re.compile(
+    r'"last_updated"\s*:\s*("(?:[^"\\]|\\.)*")'
+)
 
-def normalize_movie_name(name):
-    return re.sub(r"\s*\[.*?\]\s*$", "", name).strip()
+# State -> region -> nation hierarchy (regions.json, or --regions). It
+# decides where build_top_states folds small states and what the
+# topRegions lists and market "regions" entries roll up to.
+REGIONS = RegionMap.load()
 
 
-def save_database(years):
+def save_database(years, compress=(), dbs=None):
 
-    movie_dates = {}
+    # Years built in this run are read from memory; the rest from disk.
+    dbs = dbs or {}
+
+    movie_days = {}
 
     for year in years:
 
-        fn = os.path.join(
-            OUTPUT_DIR,
-            f"{year}.json"
-        )
+        if year in dbs:
 
-        if not os.path.exists(fn):
-            continue
+            movies = dbs[year]["movies"]
 
-        with open(fn, "r", encoding="utf8") as f:
-            db = json.load(f)
+        else:
+
+            fn = stored_path(year_path(year))
+
+            if not os.path.exists(fn):
+                continue
 
-        for movie_name, movie in db.get("movies", {}).items():
+            movies = load_document(
+                fn,
+                YEAR_COLLECTIONS
+            ).get("movies", {})
+
+        for movie_name, movie in movies.items():
 
             base_name = normalize_movie_name(movie_name)
 
-            dates = movie_dates.setdefault(base_name, [])
+            days = movie_days.setdefault(base_name, [])
 
-            for d in movie.get("daily", {}):
+            daily = movie.get("daily", {})
 
-                dates.append(
-                    datetime.datetime.strptime(
-                        d,
-                        "%Y%m%d"
-                    ).date()
-                )
+            if isinstance(daily, DaySeries):
+                days.extend(daily.days())
+            else:
+                days.extend(epoch_day(d) for d in daily)
 
     movies = []
 
-    for name, dates in movie_dates.items():
+    for name, days in movie_days.items():
 
-        if not dates:
+        if not days:
             continue
 
-        dates = sorted(set(dates))
+        days = sorted(set(days))
 
         runs = []
 
-        start = dates[0]
-        prev = dates[0]
+        start = days[0]
+        prev = days[0]
 
-        for d in dates[1:]:
+        for d in days[1:]:
 
-            if (d - prev).days > 5:
+            if d - prev > 5:
                 runs.append((start, prev))
                 start = d
 
@@ -102,7 +208,7 @@ def save_database(years):
 
         for start, end in runs:
 
-            length = (end - start).days + 1
+            length = end - start + 1
 
             if length > best_length:
                 best_length = length
@@ -112,8 +218,8 @@ def save_database(years):
 
         movies.append([
             name,
-            int(best_start.strftime("%Y%m%d")),
-            int(best_end.strftime("%Y%m%d"))
+            day_code(best_start),
+            day_code(best_end)
         ])
 
     movies.sort(
@@ -126,34 +232,28 @@ def save_database(years):
         "m": movies
     }
 
-    with open(
+    atomic_write_bytes(
         os.path.join(
             OUTPUT_DIR,
-            "database.json.tmp"
+            "database.json"
         ),
-        "w",
-        encoding="utf8"
-    ) as f:
-
-        json.dump(
-            data,
-            f,
-            ensure_ascii=False,
-            separators=(",", ":")
-        )
-
-        f.flush()
-        os.fsync(f.fileno())
+        dump_json_bytes(data),
+        compress=compress
+    )
 
-    os.replace(
+    # Title autocomplete index over the same rows (see search.py).
+    atomic_write_bytes(
         os.path.join(
             OUTPUT_DIR,
-            "database.json.tmp"
+            "search.json"
         ),
-        os.path.join(
-            OUTPUT_DIR,
-            "database.json"
-        )
+        dump_json_bytes(
+            build_search_index(
+                movies,
+                data["u"]
+            )
+        ),
+        compress=compress
     )
 
     print(
@@ -167,16 +267,18 @@ def today_ist():
 def safe_num(v):
     return v if isinstance(v, (int, float)) else 0
 
-def is_more_than_one_month_old(date_str):
-
-    d = datetime.datetime.strptime(
-        date_str,
-        "%Y-%m-%d"
-    ).date()
+def one_month_cutoff():
 
     return (
-        datetime.datetime.now(IST).date() - d
-    ).days > 31
+        today_ist()
+        - datetime.timedelta(days=31)
+    ).isoformat()
+
+
+def is_more_than_one_month_old(date_str):
+
+    # ISO dates order lexicographically, so no strptime per call.
+    return date_str < one_month_cutoff()
 
 def get_urls(date_str):
     date_code = date_str.replace("-", "")
@@ -198,26 +300,131 @@ def get_urls(date_str):
     return url, fallback
 
 
-async def fetch_json(session, url):
+def parse_payload(text):
+
+    # Detail rows of movies under the threshold are never decoded.
+    return parse_daily_payload(
+        text,
+        MIN_MOVIE_DAY_GROSS,
+        normalize_movie_name
+    )
+
+
+async def fetch_json(session, url, statuses=None, loads=json.loads):
+
+    # `statuses` receives the outcome per URL: the HTTP status, 0 for a
+    # body that is not JSON, -1 for a transport error.
+    status = -1
+
     try:
         async with session.get(url) as r:
+            status = r.status
             if r.status == 200:
-                return await r.json()
-    except:
-        pass
+                text = await r.text()
+                try:
+                    return loads(text)
+                except ValueError:
+                    status = 0
+    except Exception:
+        status = -1
+    finally:
+        if statuses is not None:
+            statuses[url] = status
+
     return None
 
 
-async def fetch_day(session, date_str):
-    url, fallback = get_urls(date_str)
+def note_missing(date_str, statuses):
+
+    # Timeouts and 5xx get a TTL of 0 and are retried on the next run.
+    ttl = negative_ttl(
+        date_str,
+        statuses.values(),
+        today_ist().isoformat(),
+        one_month_cutoff()
+    )
+
+    if ttl:
+        NEGATIVE.add(date_str, ttl)
+
+
+async def fetch_day(session, date_str, hedge=HEDGE):
+
+    if SYNTHETIC is not None:
+        return date_str, parse_payload(
+            synthetic_text(date_str, SYNTHETIC)
+        )
+
+    settled = is_more_than_one_month_old(date_str)
+
+    if ARCHIVE is not None:
+        text = ARCHIVE.get_text(
+            date_str,
+            settled_only=not OFFLINE
+        )
+
+        if text is not None:
+            return date_str, parse_payload(text)
+
+    if OFFLINE or NEGATIVE.is_missing(date_str):
+        return date_str, None
+
+    url, fallback = ROUTES.order(
+        date_str,
+        *get_urls(date_str)
+    )
+
+    statuses = {}
+
+    async def fetch_from(source):
+        raw = []
+
+        def keep_raw(text):
+            raw.append(text)
+            return parse_payload(text)
+
+        started = time.perf_counter()
+
+        data = await fetch_json(
+            session,
+            source,
+            statuses,
+            keep_raw
+        )
+
+        ROUTES.record(
+            source,
+            bool(data),
+            time.perf_counter() - started
+        )
+
+        if data and fallback != url:
+            ROUTES.remember(date_str, source)
+
+        if data and ARCHIVE is not None:
+            ARCHIVE.put_text(
+                date_str,
+                raw[-1],
+                settled
+            )
+
+        return data
+
+    if hedge and fallback != url:
+        data = await hedged(
+            lambda: fetch_from(url),
+            lambda: fetch_from(fallback),
+            PRIMARY_LATENCY
+        )
 
-    data = await fetch_json(session, url)
+    else:
+        data = await fetch_from(url)
 
-    if data:
-        return date_str, data
+        if not data and fallback != url:
+            data = await fetch_from(fallback)
 
-    if fallback != url:
-        data = await fetch_json(session, fallback)
+    if not data:
+        note_missing(date_str, statuses)
 
     return date_str, data
 
@@ -228,27 +435,30 @@ def empty_db(year):
         "last_updated": "",
         "_meta": {"lastProcessedDate": None},
         "movieSummary": {},
-        "movies": {}
+        "movies": {},
+        "markets": DaySeries(),
+        "citywise": {}
     }
 
 
 def load_year(year):
-    fn = os.path.join(
-        OUTPUT_DIR,
-        f"{year}.json"
-    )
+    fn = stored_path(year_path(year))
 
     if not os.path.exists(fn):
         return empty_db(year)
 
-    with open(fn, "r", encoding="utf8") as f:
-        db = json.load(f)
+    db = load_document(
+        fn,
+        YEAR_COLLECTIONS
+    )
 
     db.setdefault("_meta", {"lastProcessedDate": None})
     db.setdefault("movieSummary", {})
+    db["markets"] = load_markets(year)
+    db["citywise"] = load_cities(year) if CITIES else {}
 
     for m in db.get("movies", {}).values():
-        m.setdefault("daily", {})
+        m["daily"] = DaySeries.from_dict(m.get("daily"))
         m.setdefault("totals", {})
         m.setdefault("cities", {})
         m.setdefault("states", {})
@@ -257,234 +467,768 @@ def load_year(year):
     return db
 
 
-def atomic_save(year, db):
-    final_file = os.path.join(
-        OUTPUT_DIR,
-        f"{year}.json"
+def peek_header(year, pattern):
+
+    try:
+        with open(stored_path(year_path(year)), "r", encoding="utf8") as f:
+            head = f.read(4096)
+    except OSError:
+        return None
+
+    m = pattern.search(head)
+
+    return m.group(1) if m else None
+
+
+def peek_last_processed(year):
+    return peek_header(
+        year,
+        LPD_HEADER_RE
     )
 
 
-    tmp_file = os.path.join(
+def year_path(year):
+    return os.path.join(
         OUTPUT_DIR,
-        f"{year}.json.tmp"
+        f"{year}{YEAR_EXT}"
     )
 
-    with open(tmp_file, "w", encoding="utf8") as f:
-        json.dump(
-            db,
-            f,
-            ensure_ascii=False,
-            separators=(",", ":")
+
+def convert_year_files(years, compress=()):
+
+    # Settled years are not rewritten by a run, so after a layout switch
+    # they are converted here, as they are.
+    for year in years:
+
+        path = year_path(year)
+        src = swap_layout(path)
+
+        if os.path.exists(path) or not os.path.exists(src):
+            continue
+
+        convert_layout(
+            src,
+            path,
+            YEAR_COLLECTIONS,
+            compress
         )
 
-        f.flush()
-        os.fsync(f.fileno())
+        if MANIFEST is not None:
+            MANIFEST.record_file(
+                year,
+                peek_last_processed(year),
+                path
+            )
 
-    os.replace(tmp_file, final_file)
+        print(f"{year}: converted to {YEAR_EXT}")
 
+    if MANIFEST is not None:
+        MANIFEST.save()
 
-def ensure_movie(db, name):
 
-    movies = db["movies"]
+def markets_path(year):
+    return os.path.join(
+        OUTPUT_DIR,
+        "markets",
+        f"{year}.json"
+    )
 
-    if name not in movies:
-        movies[name] = {
-            "daily": {},
-            "totals": {},
-            "cities": {},
-            "states": {},
-            "chains": {},
-            "topCities": [],
-            "topStates": [],
-            "topChains": []
-        }
 
-    return movies[name]
+def load_markets(year):
 
+    # Days already in the markets file; their state totals cannot be
+    # recomputed from the year file, which keeps no per-day state rows.
+    fn = markets_path(year)
 
-def add_stat(container, key, row):
-    if not key:
-        return
+    if not os.path.exists(fn):
+        return DaySeries()
 
-    x = container.setdefault(key, {
-        "gross": 0,
-        "sold": 0,
-        "shows": 0,
-        "occSum": 0.0,
-        "days": 0
-    })
+    try:
+        with open(fn, "r", encoding="utf8") as f:
+            return DaySeries.from_dict(json.load(f).get("days"))
+    except (OSError, ValueError):
+        return DaySeries()
 
-    x["gross"] += int(safe_num(row.get("gross")))
-    x["sold"] += int(safe_num(row.get("sold")))
-    x["shows"] += int(safe_num(row.get("shows")))
 
-    x["occSum"] = round(
-        x["occSum"] + safe_num(row.get("occupancy")),
-        2
+def city_dir(year):
+    return os.path.join(
+        OUTPUT_DIR,
+        "cities",
+        str(year)
     )
 
-    x["days"] += 1
 
+def empty_city_shard(state):
 
-def build_top(container, limit=5):
+    # Cities and movies are coded as their position in the shard's name
+    # lists; each (city, movie) pair holds a DaySeries of
+    # [gross, sold, shows, occupancy].
+    return {
+        "state": state,
+        "cities": {},
+        "movies": {},
+        "series": {}
+    }
 
-    arr = []
 
-    for k, v in container.items():
+def name_code(codes, name):
 
-        avg = round(
-            v["occSum"] / v["days"],
-            2
-        ) if v["days"] else 0
+    code = codes.get(name)
 
-        arr.append([
-            k,
-            int(v["gross"]),
-            int(v["sold"]),
-            int(v["shows"]),
-            avg
-        ])
+    if code is None:
+        code = codes[name] = len(codes)
 
-    arr.sort(
-        key=lambda x: x[1],
-        reverse=True
+    return code
+
+
+def add_city_day(shard, city, movie_name, day, value):
+
+    series = shard["series"].setdefault(
+        (
+            name_code(shard["cities"], city),
+            name_code(shard["movies"], movie_name)
+        ),
+        DaySeries()
     )
 
-    return arr[:limit]
+    prev = series.get(day)
 
+    if prev is None:
+        series.set(day, value)
+        return
 
-def build_top_states(state_map):
+    # Several rows for one city on one day: add them up, occupancy
+    # weighted by shows.
+    shows = prev[2] + value[2]
 
-    ranked = sorted(
-        state_map.items(),
-        key=lambda x: x[1]["gross"],
-        reverse=True
-    )
+    series.set(day, [
+        prev[0] + value[0],
+        prev[1] + value[1],
+        shows,
+        round((prev[3] * prev[2] + value[3] * value[2]) / shows, 2)
+        if shows else round((prev[3] + value[3]) / 2, 2)
+    ])
 
-    top8 = ranked[:8]
 
-    rs = {
-        "gross": 0,
-        "sold": 0,
-        "shows": 0,
-        "occSum": 0,
-        "days": 0
-    }
+def merge_city_day(citywise, day_citywise, day):
 
-    rn = {
-        "gross": 0,
-        "sold": 0,
-        "shows": 0,
-        "occSum": 0,
-        "days": 0
-    }
+    # Fold one day's shards (from a DB that held only that day) into the
+    # year's; codes are re-assigned by name.
+    for state, day_shard in day_citywise.items():
 
-    result = []
+        shard = citywise.setdefault(state, empty_city_shard(state))
 
-    for state, stats in top8:
+        cities = list(day_shard["cities"])
+        movies = list(day_shard["movies"])
 
-        avg = round(
-            stats["occSum"] / stats["days"],
-            2
-        ) if stats["days"] else 0
+        for (c, m), series in day_shard["series"].items():
 
-        result.append([
-            state,
-            int(stats["gross"]),
-            int(stats["sold"]),
-            int(stats["shows"]),
-            avg
-        ])
+            value = series.get(day)
 
-    for state, stats in ranked[8:]:
+            if value is not None:
+                add_city_day(
+                    shard,
+                    cities[c],
+                    movies[m],
+                    day,
+                    value
+                )
 
-        target = rs if state in SOUTH else rn
 
-        target["gross"] += stats["gross"]
-        target["sold"] += stats["sold"]
-        target["shows"] += stats["shows"]
-        target["occSum"] += stats["occSum"]
-        target["days"] += stats["days"]
+def load_cities(year):
 
-    if rs["gross"]:
+    fn = os.path.join(
+        city_dir(year),
+        "index.json"
+    )
 
-        result.append([
-            "RS",
-            int(rs["gross"]),
-            int(rs["sold"]),
-            int(rs["shows"]),
-            round(rs["occSum"] / rs["days"], 2)
-            if rs["days"] else 0
-        ])
+    if not os.path.exists(fn):
+        return {}
 
-    if rn["gross"]:
+    citywise = {}
 
-        result.append([
-            "RN",
-            int(rn["gross"]),
-            int(rn["sold"]),
-            int(rn["shows"]),
-            round(rn["occSum"] / rn["days"], 2)
-            if rn["days"] else 0
-        ])
+    try:
+        with open(fn, "r", encoding="utf8") as f:
+            index = json.load(f).get("states", {})
 
-    return result
+        for state, entry in index.items():
 
-def rebuild_totals(movie):
-    gross = sold = shows = 0
-    occ = days = 0
+            with open(os.path.join(city_dir(year), entry["f"]), "r", encoding="utf8") as f:
+                data = json.load(f)
 
-    for d in movie["daily"].values():
-        gross += d[0]
-        sold += d[1]
-        shows += d[2]
-        occ += d[3]
-        days += 1
+            shard = empty_city_shard(state)
 
-    movie["totals"] = {
-        "gross": int(gross),
-        "sold": int(sold),
-        "shows": int(shows),
-        "avgOcc": round(occ / days, 2) if days else 0
-    }
+            for name in data.get("cities", []):
+                name_code(shard["cities"], name)
 
-def build_top_chains(
-    chain_map,
-    limit=5
-):
+            for name in data.get("movies", []):
+                name_code(shard["movies"], name)
 
-    result = []
+            for c, m, daily in data.get("series", []):
+                shard["series"][(c, m)] = DaySeries.from_dict(daily)
 
-    used = set()
+            citywise[state] = shard
 
-    for chain in PREFERRED_CHAINS:
+    except (OSError, ValueError, KeyError):
+        return {}
 
-        if chain not in chain_map:
-            continue
+    return citywise
 
-        stats = chain_map[chain]
 
-        avg = round(
-            stats["occSum"] / stats["days"],
-            2
-        ) if stats["days"] else 0
+def build_city_shards(year, db, citywise):
 
-        result.append([
-            chain,
-            int(stats["gross"]),
-            int(stats["sold"]),
-            int(stats["shows"]),
-            avg
-        ])
+    writes = []
+    index = {}
+    used = set()
 
-        used.add(chain)
+    for state in sorted(citywise):
 
-    remaining = []
+        shard = citywise[state]
 
-    for chain, stats in chain_map.items():
+        fn = f"{slugify_filename(state)}.json"
 
-        if chain in used:
-            continue
+        if fn in used:
+            digest = hashlib.sha1(
+                state.encode("utf8")
+            ).hexdigest()[:8]
+            fn = f"{fn[:-5]}-{digest}.json"
+
+        used.add(fn)
+
+        index[state] = {
+            "f": fn,
+            "cities": len(shard["cities"]),
+            "movies": len(shard["movies"])
+        }
+
+        writes.append((
+            os.path.join(city_dir(year), fn),
+            {
+                "year": year,
+                "state": state,
+                "last_updated": db["last_updated"],
+                "cities": list(shard["cities"]),
+                "movies": list(shard["movies"]),
+                "series": [
+                    [c, m, series]
+                    for (c, m), series in sorted(shard["series"].items())
+                ]
+            }
+        ))
+
+    writes.append((
+        os.path.join(
+            city_dir(year),
+            "index.json"
+        ),
+        {
+            "year": year,
+            "last_updated": db["last_updated"],
+            "states": index
+        }
+    ))
+
+    return writes
+
+
+def atomic_save(year, db, compress=()):
+    atomic_write_bytes(
+        year_path(year),
+        dump_json_bytes(db),
+        compress=compress
+    )
+
+
+def shard_dir(year):
+    return os.path.join(
+        OUTPUT_DIR,
+        "movies",
+        str(year)
+    )
+
+
+def load_shard_index(year):
+    fn = os.path.join(
+        shard_dir(year),
+        "index.json"
+    )
+
+    if not os.path.exists(fn):
+        return {}
+
+    try:
+        with open(fn, "r", encoding="utf8") as f:
+            return json.load(f).get("movies", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def build_shards(year, db, compress=()):
+
+    # One shard per base title: every bracketed variant plus its
+    # movieSummary entry. The shard carries no run timestamp so that a
+    # movie whose numbers did not change serializes to identical bytes.
+    groups = {}
+
+    for movie_name in sorted(db["movies"]):
+        groups.setdefault(
+            normalize_movie_name(movie_name),
+            {}
+        )[movie_name] = db["movies"][movie_name]
+
+    old_index = load_shard_index(year)
+
+    index = {}
+    writes = []
+    used = set()
+
+    for base_name, variants in sorted(groups.items()):
+
+        prev = old_index.get(base_name) or {}
+
+        fn = prev.get("f")
+
+        if not fn or fn in used:
+            fn = f"{slugify_filename(base_name)}.json"
+
+        if fn in used:
+            digest = hashlib.sha1(
+                base_name.encode("utf8")
+            ).hexdigest()[:8]
+            fn = f"{fn[:-5]}-{digest}.json"
+
+        used.add(fn)
+
+        data = dump_json_bytes({
+            "year": year,
+            "name": base_name,
+            "summary": db["movieSummary"].get(base_name, {}),
+            "variants": variants
+        })
+
+        h = content_digest(data)[:16]
+
+        firsts = [
+            movie["daily"].first()
+            for movie in variants.values()
+            if movie["daily"]
+        ]
+
+        lasts = [
+            movie["daily"].last()
+            for movie in variants.values()
+            if movie["daily"]
+        ]
+
+        index[base_name] = {
+            "f": fn,
+            "h": h,
+            "g": sum(
+                movie["totals"].get("gross", 0)
+                for movie in variants.values()
+            ),
+            "s": day_code(min(firsts)) if firsts else None,
+            "e": day_code(max(lasts)) if lasts else None
+        }
+
+        path = os.path.join(
+            shard_dir(year),
+            fn
+        )
+
+        if (
+            prev.get("f") == fn
+            and prev.get("h") == h
+            and os.path.exists(path)
+            and all(
+                os.path.exists(f"{path}.{fmt}")
+                for fmt in compress
+            )
+        ):
+            continue
+
+        writes.append((path, data))
+
+    stale = [
+        os.path.join(shard_dir(year), entry["f"])
+        for base_name, entry in old_index.items()
+        if entry.get("f") and entry["f"] not in used
+    ]
+
+    writes.append((
+        os.path.join(
+            shard_dir(year),
+            "index.json"
+        ),
+        {
+            "year": year,
+            "last_updated": db["last_updated"],
+            "movies": index
+        }
+    ))
+
+    return writes, stale
+
+
+async def save_years(dbs, compress=(), shards=False):
+
+    # All years are serialized, written and fsynced in a worker pool, and
+    # renamed into place together once all of them are on disk.
+    items = []
+
+    for year, db in dbs.items():
+        markets = db.pop("markets", None)
+
+        if markets is not None:
+            items.append((
+                markets_path(year),
+                markets
+            ))
+
+        citywise = db.pop("citywise", None)
+
+        if CITIES and citywise is not None:
+            items.extend(
+                build_city_shards(year, db, citywise)
+            )
+
+    # Year files are serialized up front so the manifest can record
+    # their hashes.
+    year_datas = await asyncio.gather(
+        *(
+            run_blocking(
+                dump_document_bytes,
+                db,
+                year_path(year),
+                YEAR_COLLECTIONS
+            )
+            for year, db in dbs.items()
+        )
+    )
+
+    items[:0] = [
+        (year_path(year), data)
+        for year, data in zip(dbs, year_datas)
+    ]
+
+    for (year, db), data in zip(dbs.items(), year_datas):
+
+        if MANIFEST is not None:
+            MANIFEST.record(
+                year,
+                db["_meta"]["lastProcessedDate"],
+                data
+            )
+
+    stale = []
+    shard_writes = 0
+
+    if shards:
+        for year, db in dbs.items():
+            writes, removed = build_shards(year, db, compress)
+            items.extend(writes)
+            stale.extend(removed)
+            shard_writes += len(writes) - 1
+
+    await write_json_batch(
+        items,
+        compress=compress
+    )
+
+    if MANIFEST is not None:
+        MANIFEST.save()
+
+    # The same year in the other layout, from runs before a switch.
+    for year in dbs:
+        remove_output(swap_layout(year_path(year)))
+
+    for path in stale:
+        for target in [path] + [f"{path}.{fmt}" for fmt in compress]:
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+
+    for year in dbs:
+        print(f"{year}: saved")
+
+    if shards:
+        print(
+            f"shards: wrote {shard_writes} movies, "
+            f"removed {len(stale)} stale"
+        )
+
+
+def ensure_movie(db, name):
+
+    movies = db["movies"]
+
+    if name not in movies:
+        movies[name] = {
+            "daily": DaySeries(),
+            "totals": {},
+            "cities": {},
+            "states": {},
+            "chains": {},
+            "topCities": [],
+            "topStates": [],
+            "topRegions": [],
+            "topChains": []
+        }
+
+    return movies[name]
+
+
+def ensure_summary(db, base_name):
+
+    # Base-title rollups behind movieSummary, updated alongside each
+    # variant's own; finalize() turns them into top lists.
+    summaries = db.setdefault("summaryStats", {})
+
+    if base_name not in summaries:
+        summaries[base_name] = {
+            "cities": {},
+            "states": {},
+            "chains": {}
+        }
+
+    return summaries[base_name]
+
+
+def merge_stat(container, key, stats):
+
+    x = container.setdefault(key, {
+        "gross": 0,
+        "sold": 0,
+        "shows": 0,
+        "occSum": 0,
+        "days": 0
+    })
+
+    x["gross"] += stats["gross"]
+    x["sold"] += stats["sold"]
+    x["shows"] += stats["shows"]
+    x["occSum"] += stats["occSum"]
+    x["days"] += stats["days"]
+
+
+def add_stat(container, key, row):
+    if not key:
+        return
+
+    x = container.setdefault(key, {
+        "gross": 0,
+        "sold": 0,
+        "shows": 0,
+        "occSum": 0.0,
+        "days": 0
+    })
+
+    x["gross"] += int(safe_num(row.get("gross")))
+    x["sold"] += int(safe_num(row.get("sold")))
+    x["shows"] += int(safe_num(row.get("shows")))
+
+    x["occSum"] = round(
+        x["occSum"] + safe_num(row.get("occupancy")),
+        2
+    )
+
+    x["days"] += 1
+
+
+def summary_stat(summary, key):
+
+    # Counts are summed as rows arrive. occSum is not: it is the sum of
+    # the variants' own (per-row rounded) occSums, added up in movie order
+    # by settle_summary(), so "parts" keeps each variant's entry.
+    return summary.setdefault(key, {
+        "gross": 0,
+        "sold": 0,
+        "shows": 0,
+        "occSum": 0,
+        "days": 0,
+        "parts": {}
+    })
+
+
+def add_variant_stat(variant, summary, movie_name, key, row):
+
+    if not key:
+        return
+
+    add_stat(variant, key, row)
+
+    x = summary_stat(summary, key)
+
+    x["gross"] += int(safe_num(row.get("gross")))
+    x["sold"] += int(safe_num(row.get("sold")))
+    x["shows"] += int(safe_num(row.get("shows")))
+    x["days"] += 1
+    x["parts"][movie_name] = variant[key]
+
+
+def settle_summary(summary, order):
+
+    for container in summary.values():
+
+        for x in container.values():
+
+            parts = x.pop("parts", None)
+
+            if not parts:
+                continue
+
+            occ = 0
+
+            for name in sorted(parts, key=order.__getitem__):
+                occ += parts[name]["occSum"]
+
+            x["occSum"] = occ
+
+
+def build_top(container, limit=5):
+
+    arr = []
+
+    for k, v in container.items():
+
+        avg = round(
+            v["occSum"] / v["days"],
+            2
+        ) if v["days"] else 0
+
+        arr.append([
+            k,
+            int(v["gross"]),
+            int(v["sold"]),
+            int(v["shows"]),
+            avg
+        ])
+
+    arr.sort(
+        key=lambda x: x[1],
+        reverse=True
+    )
+
+    return arr[:limit]
+
+
+def build_top_states(state_map):
+
+    ranked = sorted(
+        state_map.items(),
+        key=lambda x: x[1]["gross"],
+        reverse=True
+    )
+
+    top8 = ranked[:8]
+
+    result = []
+
+    for state, stats in top8:
+
+        avg = round(
+            stats["occSum"] / stats["days"],
+            2
+        ) if stats["days"] else 0
+
+        result.append([
+            state,
+            int(stats["gross"]),
+            int(stats["sold"]),
+            int(stats["shows"]),
+            avg
+        ])
+
+    # The rest are folded into one row per region, labelled with the
+    # region's "rest" code (RS, RN) in regions.json order.
+    rest = REGIONS.rollup(
+        dict(ranked[8:]),
+        merge_stat
+    )
+
+    for region, stats in rest.items():
+
+        if not stats["gross"]:
+            continue
+
+        result.append([
+            REGIONS.rest[region],
+            int(stats["gross"]),
+            int(stats["sold"]),
+            int(stats["shows"]),
+            round(stats["occSum"] / stats["days"], 2)
+            if stats["days"] else 0
+        ])
+
+    return result
+
+
+def build_top_regions(state_map):
+
+    return build_top(
+        REGIONS.rollup(
+            state_map,
+            merge_stat
+        ),
+        len(REGIONS.names)
+    )
+
+def rebuild_totals(movie):
+    gross = sold = shows = 0
+    occ = days = 0
+
+    for d in movie["daily"].values():
+        gross += d[0]
+        sold += d[1]
+        shows += d[2]
+        occ += d[3]
+        days += 1
+
+    movie["totals"] = {
+        "gross": int(gross),
+        "sold": int(sold),
+        "shows": int(shows),
+        "avgOcc": round(occ / days, 2) if days else 0
+    }
+
+def build_top_chains(
+    chain_map,
+    limit=5
+):
+
+    result = []
+
+    used = set()
+
+    for chain in PREFERRED_CHAINS:
+
+        if chain not in chain_map:
+            continue
+
+        stats = chain_map[chain]
+
+        avg = round(
+            stats["occSum"] / stats["days"],
+            2
+        ) if stats["days"] else 0
+
+        result.append([
+            chain,
+            int(stats["gross"]),
+            int(stats["sold"]),
+            int(stats["shows"]),
+            avg
+        ])
+
+        used.add(chain)
+
+    remaining = []
+
+    for chain, stats in chain_map.items():
+
+        if chain in used:
+            continue
 
         avg = round(
             stats["occSum"] / stats["days"],
@@ -504,73 +1248,286 @@ def build_top_chains(
         reverse=True
     )
 
-    
-    result.extend(
-        remaining[
-            :max(
-                0,
-                limit - len(result)
-            )
-        ]
-    )
+    
+    result.extend(
+        remaining[
+            :max(
+                0,
+                limit - len(result)
+            )
+        ]
+    )
+
+    return result
+
+def process_day(db, date_str, payload):
+    if not payload or "movies" not in payload:
+        return
+
+    db["last_updated"] = payload.get("last_updated", "")
+
+    day = epoch_day(date_str)
+
+    base_gross = {}
+
+    for movie_name, data in payload["movies"].items():
+
+        base_name = normalize_movie_name(movie_name)
+
+        base_gross[base_name] = (
+            base_gross.get(base_name, 0)
+            + safe_num(data.get("gross"))
+        )
+
+    # Market totals and the leaderboard cover the movies this file
+    # tracks, i.e. those whose base title clears MIN_MOVIE_DAY_GROSS.
+    board = []
+    total = empty_market()
+    states = {}
+
+    for movie_name, data in payload["movies"].items():
+
+        base_name = normalize_movie_name(movie_name)
+
+        if base_gross[base_name] < MIN_MOVIE_DAY_GROSS:
+            continue
+
+        movie = ensure_movie(db, movie_name)
+
+        summary = ensure_summary(db, base_name)
+
+        value = [
+            int(safe_num(data.get("gross"))),
+            int(safe_num(data.get("sold"))),
+            int(safe_num(data.get("shows"))),
+            round(safe_num(data.get("occupancy")), 2)
+        ]
+
+        movie["daily"].set(day, value)
+
+        board.append([movie_name] + value)
+
+        add_market(total, *value)
+
+        for row in (data.get("details") or []):
+            city = row.get("city")
+            state = row.get("state")
+
+            if city:
+                add_variant_stat(
+                    movie["cities"],
+                    summary["cities"],
+                    movie_name,
+                    city,
+                    row
+                )
+
+            if state:
+                add_variant_stat(
+                    movie["states"],
+                    summary["states"],
+                    movie_name,
+                    state,
+                    row
+                )
+
+                if CITIES and city:
+                    add_city_day(
+                        db["citywise"].setdefault(state, empty_city_shard(state)),
+                        city,
+                        movie_name,
+                        day,
+                        [
+                            int(safe_num(row.get("gross"))),
+                            int(safe_num(row.get("sold"))),
+                            int(safe_num(row.get("shows"))),
+                            round(safe_num(row.get("occupancy")), 2)
+                        ]
+                    )
+
+                add_market(
+                    states.setdefault(state, empty_market()),
+                    safe_num(row.get("gross")),
+                    safe_num(row.get("sold")),
+                    safe_num(row.get("shows")),
+                    safe_num(row.get("occupancy"))
+                )
+
+        for row in (data.get("Chain_details") or []):
+            chain = row.get("chain")
+
+            if chain:
+                add_variant_stat(
+                    movie["chains"],
+                    summary["chains"],
+                    movie_name,
+                    chain,
+                    row
+                )
+
+    if board:
+        db["markets"].set(
+            day,
+            market_entry(total, states, board)
+        )
+
+
+def empty_market():
+    # gross, sold, shows, occupancy sum, entries
+    return [0, 0, 0, 0.0, 0]
+
+
+def add_market(acc, gross, sold, shows, occ):
+    acc[0] += gross
+    acc[1] += sold
+    acc[2] += shows
+    acc[3] += occ
+    acc[4] += 1
+
+
+def market_total(acc):
+    return [
+        int(acc[0]),
+        int(acc[1]),
+        int(acc[2]),
+        round(acc[3] / acc[4], 2) if acc[4] else 0
+    ]
+
+
+def market_entry(total, states, board):
+
+    board.sort(
+        key=lambda x: x[1],
+        reverse=True
+    )
+
+    return {
+        "t": market_total(total),
+        "states": {
+            state: market_total(acc)
+            for state, acc in sorted(
+                states.items(),
+                key=lambda x: x[1][0],
+                reverse=True
+            )
+        },
+        "top": board[:LEADERBOARD_SIZE]
+    }
+
+
+def add_region_market(regions, region, value):
+    add_market(
+        regions.setdefault(region, empty_market()),
+        *value
+    )
+
+
+def region_markets(states):
+
+    # From the entry's state totals, so days read back from an earlier
+    # run get the same rollup; a region's occupancy is its states' mean.
+    regions = REGIONS.rollup(
+        states,
+        add_region_market
+    )
+
+    return {
+        region: market_total(acc)
+        for region, acc in sorted(
+            regions.items(),
+            key=lambda x: x[1][0],
+            reverse=True
+        )
+    }
+
+
+def week_start(day):
+    # Epoch day 0 was a Thursday; weeks run Monday to Sunday.
+    return day - (day + 3) % 7
+
+
+def build_markets(db):
+
+    # Weekly entries are folded from the daily ones; a week's leaderboard
+    # ranks each movie's gross summed over the days of that week.
+    markets = db.get("markets") or DaySeries()
+
+    weeks = {}
 
-    return result
+    for day, entry in markets.items():
 
-def process_day(db, date_str, payload):
-    if not payload or "movies" not in payload:
-        return
+        week = weeks.setdefault(week_start(day), {
+            "days": 0,
+            "total": empty_market(),
+            "states": {},
+            "movies": {}
+        })
 
-    db["last_updated"] = payload.get("last_updated", "")
+        week["days"] += 1
 
-    date_key = date_str.replace("-", "")
+        entry["regions"] = region_markets(entry["states"])
 
-    base_gross = {}
+        add_market(week["total"], *entry["t"])
 
-    for movie_name, data in payload["movies"].items():
+        for state, value in entry["states"].items():
+            add_market(
+                week["states"].setdefault(state, empty_market()),
+                *value
+            )
 
-        base_name = normalize_movie_name(movie_name)
+    for movie_name, movie in db["movies"].items():
 
-        base_gross[base_name] = (
-            base_gross.get(base_name, 0)
-            + safe_num(data.get("gross"))
-        )
+        for day, value in movie["daily"].items():
 
-    for movie_name, data in payload["movies"].items():
+            week = weeks.get(week_start(day))
 
-        base_name = normalize_movie_name(movie_name)
+            if week is not None:
+                add_market(
+                    week["movies"].setdefault(movie_name, empty_market()),
+                    *value
+                )
 
-        if base_gross[base_name] < MIN_MOVIE_DAY_GROSS:
-            continue
+    out = {}
 
-        movie = ensure_movie(db, movie_name)
+    for start in sorted(weeks):
 
-        movie["daily"][date_key] = [
-            int(safe_num(data.get("gross"))),
-            int(safe_num(data.get("sold"))),
-            int(safe_num(data.get("shows"))),
-            round(safe_num(data.get("occupancy")), 2)
-        ]
+        week = weeks[start]
 
-        for row in (data.get("details") or []):
-            city = row.get("city")
-            state = row.get("state")
+        entry = market_entry(
+            week["total"],
+            week["states"],
+            [
+                [movie_name] + market_total(acc)
+                for movie_name, acc in week["movies"].items()
+            ]
+        )
 
-            if city:
-                add_stat(movie["cities"], city, row)
+        entry["regions"] = region_markets(entry["states"])
 
-            if state:
-                add_stat(movie["states"], state, row)
+        entry["days"] = week["days"]
 
-        for row in (data.get("Chain_details") or []):
-            chain = row.get("chain")
+        out[day_key(start)] = entry
 
-            if chain:
-                add_stat(movie["chains"], chain, row)
+    return {
+        "year": db["year"],
+        "last_updated": db["last_updated"],
+        "days": markets,
+        "weeks": out
+    }
 
 
 def finalize(db):
 
-    movie_summary = {}
+    db["markets"] = build_markets(db)
+
+    summaries = db.pop("summaryStats", {})
+
+    order = {
+        name: i
+        for i, name in enumerate(db["movies"])
+    }
+
+    db["movieSummary"] = {}
 
     for movie_name, movie in db["movies"].items():
 
@@ -585,89 +1542,34 @@ def finalize(db):
             movie["states"]
         )
 
+        movie["topRegions"] = build_top_regions(
+            movie["states"]
+        )
+
         movie["topChains"] = build_top_chains(
             movie["chains"]
         )
 
+        movie.pop("cities", None)
+        movie.pop("states", None)
+        movie.pop("chains", None)
+
         base_name = normalize_movie_name(
             movie_name
         )
 
-        summary = movie_summary.setdefault(
-            base_name,
-            {
-                "cities": {},
-                "states": {},
-                "chains": {}
-            }
-        )
-
-        for k,v in movie["cities"].items():
-
-            x = summary["cities"].setdefault(
-                k,
-                {
-                    "gross":0,
-                    "sold":0,
-                    "shows":0,
-                    "occSum":0,
-                    "days":0
-                }
-            )
-
-            x["gross"] += v["gross"]
-            x["sold"] += v["sold"]
-            x["shows"] += v["shows"]
-            x["occSum"] += v["occSum"]
-            x["days"] += v["days"]
-
-        for k,v in movie["states"].items():
-
-            x = summary["states"].setdefault(
-                k,
-                {
-                    "gross":0,
-                    "sold":0,
-                    "shows":0,
-                    "occSum":0,
-                    "days":0
-                }
-            )
-
-            x["gross"] += v["gross"]
-            x["sold"] += v["sold"]
-            x["shows"] += v["shows"]
-            x["occSum"] += v["occSum"]
-            x["days"] += v["days"]
-
-        for k,v in movie["chains"].items():
-
-            x = summary["chains"].setdefault(
-                k,
-                {
-                    "gross":0,
-                    "sold":0,
-                    "shows":0,
-                    "occSum":0,
-                    "days":0
-                }
-            )
-
-            x["gross"] += v["gross"]
-            x["sold"] += v["sold"]
-            x["shows"] += v["shows"]
-            x["occSum"] += v["occSum"]
-            x["days"] += v["days"]
-
-        movie.pop("cities", None)
-        movie.pop("states", None)
-        movie.pop("chains", None)
+        if base_name in db["movieSummary"]:
+            continue
 
-    db["movieSummary"] = {}
+        summary = summaries.get(base_name) or {
+            "cities": {},
+            "states": {},
+            "chains": {}
+        }
 
-    for movie_name, summary in movie_summary.items():
+        settle_summary(summary, order)
 
-        db["movieSummary"][movie_name] = {
+        db["movieSummary"][base_name] = {
 
             "topCities":
                 build_top(
@@ -680,6 +1582,11 @@ def finalize(db):
                     summary["states"]
                 ),
 
+            "topRegions":
+                build_top_regions(
+                    summary["states"]
+                ),
+
             "topChains":
                 build_top_chains(
                     summary["chains"],
@@ -688,54 +1595,93 @@ def finalize(db):
 
         }
 
-async def update_year(session, year):
-    db = load_year(year)
+def plan_year(year):
 
-    meta = db["_meta"]
     today = today_ist()
 
-    # Rebuild current year from scratch every run
-    if year == today.year:
+    end = (
+        today
+        if year == today.year
+        else datetime.date(year, 12, 31)
+    )
+
+    # Past years that are complete are settled from the manifest, else
+    # from the file header (or the store) alone.
+    if year != today.year:
 
-        db["movies"] = {}
-        db["movieSummary"] = {}
-        meta["lastProcessedDate"] = None
+        if STORE is None and MANIFEST is not None and MANIFEST.is_closed(year, year_path(year)):
+            return None, []
 
-    # Current year: rebuild from Jan 1 every run
-    if year == today.year:
+        lpd = (
+            STORE.last_processed("movies", year)
+            if STORE is not None
+            else peek_last_processed(year)
+        )
 
-        db["movies"] = {}
-        db["movieSummary"] = {}
-        meta["lastProcessedDate"] = None
+        if lpd and lpd >= end.isoformat():
 
-        start = datetime.date(
+            if STORE is None and MANIFEST is not None:
+                MANIFEST.record_file(
+                    year,
+                    lpd,
+                    year_path(year)
+                )
+
+            return None, []
+
+    if STORE is not None:
+
+        # Rows live in the store; the year file is exported from it once
+        # the new days are ingested.
+        db = None
+
+        if year == today.year:
+            STORE.reset_year(
+                "movies",
+                year,
+                epoch_day(f"{year}-01-01"),
+                epoch_day(f"{year}-12-31")
+            )
+
+        last = STORE.last_processed("movies", year)
+
+    elif year == today.year:
+
+        # Current year: rebuild from Jan 1 every run. Nothing in the old
+        # file survives but its last_updated (kept in case no day comes
+        # through), so only its header is read.
+        db = empty_db(year)
+
+        last_updated = peek_header(
             year,
-            1,
-            1
+            LAST_UPDATED_HEADER_RE
         )
 
+        if last_updated:
+            db["last_updated"] = json.loads(last_updated)
+
+        last = None
+
     else:
 
-        if meta["lastProcessedDate"]:
-            start = (
-                datetime.datetime.strptime(
-                    meta["lastProcessedDate"],
-                    "%Y-%m-%d"
-                ).date()
-                + datetime.timedelta(days=1)
-            )
-        else:
-            start = datetime.date(
-                year,
-                1,
-                1
-            )
+        db = load_year(year)
 
-    end = (
-        today
-        if year == today.year
-        else datetime.date(year, 12, 31)
-    )
+        last = db["_meta"]["lastProcessedDate"]
+
+    if last:
+        start = (
+            datetime.datetime.strptime(
+                last,
+                "%Y-%m-%d"
+            ).date()
+            + datetime.timedelta(days=1)
+        )
+    else:
+        start = datetime.date(
+            year,
+            1,
+            1
+        )
 
     dates = []
 
@@ -747,9 +1693,16 @@ async def update_year(session, year):
         )
         d += datetime.timedelta(days=1)
 
+    return db, dates
+
+
+async def fetch_year(session, year, hedge=HEDGE):
+
+    db, dates = plan_year(year)
+
     if not dates:
         print(f"{year}: already up to date")
-        return
+        return None
 
     print(
         f"{year}: fetching {len(dates)} days"
@@ -763,7 +1716,8 @@ async def update_year(session, year):
         async with sem:
             return await fetch_day(
                 session,
-                ds
+                ds,
+                hedge
             )
 
     results = await asyncio.gather(
@@ -771,6 +1725,18 @@ async def update_year(session, year):
         return_exceptions=True
     )
 
+    return db, dates, results
+
+
+def aggregate_year(db, dates, results):
+
+    if STORE is not None:
+        return aggregate_year_into_store(
+            int(dates[0][:4]),
+            dates,
+            results
+        )
+
     for result in results:
 
         if isinstance(result, Exception):
@@ -785,43 +1751,380 @@ async def update_year(session, year):
                 payload
             )
 
-    meta["lastProcessedDate"] = (
-        end.strftime("%Y-%m-%d")
-    )
+    db["_meta"]["lastProcessedDate"] = dates[-1]
+
+    return db
+
+
+def aggregate_year_into_store(year, dates, results):
+
+    # Each day is processed into an empty DB and that DB's rows are
+    # what the store takes in; days it already has are skipped. Market
+    # entries and city series are kept in their own files, not the store.
+    fresh = year == today_ist().year
+
+    markets = DaySeries() if fresh else load_markets(year)
+
+    citywise = {} if fresh or not CITIES else load_cities(year)
+
+    for result in results:
+
+        if isinstance(result, Exception):
+            continue
+
+        date_str, payload = result
+
+        if not payload:
+            continue
+
+        day_db = empty_db(year)
+
+        process_day(
+            day_db,
+            date_str,
+            payload
+        )
+
+        day = epoch_day(date_str)
+
+        STORE.ingest_movie_day(
+            year,
+            day,
+            day_db
+        )
+
+        entry = day_db["markets"].get(day)
+
+        if entry is not None:
+            markets.set(day, entry)
 
-    finalize(db)
+        merge_city_day(
+            citywise,
+            day_db["citywise"],
+            day
+        )
 
-    atomic_save(
+    STORE.set_last_processed(
+        "movies",
         year,
-        db
+        dates[-1]
+    )
+
+    STORE.commit()
+
+    db = export_year(year)
+
+    db["markets"] = markets
+    db["citywise"] = citywise
+
+    return db
+
+
+def export_year(year):
+
+    db = empty_db(year)
+
+    db["last_updated"] = STORE.last_updated("movies", year)
+    db["_meta"]["lastProcessedDate"] = STORE.last_processed("movies", year)
+
+    for name in STORE.movie_names(year):
+        ensure_movie(db, name)
+
+    for name, day, value in STORE.movie_daily(year):
+        db["movies"][name]["daily"].set(day, value)
+
+    for name, kind, key, stats in STORE.movie_rollups(year):
+        db["movies"][name][kind][key] = stats
+
+        x = summary_stat(
+            ensure_summary(db, normalize_movie_name(name))[kind],
+            key
+        )
+
+        x["gross"] += stats["gross"]
+        x["sold"] += stats["sold"]
+        x["shows"] += stats["shows"]
+        x["days"] += stats["days"]
+        x["parts"][name] = stats
+
+    return db
+
+
+def parse_args():
+
+    parser = argparse.ArgumentParser(
+        description="Build yearly movie JSON files from daily summaries."
+    )
+
+    parser.add_argument(
+        "--compress",
+        type=parse_compress_formats,
+        default=(),
+        help="Comma-separated precompressed siblings to write next to each JSON file (gz, br, zst)."
+    )
+
+    parser.add_argument(
+        "--no-hedge",
+        action="store_false",
+        dest="hedge",
+        help="Try the fallback host only after the primary has failed, instead of racing it past the primary's p95 latency."
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Directory for run-to-run caches (host routing table, negative cache of missing dates)."
+    )
+
+    parser.add_argument(
+        "--archive-dir",
+        default=None,
+        help="Packed archive of raw daily payloads: settled days are read from it and fetched days appended."
+    )
+
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Read payloads only from --archive-dir; make no HTTP requests."
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="Where to write the outputs (default: moviedata/, or a new temp directory under --synthetic)."
+    )
+
+    parser.add_argument(
+        "--synthetic",
+        type=SyntheticConfig.parse,
+        default=None,
+        metavar="SPEC",
+        help="Build from generated payloads instead of fetching, e.g. \"movies=1650,cities=60\" (see synthetic.py)."
     )
 
-    print(f"{year}: saved")
+    parser.add_argument(
+        "--memory-report",
+        nargs="?",
+        const="-",
+        default=None,
+        metavar="PATH",
+        help="Trace allocations and print peak memory and top call sites per stage; also write them as JSON to PATH if given."
+    )
+
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        metavar="MB",
+        help="Fail the run once peak RSS exceeds this many MB at a stage boundary."
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profile",
+        default=None,
+        metavar="DIR",
+        help="Profile each stage separately and write pstats, collapsed stacks and slow event loop callbacks to DIR (default: profile/)."
+    )
+
+    parser.add_argument(
+        "--sqlite",
+        default=None,
+        metavar="PATH",
+        help="Ingest days into this SQLite database and export the year files from it."
+    )
+
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="Write year files as <year>.ndjson: a header line, then one line per movie in name order, so a run's git delta covers only the movies that changed."
+    )
+
+    parser.add_argument(
+        "--regions",
+        default=None,
+        metavar="PATH",
+        help="Region hierarchy to roll states up into (default: regions.json)."
+    )
+
+    parser.add_argument(
+        "--cities",
+        action="store_true",
+        help="Also write per-city daily series, one file per state, under moviedata/cities/<year>/."
+    )
+
+    parser.add_argument(
+        "--shards",
+        action="store_true",
+        help="Also write one file per movie per year under moviedata/movies/<year>/ plus an index.json manifest."
+    )
+
+    args = parser.parse_args()
 
-async def main():
+    if args.offline and not args.archive_dir:
+        parser.error("--offline needs --archive-dir")
 
-    timeout = aiohttp.ClientTimeout(total=TIMEOUT)
+    return args
 
-    connector = aiohttp.TCPConnector(
-        limit=CONCURRENCY,
-        ttl_dns_cache=300,
-        enable_cleanup_closed=True
+
+async def main(args):
+
+    global ARCHIVE, OFFLINE, STORE, CITIES, MANIFEST, SYNTHETIC, YEAR_EXT, REGIONS
+    global OUTPUT_DIR
+
+    if args.output_dir:
+        OUTPUT_DIR = args.output_dir
+    elif args.synthetic is not None:
+        OUTPUT_DIR = scratch_output_dir("moviedata")
+
+    os.makedirs(
+        OUTPUT_DIR,
+        exist_ok=True
+    )
+
+    ARCHIVE = (
+        Archive(args.archive_dir)
+        if args.archive_dir
+        else None
+    )
+
+    OFFLINE = args.offline
+
+    SYNTHETIC = args.synthetic
+
+    YEAR_EXT = NDJSON_EXT if args.ndjson else ".json"
+
+    CITIES = args.cities
+
+    if args.regions:
+        REGIONS = RegionMap.load(args.regions)
+
+    MANIFEST = YearManifest(OUTPUT_DIR)
+
+    STORE = (
+        SqlStore(args.sqlite)
+        if args.sqlite
+        else None
     )
 
-    async with aiohttp.ClientSession(
-        timeout=timeout,
-        connector=connector
-    ) as session:
+    ROUTES.load(
+        routing_table_path(args.cache_dir)
+    )
 
-        current_year = today_ist().year
+    NEGATIVE.load(
+        negative_cache_path(args.cache_dir)
+    )
 
-        years = list(range(2023, current_year + 1))
+    report = None
 
-        await asyncio.gather(
-            *(update_year(session, year) for year in years)
+    if args.memory_report is not None or args.memory_budget:
+        report = MemoryReport(
+            budget_mb=args.memory_budget,
+            trace=args.memory_report is not None
         )
-        save_database(years)
+        STAGES.add(report)
+
+    profiler = None
+
+    if args.profile:
+        profiler = StageProfiler(args.profile)
+        profiler.watch_loop(asyncio.get_running_loop())
+        profiler.watch_workers()
+        STAGES.add(profiler)
+
+    current_year = today_ist().year
+
+    years = list(range(2023, current_year + 1))
+
+    # Stages run one after another for all years, so each one's memory
+    # is measured on its own: fetch holds every raw payload, aggregate
+    # folds them into the per-year DBs, then finalize and save.
+    try:
+
+        with STAGES.stage("fetch"):
+
+            async with LazyClientSession(
+                timeout=TIMEOUT,
+                limit=CONCURRENCY
+            ) as session:
+
+                fetched = await asyncio.gather(
+                    *(fetch_year(session, year, args.hedge) for year in years)
+                )
+
+            ROUTES.prune(one_month_cutoff())
+            ROUTES.save()
+            NEGATIVE.save()
+
+            if ARCHIVE is not None:
+                ARCHIVE.close()
+
+        dbs = {}
+
+        with STAGES.stage("aggregate"):
+
+            # Each year's payloads are dropped as soon as they are folded in.
+            for i, year in enumerate(years):
+
+                item = fetched[i]
+                fetched[i] = None
+
+                if item is not None:
+                    dbs[year] = aggregate_year(*item)
+
+                item = None
+
+            if STORE is not None:
+                STORE.close()
+
+        with STAGES.stage("finalize"):
+
+            for db in dbs.values():
+                finalize(db)
+
+        with STAGES.stage("save"):
+
+            await save_years(
+                dbs,
+                compress=args.compress,
+                shards=args.shards
+            )
+
+            await run_blocking(
+                convert_year_files,
+                years,
+                args.compress
+            )
+
+            # database.json and search.json only depend on the year files.
+            derived = [
+                os.path.join(OUTPUT_DIR, fn)
+                for fn in ("database.json", "search.json")
+            ]
+
+            if dbs or not all(
+                os.path.exists(p)
+                for path in derived
+                for p in [path] + [f"{path}.{fmt}" for fmt in args.compress]
+            ):
+                await run_blocking(
+                    save_database,
+                    years,
+                    args.compress,
+                    dbs
+                )
+
+    except MemoryBudgetExceeded as e:
+        raise SystemExit(str(e))
+
+    finally:
+        if report is not None and args.memory_report is not None:
+            report.emit(args.memory_report)
+
+        if profiler is not None:
+            profiler.finish()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))